@@ -1,14 +1,100 @@
 import mysql.connector
+from mysql.connector import pooling
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+import bson
+from bson import json_util
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
 import random
+import datetime
+import decimal
 import getpass
-from difflib import get_close_matches
+import hashlib
+from difflib import get_close_matches, SequenceMatcher
 import re
+import itertools
+import functools
+import heapq
+import math
+import time
+import argparse
+import asyncio
+import atexit
+import contextlib
+import sys
+import json
+import os
+import queue
+import threading
+import weakref
+import urllib.parse
+import concurrent.futures
+from collections import Counter, OrderedDict, deque
 import nltk
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 from nltk.stem import WordNetLemmatizer
 
+# Connection settings for the MySQL pools and the shared MongoDB clients
+CONNECTION_SETTINGS = {
+    "mysql_pool_size": 8,            # the menu holds one connection; parallel work borrows the rest
+    "mysql_pool_timeout": 30,        # seconds to wait for a free pooled connection
+    "mysql_compress": False,         # compress the MySQL wire protocol (helps on slow links)
+    "mysql_connect_timeout": 10,
+    "mongo_max_pool_size": 50,
+    "mongo_compressors": "zlib",     # "zstd" and "snappy" need extra packages
+    "mongo_connect_timeout_ms": 10000,
+    "mongo_server_selection_timeout_ms": 10000,
+    "mongo_socket_timeout_ms": None,
+}
+
+# One MySQL pool per (host, user, password, database) and one MongoClient per connection string
+_mysql_pools = {}
+_mongo_clients = {}
+_connection_lock = threading.Lock()
+# Connections handed out by borrow_mysql_connection. Work running on one of them must not borrow more:
+# every worker waiting for a connection while holding one would exhaust the pool.
+_borrowed_connections = weakref.WeakSet()
+# Every pooled connection handed out, so close_all_connections can close those still in use at exit
+_checked_out_connections = weakref.WeakSet()
+
+def get_mysql_pool(host, user, password, database):
+    """
+    Return the connection pool for the credentials, creating it on first use.
+    """
+    key = (host, user, password, database)
+    with _connection_lock:
+        pool = _mysql_pools.get(key)
+        if pool is None:
+            pool = pooling.MySQLConnectionPool(
+                pool_name=f"chatdb_{len(_mysql_pools) + 1}",
+                pool_size=CONNECTION_SETTINGS["mysql_pool_size"],
+                host=host,
+                user=user,
+                password=password,
+                database=database,
+                compress=CONNECTION_SETTINGS["mysql_compress"],
+                connection_timeout=CONNECTION_SETTINGS["mysql_connect_timeout"]
+            )
+            _mysql_pools[key] = pool
+        return pool
+
+def checkout_mysql_connection(pool):
+    """
+    Take a connection from the pool and remember it until it is garbage collected.
+    """
+    connection = pool.get_connection()
+    _checked_out_connections.add(connection)
+    return connection
+
+def mysql_connection_key(connection):
+    """
+    Key for per-database caches: the pool name for pooled connections, so every connection
+    borrowed from the same pool shares one schema catalog, otherwise the connection itself.
+    """
+    return getattr(connection, "pool_name", None) or connection
+
 # Function to connect to MySQL
 def connect_mysql():
     host = input("Enter MySQL host (default: 'localhost'): ") or "localhost"
@@ -17,42 +103,382 @@ def connect_mysql():
     database = input("Enter MySQL database name: ")
 
     try:
-        connection = mysql.connector.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=database
-        )
+        connection = checkout_mysql_connection(get_mysql_pool(host, user, password, database))
         print("MySQL connection successful!")
         return connection
     except mysql.connector.Error as err:
         print(f"Error: {err}")
         return None
+
+def _pool_for(connection):
+    """
+    Return the pool a connection was borrowed from, or None.
+    """
+    pool_name = getattr(connection, "pool_name", None)
+    return next((pool for pool in _mysql_pools.values() if pool.pool_name == pool_name), None)
+
+def borrow_mysql_connection(connection, database=None):
+    """
+    Borrow a connection from the pool the given connection came from, switched to its current database.
+    Waits for a free connection when the pool is exhausted. Closing the borrowed connection returns it to the pool.
+    Worker threads must pass the database name, read once beforehand, so they never use the given connection itself.
+    """
+    pool = _pool_for(connection)
+    if pool is None:
+        raise ValueError("The connection was not opened through connect_mysql; cannot borrow pooled connections.")
+
+    deadline = time.monotonic() + CONNECTION_SETTINGS["mysql_pool_timeout"]
+    while True:
+        try:
+            borrowed = checkout_mysql_connection(pool)
+            break
+        except mysql.connector.errors.PoolError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+    # The main connection may have switched databases since the pool was created
+    database = database or connection.database
+    if database:
+        borrowed.cursor().execute(f"USE `{database}`")
+    _borrowed_connections.add(borrowed)
+    return borrowed
+
+def ensure_mysql_connection(connection):
+    """
+    Health check: ping the connection and reconnect if the server dropped it. Returns True if it is usable.
+    """
+    try:
+        connection.ping(reconnect=True, attempts=3, delay=1)
+        return True
+    except mysql.connector.Error as err:
+        print(f"MySQL connection lost: {err}")
+        return False
+
+def get_mongo_client(connection_string):
+    """
+    Return the shared MongoClient for the connection string, creating it on first use.
+    """
+    with _connection_lock:
+        client = _mongo_clients.get(connection_string)
+        if client is None:
+            client = MongoClient(
+                connection_string,
+                maxPoolSize=CONNECTION_SETTINGS["mongo_max_pool_size"],
+                compressors=CONNECTION_SETTINGS["mongo_compressors"],
+                connectTimeoutMS=CONNECTION_SETTINGS["mongo_connect_timeout_ms"],
+                serverSelectionTimeoutMS=CONNECTION_SETTINGS["mongo_server_selection_timeout_ms"],
+                socketTimeoutMS=CONNECTION_SETTINGS["mongo_socket_timeout_ms"]
+            )
+            _mongo_clients[connection_string] = client
+        return client
+
+def close_mongo_client(connection_string):
+    """
+    Close and forget the shared client for the connection string.
+    """
+    with _connection_lock:
+        client = _mongo_clients.pop(connection_string, None)
+    if client is not None:
+        client.close()
+
+def ensure_mongodb_connection(db):
+    """
+    Health check: ping the MongoDB server. Returns True if it answers.
+    """
+    try:
+        db.client.admin.command("ping")
+        return True
+    except Exception as e:
+        print(f"MongoDB connection lost: {e}")
+        return False
+
+def close_all_connections():
+    """
+    Disconnect the MySQL connections still handed out, drop the pools and close the shared MongoDB
+    clients. Registered to run at exit.
+    """
+    with _connection_lock:
+        clients = list(_mongo_clients.values())
+        # Idle pooled connections are closed when their pool is garbage collected or the process exits
+        _mysql_pools.clear()
+        _mongo_clients.clear()
+    for connection in list(_checked_out_connections):
+        try:
+            # Connections already returned to their pool have nothing to disconnect
+            connection.disconnect()
+        except Exception:
+            pass
+    for client in clients:
+        client.close()
+
+atexit.register(close_all_connections)
+
+# Schema catalogs, one per MySQL connection pool. Built lazily on first use and
+# reused by every function that needs table or column metadata.
+_mysql_catalogs = {}
+_catalog_versions = itertools.count(1)
+_catalog_lock = threading.RLock()  # The menu and the background warm-up may ask for a catalog at the same time
+
+def build_mysql_catalog(connection):
+    """
+    Introspect tables, column names and types, indexes, primary keys, foreign keys and estimated row counts
+    of the current database. Uses four set-based INFORMATION_SCHEMA queries, so the cost does not grow
+    with the number of tables.
+    """
+    cursor = connection.cursor()
+    tables = {}
+
+    cursor.execute("""
+        SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE
+        FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+        ORDER BY TABLE_NAME, ORDINAL_POSITION;
+    """)
+    for table_name, column_name, column_type in cursor.fetchall():
+        entry = tables.setdefault(table_name, {
+            "columns": [],
+            "column_types": {},
+            "indexes": {},
+            "primary_keys": [],
+            "foreign_keys": [],
+            "references": [],
+            "rows": 0
+        })
+        entry["columns"].append((column_name, column_type))
+        entry["column_types"][column_name] = column_type
+
+    cursor.execute("""
+        SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME, NON_UNIQUE
+        FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+        ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX;
+    """)
+    for table_name, index_name, column_name, non_unique in cursor.fetchall():
+        if table_name not in tables:
+            continue
+        index = tables[table_name]["indexes"].setdefault(index_name, {"columns": [], "unique": not int(non_unique)})
+        index["columns"].append(column_name)
+        if index_name == "PRIMARY":
+            tables[table_name]["primary_keys"].append(column_name)
+
+    cursor.execute("""
+        SELECT k.TABLE_NAME, k.COLUMN_NAME, k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME, k.CONSTRAINT_NAME
+        FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE k
+        JOIN INFORMATION_SCHEMA.REFERENTIAL_CONSTRAINTS r
+            ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA
+            AND r.TABLE_NAME = k.TABLE_NAME
+            AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+        WHERE k.TABLE_SCHEMA = DATABASE() AND k.REFERENCED_TABLE_NAME IS NOT NULL
+        ORDER BY k.TABLE_NAME, k.CONSTRAINT_NAME, k.ORDINAL_POSITION;
+    """)
+    for table_name, column_name, referenced_table, referenced_column, constraint_name in cursor.fetchall():
+        if table_name not in tables:
+            continue
+        tables[table_name]["foreign_keys"].append(column_name)
+        tables[table_name]["references"].append({
+            "column": column_name,
+            "referenced_table": referenced_table,
+            "referenced_column": referenced_column,
+            "constraint": constraint_name
+        })
+
+    cursor.execute("""
+        SELECT TABLE_NAME, TABLE_ROWS
+        FROM INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = DATABASE();
+    """)
+    for table_name, table_rows in cursor.fetchall():
+        if table_name in tables:
+            tables[table_name]["rows"] = int(table_rows or 0)  # InnoDB's estimate
+
+    return {
+        "version": next(_catalog_versions),
+        "tables": tables,
+        # Lower-cased column names per table, the shape used by the natural language mapping
+        "schema": {table_name: [column[0].lower() for column in entry["columns"]]
+                   for table_name, entry in tables.items()}
+    }
+
+def get_mysql_catalog(connection, refresh=False):
+    """
+    Return the cached schema catalog for the connection, building it on first use or when refresh is requested.
+    """
+    key = mysql_connection_key(connection)
+    catalog = _mysql_catalogs.get(key)
+    if catalog is None or refresh:
+        with _catalog_lock:
+            # Another thread may have built it while this one waited
+            catalog = _mysql_catalogs.get(key)
+            if catalog is None or refresh:
+                catalog = build_mysql_catalog(connection)
+                _mysql_catalogs[key] = catalog
+    return catalog
+
+def refresh_mysql_catalog(connection):
+    """
+    Rebuild the schema catalog for the connection from the database.
+    """
+    return get_mysql_catalog(connection, refresh=True)
+
+def invalidate_mysql_catalog(connection):
+    """
+    Drop the cached schema catalog so the next lookup re-introspects the database.
+    """
+    with _catalog_lock:
+        _mysql_catalogs.pop(mysql_connection_key(connection), None)
+
+def build_join_graph(tables):
+    """
+    Build the foreign key graph of a catalog: {table: [edge, ...]}. An edge names the neighbouring
+    table, the (column, neighbour column) pairs of one constraint, and whether both sides lead an index.
+    Every constraint gives an edge in each direction.
+    """
+    def indexed(table, columns):
+        return any(index["columns"][:len(columns)] == list(columns) for index in tables[table]["indexes"].values())
+
+    graph = {table: [] for table in tables}
+    for table, entry in tables.items():
+        constraints = {}
+        for reference in entry["references"]:
+            constraints.setdefault((reference["constraint"], reference["referenced_table"]), []).append(
+                (reference["column"], reference["referenced_column"]))
+        for (_, parent), pairs in constraints.items():
+            if parent not in tables:
+                continue
+            is_indexed = indexed(table, [column for column, _ in pairs]) and indexed(parent, [column for _, column in pairs])
+            graph[table].append({"table": parent, "on": pairs, "indexed": is_indexed})
+            graph[parent].append({"table": table, "on": [(other, column) for column, other in pairs], "indexed": is_indexed})
+    return graph
+
+def get_join_graph(connection):
+    """
+    Return the foreign key graph of the connection's catalog, built once per catalog version.
+    """
+    catalog = get_mysql_catalog(connection)
+    if "join_graph" not in catalog:
+        catalog["join_graph"] = build_join_graph(catalog["tables"])
+    return catalog["join_graph"]
+
+def mysql_table_ranking(connection):
+    """
+    Rank tables for resolving columns found in several tables: by foreign key degree, then
+    estimated row count. Built once per catalog version.
+    """
+    catalog = get_mysql_catalog(connection)
+    if "table_ranking" not in catalog:
+        graph = get_join_graph(connection)
+        catalog["table_ranking"] = {table: (len(graph[table]), entry["rows"]) for table, entry in catalog["tables"].items()}
+    return catalog["table_ranking"]
+
+def shortest_join_path(graph, sources, target):
+    """
+    Breadth-first search from any of the source tables to the target. Indexed edges are tried first;
+    only if they do not connect the tables are unindexed foreign keys used. Returns a list of
+    (table, edge) steps, [] if the target is a source, or None if the tables are not connected.
+    """
+    sources = list(sources)
+    if target in sources:
+        return []
+    for indexed_only in (True, False):
+        previous = {source: None for source in sources}
+        frontier = deque(sources)
+        while frontier:
+            table = frontier.popleft()
+            for edge in graph.get(table, []):
+                if (indexed_only and not edge["indexed"]) or edge["table"] in previous:
+                    continue
+                previous[edge["table"]] = (table, edge)
+                if edge["table"] == target:
+                    path = []
+                    node = target
+                    while previous[node] is not None:
+                        path.append(previous[node])
+                        node = previous[node][0]
+                    return path[::-1]
+                frontier.append(edge["table"])
+    return None
+
+def plan_join(columns, schema, graph):
+    """
+    Find the fewest joins connecting tables that together hold all the columns. schema maps tables
+    to lower-cased column names. Returns {"root", "steps", "tables": {column: table}} or None.
+    """
+    index = get_schema_field_index(schema)
+    holders = {column: sorted(index["column_tables"].get(column, ()), key=index["positions"].get) for column in columns}
+    if not columns or not all(holders.values()):
+        return None
+
+    best = None
+    for root in holders[columns[0]]:
+        joined, steps, owners = [root], [], {}
+        for column in columns:
+            owner = next((table for table in joined if column in schema[table]), None)
+            if owner is None:
+                paths = [(path, table) for table in holders[column]
+                         for path in [shortest_join_path(graph, joined, table)] if path is not None]
+                if not paths:
+                    break
+                path, owner = min(paths, key=lambda item: len(item[0]))
+                steps.extend(path)
+                joined.extend(edge["table"] for _, edge in path)
+            owners[column] = owner
+        else:
+            if best is None or len(steps) < len(best["steps"]):
+                best = {"root": root, "steps": steps, "tables": owners}
+    return best
+
+def join_clause(plan):
+    """
+    Render a join plan as the table expression of a FROM clause.
+    """
+    clause = plan["root"]
+    for table, edge in plan["steps"]:
+        conditions = " AND ".join(f"{table}.{column} = {edge['table']}.{other}" for column, other in edge["on"])
+        clause += f" JOIN {edge['table']} ON {conditions}"
+    return clause
+
+# Bare identifiers of an SQL expression: not qualified, not a qualifier and not a function name
+_SQL_BARE_IDENTIFIER = re.compile(r"(?<![\w.`])([A-Za-z_]\w*)(?![\w.`(])")
+
+def sql_expression_columns(text):
+    """
+    Return the lower-cased bare identifiers of an SQL expression outside quoted literals.
+    """
+    parts = _SQL_LITERAL_SPLIT.split(text)
+    return [name.lower() for part in parts[::2] for name in _SQL_BARE_IDENTIFIER.findall(part)]
+
+def qualify_join_columns(text, plan):
+    """
+    Prefix every column of a join plan found in an SQL expression with its table, so a column
+    held by several joined tables (e.g. last_update) is not ambiguous. Quoted literals are left alone.
+    """
+    def qualify(match):
+        table = plan["tables"].get(match.group(1).lower())
+        return f"{table}.{match.group(1)}" if table else match.group(1)
+
+    parts = _SQL_LITERAL_SPLIT.split(text)
+    return "".join(part if index % 2 else _SQL_BARE_IDENTIFIER.sub(qualify, part) for index, part in enumerate(parts))
+
 # Function to show available tables and columns in MySQL
 def show_mysql_tables_and_columns(connection):
     if connection is None:
         print("MySQL connection is not available.")
         return
 
-    cursor = connection.cursor()
-
-    cursor.execute("SHOW TABLES;")
-    tables = cursor.fetchall()
+    tables = get_mysql_catalog(connection)["tables"]
 
     if not tables:
         print("No tables found in the MySQL database.")
         return
 
     print("\nAvailable MySQL Tables:")
-    for table in tables:
-        print(f"Table: {table[0]}")
-
-        cursor.execute(f"SHOW COLUMNS FROM {table[0]};")
-        columns = cursor.fetchall()
+    for table_name, entry in tables.items():
+        print(f"Table: {table_name}")
 
         print("Columns:")
-        for column in columns:
-            print(f" - {column[0]} ({column[1]})")
+        for column_name, column_type in entry["columns"]:
+            print(f" - {column_name} ({column_type})")
         print("\n")
 
 def connect_mongodb():
@@ -66,7 +492,7 @@ def connect_mongodb():
             if connection_string.lower() == 'back':
                 return None
 
-            client = MongoClient(connection_string)
+            client = get_mongo_client(connection_string)
 
             db_name = input("Enter the MongoDB database name: ").strip()
             db = client[db_name]
@@ -81,6 +507,8 @@ def connect_mongodb():
         except Exception as e:
             print(f"Error: {e}")
             print("Failed to connect to MongoDB. Please check the connection string and try again.")
+            # Do not keep a client for a connection string that does not work
+            close_mongo_client(connection_string)
 
 def show_mongodb_collections_and_fields(db):
     if db is None:
@@ -94,609 +522,2908 @@ def show_mongodb_collections_and_fields(db):
         print("No collections found in the MongoDB database.")
         return
 
+    profiles = get_mongo_schema_profiles(db)
+
     print("\nAvailable MongoDB Collections:")
     for collection_name in collections:
         print(f"Collection: {collection_name}")
 
-        # Fetch a sample document to display its fields
-        collection = db[collection_name]
-        sample_doc = collection.find_one()
-
-        if sample_doc:
-            print("Fields:")
-            for key, value in sample_doc.items():
-                print(f" - {key} ({type(value).__name__})")  # key is field name, type(value).__name__ gives field type
+        # Fields found in a sample of the collection, with how often each type occurs
+        profile = profiles.get(collection_name)
+        if profile and profile["sampled"]:
+            print(f"Fields (from {profile['sampled']} sampled documents):")
+            for path, entry in profile["fields"].items():
+                values = sum(entry["types"].values())
+                types = ", ".join(f"{type_name} {count / values:.0%}"
+                                  for type_name, count in sorted(entry["types"].items(), key=lambda item: -item[1]))
+                print(f" - {path} ({types}; present in {entry['count'] / profile['sampled']:.0%})")
         else:
             print(f" - No documents found in collection '{collection_name}'")
 
         print("\n")  # Newline after each collection for clarity
 
-def generate_mysql_sample_queries(connection, max_queries=2):
-    if connection is None:
-        print("MySQL connection is not available.")
-        return []
+# How generated queries are validated before they are shown:
+# "probe" checks them with EXPLAIN and a LIMIT 1 run, "full" executes them and fetches every row.
+QUERY_VALIDATION_MODE = "probe"
+_TRAILING_LIMIT = re.compile(r"\s+LIMIT\s+\d+\s*$", re.IGNORECASE)
+_LIMIT_WITH_OFFSET = re.compile(r"\s+LIMIT\s+\d+\s*(?:,|OFFSET)\s*\d+\s*$", re.IGNORECASE)
+
+def limit_one_query(query):
+    """
+    Return the query bounded to a single row: a trailing LIMIT n becomes LIMIT 1, otherwise LIMIT 1 is appended.
+    """
+    query = query.strip().rstrip(";").strip()
+    if _LIMIT_WITH_OFFSET.search(query):
+        return query
+    return _TRAILING_LIMIT.sub("", query) + " LIMIT 1"
+
+def validate_mysql_query(cursor, query, mode=None):
+    """
+    Return True if the query is valid and returns at least one row. Raises the database error if it is invalid.
+    """
+    if (mode or QUERY_VALIDATION_MODE) == "full":
+        cursor.execute(query)
+        return bool(cursor.fetchall())
+
+    # EXPLAIN checks syntax and column references without touching any rows
+    cursor.execute(f"EXPLAIN {query.strip().rstrip(';')}")
+    cursor.fetchall()
+    cursor.execute(with_execution_limit(limit_one_query(query)))
+    return bool(cursor.fetchall())
 
+def mongo_find_cursor(collection, query):
+    """
+    Build a find() cursor for a generated "find" query, which is either a plain filter
+    or a dict of "filter", "sort" and "limit" options.
+    """
+    if query and set(query) <= {"filter", "sort", "limit"}:
+        cursor = collection.find(query.get("filter", {}))
+        if query.get("sort"):
+            cursor = cursor.sort(list(query["sort"].items()))
+        if query.get("limit"):
+            cursor = cursor.limit(query["limit"])
+        return cursor
+    return collection.find(query)
+
+def validate_mongodb_query(collection, query, mode=None):
+    """
+    Return True if the generated query runs and returns at least one document.
+    In probe mode pipelines get a trailing {"$limit": 1} and find cursors a limit of 1.
+    """
+    full = (mode or QUERY_VALIDATION_MODE) == "full"
+    max_time_ms = QUERY_GUARD["max_execution_ms"] or None
+    if query["type"] == "aggregate":
+        pipeline = query["query"] if full else query["query"] + [{"$limit": 1}]
+        return any(True for _ in collection.aggregate(pipeline, maxTimeMS=max_time_ms))
+    cursor = mongo_find_cursor(collection, query["query"])
+    if max_time_ms:
+        cursor = cursor.max_time_ms(max_time_ms)
+    return any(True for _ in (cursor if full else cursor.limit(1)))
+
+# Query guard: every executed query is explained first. Above the warn thresholds the user is asked
+# to confirm, above the refuse thresholds it is not run. None disables a threshold. Every statement
+# also carries a server-side time limit, and Ctrl-C cancels it on the server.
+QUERY_GUARD = {
+    "warn_rows": 1_000_000,
+    "refuse_rows": 100_000_000,
+    "warn_cost": 1_000_000,
+    "refuse_cost": None,
+    "max_execution_ms": 60_000,
+}
+_SELECT_KEYWORD = re.compile(r"^(\s*\(*\s*)SELECT\b", re.IGNORECASE)
+_query_tags = itertools.count(1)
+
+def with_execution_limit(query, milliseconds=None):
+    """
+    Add a MAX_EXECUTION_TIME optimizer hint to a SELECT statement (other statements are returned unchanged).
+    """
+    milliseconds = QUERY_GUARD["max_execution_ms"] if milliseconds is None else milliseconds
+    if not milliseconds or "MAX_EXECUTION_TIME" in query.upper():
+        return query
+    return _SELECT_KEYWORD.sub(lambda match: f"{match.group(1)}SELECT /*+ MAX_EXECUTION_TIME({int(milliseconds)}) */",
+                               query, count=1)
+
+def _judge_plan(plan):
+    """
+    Fill in the verdict ("ok", "warn" or "refuse") and the reasons for it from the plan's estimates.
+    """
+    plan["reasons"] = []
+    plan["verdict"] = "ok"
+    for measure, label in (("rows", "estimated rows examined"), ("cost", "estimated cost")):
+        for level in ("refuse", "warn"):
+            limit = QUERY_GUARD[f"{level}_{measure}"]
+            if limit is not None and plan[measure] is not None and plan[measure] > limit:
+                if level == "refuse" or plan["verdict"] == "ok":
+                    plan["verdict"] = level
+                plan["reasons"].append(f"{label} {plan[measure]:,.0f} exceeds {limit:,}")
+                break
+    return plan
+
+def _explain_tables(node):
+    """
+    Yield the table entries of an EXPLAIN FORMAT=JSON plan, including those of subqueries.
+    """
+    if isinstance(node, dict):
+        if "table_name" in node and "access_type" in node:
+            yield node
+        for value in node.values():
+            yield from _explain_tables(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _explain_tables(item)
+
+def _explain_flags(node, flag):
+    """
+    True if any part of an EXPLAIN FORMAT=JSON plan sets the flag (e.g. "using_filesort").
+    """
+    if isinstance(node, dict):
+        return node.get(flag) is True or any(_explain_flags(value, flag) for value in node.values())
+    if isinstance(node, list):
+        return any(_explain_flags(item, flag) for item in node)
+    return False
+
+def explain_mysql_query(connection, query):
+    """
+    Estimate a MySQL query with EXPLAIN: rows examined (product over the joined tables, and per
+    table or alias in "table_rows"), optimizer cost and full table scans. Returns None if the
+    statement cannot be explained.
+    """
+    statement = query.strip().rstrip(";")
     cursor = connection.cursor()
+    try:
+        try:
+            cursor.execute(f"EXPLAIN FORMAT=JSON {statement}")
+            document = cursor.fetchall()[0][0]
+            plan_json = json.loads(document.decode() if isinstance(document, (bytes, bytearray)) else document)
+            tables = list(_explain_tables(plan_json))
+            rows = math.prod(max(1, int(table.get("rows_examined_per_scan", 1))) for table in tables)
+            cost = float(plan_json.get("query_block", {}).get("cost_info", {}).get("query_cost", 0)) or None
+            full_scans = [table["table_name"] for table in tables if table["access_type"] == "ALL"]
+            table_rows = {table["table_name"]: int(table.get("rows_examined_per_scan", 1)) for table in tables}
+            notes = [note for flag, note in (("using_filesort", "sorts with a filesort"),
+                                             ("using_temporary_table", "uses a temporary table"))
+                     if _explain_flags(plan_json, flag)]
+        except mysql.connector.Error:
+            # Servers without FORMAT=JSON: the tabular plan has row estimates but no cost
+            cursor.execute(f"EXPLAIN {statement}")
+            columns = [column.lower() for column in cursor.column_names]
+            tables = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            rows = math.prod(max(1, int(table.get("rows") or 1)) for table in tables)
+            cost = None
+            full_scans = [table.get("table") for table in tables if table.get("type") == "ALL"]
+            table_rows = {table.get("table"): int(table.get("rows") or 1) for table in tables}
+            extra = " ".join(str(table.get("extra") or "") for table in tables)
+            notes = [note for marker, note in (("Using filesort", "sorts with a filesort"),
+                                               ("Using temporary", "uses a temporary table"))
+                     if marker in extra]
+    except Exception:
+        return None
+    finally:
+        cursor.close()
+    return _judge_plan({"rows": rows, "cost": cost, "full_scans": full_scans, "table_rows": table_rows, "notes": notes})
+
+def _plan_stage_names(node):
+    """
+    Yield the stage names of a MongoDB explain plan ("COLLSCAN", "IXSCAN", "SORT", "$group", ...).
+    """
+    if isinstance(node, dict):
+        if isinstance(node.get("stage"), str):
+            yield node["stage"]
+        for key, value in node.items():
+            if key in ("$sort", "$group"):
+                yield key
+            yield from _plan_stage_names(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _plan_stage_names(item)
+
+def explain_mongodb_query(collection, query_type, query):
+    """
+    Estimate a MongoDB query with the explain command (queryPlanner, nothing is executed).
+    A collection scan counts as examining every document. Returns None if explain fails.
+    """
+    if query_type == "aggregate":
+        command = {"aggregate": collection.name, "pipeline": list(query), "cursor": {}}
+    elif query and set(query) <= {"filter", "sort", "limit"}:
+        command = {"find": collection.name, "filter": query.get("filter", {})}
+        if query.get("sort"):
+            command["sort"] = query["sort"]
+        if query.get("limit"):
+            command["limit"] = query["limit"]
+    else:
+        command = {"find": collection.name, "filter": query or {}}
+    try:
+        stages = set(_plan_stage_names(collection.database.command("explain", command, verbosity="queryPlanner")))
+        full_scan = "COLLSCAN" in stages
+        rows = collection.estimated_document_count() if full_scan else None
+    except Exception:
+        return None
 
-    cursor.execute("SHOW TABLES;")
-    tables = cursor.fetchall()
+    notes = []
+    if "SORT" in stages or ("$sort" in stages and full_scan):
+        notes.append("sorts in memory")
+    if "$group" in stages and full_scan:
+        notes.append("groups every document")
+    return _judge_plan({"rows": rows, "cost": None, "full_scans": [collection.name] if full_scan else [], "notes": notes})
 
-    if not tables:
-        print("No tables found in the database.")
-        return []
+def confirm_query_plan(plan):
+    """
+    Show the plan estimate and return True if the query may run: refused plans never run,
+    plans above a warn threshold run only if the user confirms.
+    """
+    if plan is None:
+        return True
+    details = [f"estimated rows examined: {plan['rows']:,}" if plan["rows"] is not None else "estimated rows examined: unknown"]
+    if plan["cost"] is not None:
+        details.append(f"cost: {plan['cost']:,.1f}")
+    if plan["full_scans"]:
+        details.append(f"full scans: {', '.join(plan['full_scans'])}")
+    details.extend(plan["notes"])
+    print(f"Query plan: {'; '.join(details)}")
+
+    if plan["verdict"] == "refuse":
+        print(f"Query refused by the query guard: {'; '.join(plan['reasons'])}.")
+        return False
+    if plan["verdict"] == "warn":
+        print(f"Warning: {'; '.join(plan['reasons'])}.")
+        return input("Run it anyway? (yes/no): ").strip().lower() == "yes"
+    return True
+
+def cancel_mysql_statement(connection, connection_id, report=print):
+    """
+    Stop the statement running on the connection with KILL QUERY from a second pooled connection,
+    then make sure the connection is usable again.
+    """
+    pool = _pool_for(connection)
+    if pool is not None and connection_id is not None:
+        try:
+            killer = pool.get_connection()
+            try:
+                killer.cursor().execute(f"KILL QUERY {int(connection_id)}")
+            finally:
+                killer.close()
+        except mysql.connector.Error as err:
+            report(f"Could not cancel the statement on the server: {err}")
+    else:
+        report("This connection cannot cancel statements on the server; reconnecting instead.")
+    try:
+        connection.consume_results()
+        connection.ping()
+    except Exception:
+        connection.reconnect()
+    report("Query cancelled.")
 
-    valid_queries = []
-    attempts = 0
+def next_query_tag():
+    """
+    A unique comment attached to a MongoDB operation so it can be found again in $currentOp.
+    """
+    return f"chatdb-{os.getpid()}-{next(_query_tags)}"
 
-    while len(valid_queries) < max_queries and attempts < max_queries * 5:  # Limit attempts
-        table_name = random.choice(tables)[0]
-        cursor.execute(f"SHOW COLUMNS FROM {table_name};")
-        columns = cursor.fetchall()
+def cancel_mongodb_operation(db, tag):
+    """
+    Stop the operations carrying the comment tag with killOp.
+    """
+    try:
+        admin = db.client.admin
+        for operation in admin.aggregate([{"$currentOp": {}}, {"$match": {"command.comment": tag}}]):
+            admin.command("killOp", op=operation["opid"])
+    except Exception as e:
+        print(f"Could not cancel the operation on the server: {e}")
+    print("Query cancelled.")
 
-        if not columns:
+# Executed queries are shown one page at a time; only the current page is held in memory
+RESULT_PAGE_SIZE = 20
+
+def paginate_results(fetch_page, page_size=RESULT_PAGE_SIZE):
+    """
+    Show query results page by page with next/prev/jump navigation.
+    fetch_page(page_number) returns (rows, has_more) for one zero-based page.
+    """
+    page_number = 0
+    rows, has_more = fetch_page(page_number)
+    if not rows:
+        print("The query executed successfully but returned no results.")
+        return
+
+    while True:
+        first_row = page_number * page_size + 1
+        print(f"\nQuery Results (page {page_number + 1}, rows {first_row}-{first_row + len(rows) - 1}):")
+        for row in rows:
+            print(row)
+        if page_number == 0 and not has_more:
+            return
+
+        target = None
+        while target is None:
+            choice = input("[n]ext, [p]revious, [j]ump <page>, [q]uit: ").strip().lower()
+            if choice in ("", "n", "next"):
+                if has_more:
+                    target = page_number + 1
+                else:
+                    print("This is the last page.")
+            elif choice in ("p", "prev", "previous"):
+                if page_number > 0:
+                    target = page_number - 1
+                else:
+                    print("This is the first page.")
+            elif choice.startswith("j"):
+                page = choice[1:].strip() or input("Jump to page: ").strip()
+                if page.isdigit() and int(page) > 0:
+                    target = int(page) - 1
+                else:
+                    print("Invalid page number.")
+            elif choice in ("q", "quit"):
+                return
+            else:
+                print("Invalid choice. Please try again.")
+
+        target_rows, target_has_more = fetch_page(target)
+        if not target_rows:
+            print(f"Page {target + 1} is past the end of the results.")
             continue
+        page_number, rows, has_more = target, target_rows, target_has_more
+
+def mysql_page_source(connection, query, page_size=RESULT_PAGE_SIZE, cursor=None, prefetched=None):
+    """
+    Stream a MySQL query through an unbuffered cursor for paginate_results.
+    Moving forward keeps reading the open cursor with fetchmany; moving back re-executes
+    the query and skips ahead. An already executed cursor and the rows read from it can be
+    passed in to continue from them. Closing a result that was not read to the end stops the
+    statement with KILL QUERY instead of reading the remaining rows. Returns (fetch_page, close).
+    """
+    state = {"cursor": cursor, "position": 0, "lookahead": list(prefetched or []), "exhausted": False}
+    connection_id = getattr(connection, "connection_id", None)
+
+    def close():
+        cursor = state["cursor"]
+        state["cursor"] = None
+        if cursor is None:
+            return
+        if not state["exhausted"]:
+            cancel_mysql_statement(connection, connection_id, report=lambda message: None)
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+    def restart():
+        close()
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(query)
+        state.update(cursor=cursor, position=0, lookahead=[], exhausted=False)
+
+    def read(count):
+        rows = state["lookahead"][:count]
+        state["lookahead"] = state["lookahead"][count:]
+        if len(rows) < count and not state["exhausted"]:
+            fetched = state["cursor"].fetchmany(count - len(rows))
+            state["exhausted"] = len(fetched) < count - len(rows)
+            rows += fetched
+        state["position"] += len(rows)
+        return rows
+
+    def fetch_page(page_number):
+        start = page_number * page_size
+        if state["cursor"] is None or start < state["position"]:
+            restart()
+        while state["position"] < start:
+            if not read(min(page_size, start - state["position"])):
+                return [], False
+        rows = read(page_size + 1)
+        if len(rows) > page_size:
+            # Keep the extra row for the next page instead of dropping it
+            state["lookahead"] = rows[page_size:] + state["lookahead"]
+            state["position"] -= len(rows) - page_size
+            return rows[:page_size], True
+        return rows, False
+
+    return fetch_page, close
+
+def open_mongodb_cursor(collection, query_type, query, skip=0, batch_size=RESULT_PAGE_SIZE, comment=None):
+    """
+    Open a cursor over a generated MongoDB query starting at document skip, limited to
+    QUERY_GUARD["max_execution_ms"] and tagged with comment. Returns None when skip is past
+    the query's own limit.
+    """
+    max_time_ms = QUERY_GUARD["max_execution_ms"] or None
+    if query_type == "aggregate":
+        options = {"batchSize": batch_size, "maxTimeMS": max_time_ms}
+        if comment:
+            options["comment"] = comment
+        return collection.aggregate(list(query) + ([{"$skip": skip}] if skip else []), **options)
+
+    cursor = mongo_find_cursor(collection, query)
+    query_limit = query.get("limit") if query and set(query) <= {"filter", "sort", "limit"} else None
+    if query_limit and skip:
+        # Stay within the query's own limit
+        if query_limit <= skip:
+            return None
+        cursor = cursor.limit(query_limit - skip)
+    cursor = cursor.skip(skip).batch_size(batch_size)
+    if max_time_ms:
+        cursor = cursor.max_time_ms(max_time_ms)
+    if comment:
+        cursor = cursor.comment(comment)
+    return cursor
+
+def mongodb_page_source(collection, query_type, query, page_size=RESULT_PAGE_SIZE, comment=None, cursor=None, prefetched=None):
+    """
+    Page through a generated MongoDB query for paginate_results. Moving forward keeps reading
+    one open cursor, fetched in batches of a page; moving back or jumping reopens it at the
+    page with skip. An already opened cursor and the documents read from it can be passed in
+    to continue from them. Returns (fetch_page, close).
+    """
+    state = {"cursor": cursor, "position": 0, "lookahead": list(prefetched or [])}
+
+    def close():
+        if state["cursor"] is not None:
+            state["cursor"].close()
+            state["cursor"] = None
+
+    def reopen(skip):
+        close()
+        state.update(cursor=open_mongodb_cursor(collection, query_type, query, skip, page_size + 1, comment),
+                     position=skip, lookahead=[])
+
+    def read(count):
+        rows = state["lookahead"][:count]
+        state["lookahead"] = state["lookahead"][count:]
+        if len(rows) < count and state["cursor"] is not None:
+            rows += list(itertools.islice(state["cursor"], count - len(rows)))
+        state["position"] += len(rows)
+        return rows
+
+    def fetch_page(page_number):
+        start = page_number * page_size
+        if start != state["position"] or (state["cursor"] is None and not state["lookahead"]):
+            reopen(start)
+        rows = read(page_size + 1)
+        if len(rows) > page_size:
+            # Keep the extra document for the next page instead of dropping it
+            state["lookahead"] = rows[page_size:] + state["lookahead"]
+            state["position"] -= len(rows) - page_size
+            return rows[:page_size], True
+        return rows, False
+
+    return fetch_page, close
+
+# Results of executed queries, least recently used first. Only results that fit on one page are
+# kept (a longer one is streamed, never held whole), and the cache stays within RESULT_CACHE_MAX_BYTES.
+RESULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# UPDATE_TIME is NULL for InnoDB tables not written since the server started. Such queries stay
+# uncached unless the CHECKSUM TABLE fallback is enabled, which reads the whole table on every execution.
+RESULT_CACHE_CHECKSUM_FALLBACK = False
+# UPDATE_TIME has one-second granularity: a table written this recently may change again
+# without a new token, so its results are not cached yet
+RESULT_CACHE_SETTLE_SECONDS = 2
+_result_cache = OrderedDict()
+_result_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+_result_cache_lock = threading.Lock()  # Service workers and the menu share the cache
+_NONDETERMINISTIC_SQL = re.compile(
+    r"\b(?:NOW|RAND|UUID|SYSDATE|CURDATE|CURTIME|UNIX_TIMESTAMP|CURRENT_(?:DATE|TIME|TIMESTAMP|USER))\b",
+    re.IGNORECASE)
+_SQL_LITERAL_SPLIT = re.compile(r"""('(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`[^`]*`)""")
+
+def normalize_sql_text(query):
+    """
+    Collapse whitespace outside quoted literals and drop the trailing semicolon, so equivalent query text shares a cache key.
+    """
+    parts = _SQL_LITERAL_SPLIT.split(query.strip().rstrip(";").strip())
+    return "".join(part if index % 2 else re.sub(r"\s+", " ", part) for index, part in enumerate(parts))
+
+def result_cache_get(key):
+    """
+    Return the cached rows for the key, or None, and update the hit/miss counters.
+    """
+    with _result_cache_lock:
+        entry = _result_cache.get(key)
+        if entry is None:
+            _result_cache_stats["misses"] += 1
+            return None
+        _result_cache.move_to_end(key)
+        _result_cache_stats["hits"] += 1
+        return entry[0]
+
+def result_cache_put(key, rows):
+    """
+    Cache the rows under the key, evicting least recently used results to stay within the memory budget.
+    """
+    size = len(repr(rows))  # rough size of the rows in memory
+    if size > RESULT_CACHE_MAX_BYTES:
+        return
+    with _result_cache_lock:
+        old = _result_cache.pop(key, None)
+        if old is not None:
+            _result_cache_stats["bytes"] -= old[1]
+        _result_cache[key] = (rows, size)
+        _result_cache_stats["bytes"] += size
+        while _result_cache_stats["bytes"] > RESULT_CACHE_MAX_BYTES:
+            _, (_, evicted_size) = _result_cache.popitem(last=False)
+            _result_cache_stats["bytes"] -= evicted_size
+            _result_cache_stats["evictions"] += 1
+
+def invalidate_result_cache(owner):
+    """
+    Drop every cached result of a MySQL connection (by mysql_connection_key) or MongoDB database.
+    """
+    with _result_cache_lock:
+        for key in [key for key in _result_cache if key[0] == owner]:
+            _result_cache_stats["bytes"] -= _result_cache.pop(key)[1]
+
+def result_cache_summary():
+    """
+    Return a one-line summary of the result cache counters.
+    """
+    with _result_cache_lock:
+        return (f"hits: {_result_cache_stats['hits']}, misses: {_result_cache_stats['misses']}, "
+                f"evictions: {_result_cache_stats['evictions']}, entries: {len(_result_cache)}, "
+                f"size: {_result_cache_stats['bytes'] / 1024:.1f} KB")
 
-        cursor.execute(f"SHOW INDEX FROM {table_name} WHERE Key_name = 'PRIMARY';")
-        primary_keys = [index[4] for index in cursor.fetchall()]
+def mysql_table_versions(connection, query):
+    """
+    Return a version token for every catalog table the query mentions, or None if the result
+    cannot be cached (no known table, a non-deterministic function, an unknown version, or a
+    table written within the last RESULT_CACHE_SETTLE_SECONDS).
+    """
+    if _NONDETERMINISTIC_SQL.search(query):
+        return None
+    words = set(re.findall(r"[\w$]+", query.lower()))
+    tables = sorted(table for table in get_mysql_catalog(connection)["tables"] if table.lower() in words)
+    if not tables:
+        return None
 
+    cursor = connection.cursor()
+    try:
+        # MySQL 8 caches INFORMATION_SCHEMA.TABLES statistics, UPDATE_TIME included, for
+        # information_schema_stats_expiry seconds (a day by default); read them live instead
+        try:
+            cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+        except mysql.connector.Error:
+            pass  # Before MySQL 8 the statistics are not cached
+        placeholders = ", ".join(["%s"] * len(tables))
         cursor.execute(f"""
-            SELECT COLUMN_NAME
-            FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
-            WHERE TABLE_NAME = '{table_name}' AND TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL;
-        """)
-        foreign_keys = [row[0] for row in cursor.fetchall()]
-
-        id_columns = set(primary_keys + foreign_keys)
-
-        column_types = {col[0]: col[1] for col in columns}
-        numeric_columns = [col for col, dtype in column_types.items() if
-                           "int" in dtype or "float" in dtype]
-        text_columns = [col for col, dtype in column_types.items() if "varchar" in dtype or "text" in dtype]
-        numeric_columns = [col for col in numeric_columns if col not in id_columns]
-
-
-        query_patterns = []
-
-        for numeric_col in numeric_columns:
-            for text_col in text_columns:
-                query_patterns.append({
-                    "title": f"Total {numeric_col} by {text_col}",
-                    "query": f"SELECT {text_col}, SUM({numeric_col}) AS total FROM {table_name} GROUP BY {text_col} LIMIT 10;",
-                    "description": f"This query calculates the total of {numeric_col} grouped by {text_col}, inspired by the '{table_name}' table."
-                })
-
-        for numeric_col in numeric_columns:
-            for text_col in text_columns:
-                query_patterns.append({
-                    "title": f"Filter Groups by {numeric_col} Total",
-                    "query": f"SELECT {text_col}, SUM({numeric_col}) AS total FROM {table_name} GROUP BY {text_col} HAVING total > 0 LIMIT 10;",
-                    "description": f"This query filters groups where the total {numeric_col} exceeds 0, grouped by {text_col}, inspired by the '{table_name}' table."
-                })
-
-        for numeric_col in numeric_columns:
-            query_patterns.extend([
-                {
-                    "title": f"Top 10 Records Ordered by {numeric_col}",
-                    "query": f"SELECT * FROM {table_name} ORDER BY {numeric_col} DESC LIMIT 10;",
-                    "description": f"This query retrieves the top 10 records ordered by {numeric_col} in descending order, inspired by the '{table_name}' table."
-                },
-                {
-                    "title": f"Bottom 10 Records Ordered by {numeric_col}",
-                    "query": f"SELECT * FROM {table_name} ORDER BY {numeric_col} ASC LIMIT 10;",
-                    "description": f"This query retrieves the bottom 10 records ordered by {numeric_col} in ascending order, inspired by the '{table_name}' table."
-                }
-            ])
-
-        for numeric_col in numeric_columns:
-            query_patterns.extend([
-                {
-                    "title": f"Select rows where {numeric_col} > 0",
-                    "query": f"SELECT * FROM {table_name} WHERE {numeric_col} > 0 LIMIT 10;",
-                    "description": f"This query selects rows where {numeric_col} is greater than 0, inspired by the '{table_name}' table."
-                },
-                {
-                    "title": f"Select rows where {numeric_col} is between two values",
-                    "query": f"SELECT * FROM {table_name} WHERE {numeric_col} BETWEEN 0 AND 100 LIMIT 10;",
-                    "description": f"This query selects rows where {numeric_col} is between 0 and 100, inspired by the '{table_name}' table."
-                }
-            ])
+            SELECT TABLE_NAME, UPDATE_TIME, UPDATE_TIME > NOW() - INTERVAL {RESULT_CACHE_SETTLE_SECONDS} SECOND
+            FROM INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+        """, tables)
+        rows = cursor.fetchall()
+        if any(recent for _, _, recent in rows):
+            return None
+        update_times = {table: update_time for table, update_time, _ in rows}
+        versions = []
+        for table in tables:
+            version = update_times.get(table)
+            if version is None and RESULT_CACHE_CHECKSUM_FALLBACK:
+                cursor.execute(f"CHECKSUM TABLE `{table}`")
+                version = cursor.fetchall()[0][1]
+            if version is None:
+                return None
+            versions.append((table, str(version)))
+        return tuple(versions)
+    finally:
+        cursor.close()
 
-        for text_col in text_columns:
-            query_patterns.append({
-                "title": f"Search for Partial Matches in {text_col}",
-                "query": f"SELECT * FROM {table_name} WHERE {text_col} LIKE '%substring%' LIMIT 10;",
-                "description": f"This query searches for rows where {text_col} contains the substring 'substring', inspired by the '{table_name}' table."
-            })
+def _pipeline_lookup_collections(value):
+    """
+    Yield the collections a pipeline reads through $lookup (and $graphLookup/$unionWith) stages.
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in ("$lookup", "$graphLookup") and isinstance(item, dict) and "from" in item:
+                yield item["from"]
+            elif key == "$unionWith":
+                yield item if isinstance(item, str) else item.get("coll")
+            yield from _pipeline_lookup_collections(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _pipeline_lookup_collections(item)
+
+def mongodb_collection_versions(db, collection_name, query):
+    """
+    Return a version token (document count and data size) for the collection and every collection the query looks up.
+    """
+    names = {collection_name} | {name for name in _pipeline_lookup_collections(query) if name}
+    versions = []
+    for name in sorted(names):
+        try:
+            stats = db.command("collStats", name)
+            versions.append((name, stats.get("count"), stats.get("size")))
+        except Exception:
+            versions.append((name, db[name].estimated_document_count()))
+    return tuple(versions)
 
-        if foreign_keys:
-            other_table = random.choice([t[0] for t in tables if t[0] != table_name])
-            cursor.execute(f"SHOW COLUMNS FROM {other_table};")
-            other_columns = cursor.fetchall()
-            if other_columns:
-                query_patterns.append({
-                    "title": f"Join {table_name} with {other_table}",
-                    "query": f"SELECT a.*, b.* FROM {table_name} a JOIN {other_table} b ON a.{foreign_keys[0]} = b.{other_columns[0][0]} LIMIT 10;",
-                    "description": f"This query joins the '{table_name}' table with the '{other_table}' table using the foreign key {foreign_keys[0]}."
-                })
-
-        if query_patterns:
-            query_example = random.choice(query_patterns)
+def mongodb_write_counter(db):
+    """
+    Return the server's write operation counters, which change with every insert, update or
+    delete (unlike a collection's count and size), or None if they cannot be read or do not
+    cover every write (a mongos only counts the writes it routed itself).
+    """
+    try:
+        status = db.client.admin.command("serverStatus", repl=0, metrics=0, locks=0, wiredTiger=0, tcmalloc=0)
+    except Exception:
+        return None
+    if status.get("process") == "mongos":
+        return None
+    counters = (status.get("opcounters", {}), status.get("opcountersRepl", {}))
+    return (status.get("host"), status.get("pid")) + tuple(
+        count.get(operation) for count in counters for operation in ("insert", "update", "delete"))
+
+def list_page_source(rows, page_size=RESULT_PAGE_SIZE):
+    """
+    Page through rows that are already in memory for paginate_results.
+    """
+    def fetch_page(page_number):
+        start = page_number * page_size
+        return rows[start:start + page_size], start + page_size < len(rows)
+    return fetch_page
+
+def display_mysql_query_results(connection, query):
+    """
+    Execute a MySQL query and show its results page by page.
+    Results that fit on one page are cached until one of the tables they read changes.
+    """
+    record_mysql_workload(connection, query)
+    versions = mysql_table_versions(connection, query)
+    key = (mysql_connection_key(connection), "sql", normalize_sql_text(query), versions)
+    rows = result_cache_get(key) if versions is not None else None
+    if rows is not None:
+        print(f"(Result served from cache; {result_cache_summary()})")
+        paginate_results(list_page_source(rows))
+        return
+
+    if not confirm_query_plan(explain_mysql_query(connection, query)):
+        return
+
+    # Read the first page and one row more: a result that ends within it is cached,
+    # a longer one keeps streaming from the rows already read
+    limited_query = with_execution_limit(query)
+    connection_id = getattr(connection, "connection_id", None)
+    close = None
+    try:
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(limited_query)
+        rows = cursor.fetchmany(RESULT_PAGE_SIZE + 1) if cursor.with_rows else []
+        if len(rows) <= RESULT_PAGE_SIZE:
+            cursor.close()
+            if versions is not None:
+                result_cache_put(key, rows)
+            paginate_results(list_page_source(rows))
+            return
+
+        fetch_page, close = mysql_page_source(connection, limited_query, cursor=cursor, prefetched=rows)
+        paginate_results(fetch_page)
+    except KeyboardInterrupt:
+        # Stop the statement on the server before the rest of its rows are drained
+        print("\nCancelling the query...")
+        cancel_mysql_statement(connection, connection_id)
+    finally:
+        if close is not None:
+            close()
+
+def display_mongodb_query_results(collection, query_type, query):
+    """
+    Execute a generated MongoDB query ("find" or "aggregate") and show its results page by page.
+    Results that fit on one page are cached until the collections they read change.
+    """
+    record_mongodb_workload(collection, query_type, query)
+    writes = mongodb_write_counter(collection.database)
+    versions = mongodb_collection_versions(collection.database, collection.name, query)
+    key = (collection.database, query_type, collection.name, json_util.dumps(query), versions, writes)
+    rows = result_cache_get(key) if writes is not None else None
+    if rows is not None:
+        print(f"(Result served from cache; {result_cache_summary()})")
+        paginate_results(list_page_source(rows))
+        return
+
+    if not confirm_query_plan(explain_mongodb_query(collection, query_type, query)):
+        return
+
+    # Read the first page and one document more: a result that ends within it is cached,
+    # a longer one keeps streaming from the same cursor
+    tag = next_query_tag()
+    close = None
+    try:
+        cursor = open_mongodb_cursor(collection, query_type, query, batch_size=RESULT_PAGE_SIZE + 1, comment=tag)
+        rows = list(itertools.islice(cursor, RESULT_PAGE_SIZE + 1)) if cursor is not None else []
+        if len(rows) <= RESULT_PAGE_SIZE:
+            # Settle guard: a write that landed while the rows were read may or may not be in them
+            if writes is not None and mongodb_write_counter(collection.database) == writes:
+                result_cache_put(key, rows)
+            paginate_results(list_page_source(rows))
+            return
+        fetch_page, close = mongodb_page_source(collection, query_type, query, comment=tag, cursor=cursor, prefetched=rows)
+        rows = None
+        paginate_results(fetch_page)
+    except KeyboardInterrupt:
+        print("\nCancelling the query...")
+        cancel_mongodb_operation(collection.database, tag)
+    finally:
+        if close is not None:
+            close()
+
+# Index advisor: the shapes of executed queries are remembered per MySQL pool or MongoDB database
+# (least recently seen first) and later matched against the existing indexes
+WORKLOAD_MAX_SHAPES = 500
+INDEX_ADVISOR_MAX_COLUMNS = 3
+INDEX_TEXT_PREFIX_LENGTH = 64  # TEXT/BLOB columns can only be indexed on a prefix
+_query_workloads = {}
+_workload_lock = threading.Lock()
+_SQL_KEYWORDS = frozenset((
+    "WHERE", "JOIN", "INNER", "LEFT", "RIGHT", "CROSS", "OUTER", "ON", "USING", "GROUP", "ORDER",
+    "HAVING", "LIMIT", "UNION", "AND", "OR", "NOT", "NULL", "TRUE", "FALSE", "AS", "SELECT", "EXISTS"))
+_SQL_TABLE_REFERENCE = re.compile(r"\b(?:FROM|JOIN)\s+`?(\w+)`?(?:\s+(?:AS\s+)?`?(\w+)`?)?", re.IGNORECASE)
+_SQL_CLAUSE_KEYWORD = re.compile(r"\b(WHERE|ON|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT|UNION|JOIN|SELECT)\b", re.IGNORECASE)
+_SQL_PREDICATE = re.compile(
+    r"^\W*(?:`?(\w+)`?\.)?`?([A-Za-z_]\w*)`?\s*(<=>|!=|<>|<=|>=|=|<|>|\bBETWEEN\b|\bLIKE\b|\bIN\b)\s*(.*)$",
+    re.IGNORECASE | re.DOTALL)
+_SQL_COLUMN_ONLY = re.compile(r"^\W*(?:`?(\w+)`?\.)?`?([A-Za-z_]\w*)`?\W*$")
+_MONGO_RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+
+def record_query_workload(owner, key, query):
+    """
+    Count one execution of a query shape for the index advisor.
+    """
+    with _workload_lock:
+        shapes = _query_workloads.setdefault(owner, OrderedDict())
+        entry = shapes.pop(key, None) or {"count": 0, "query": query}
+        entry["count"] += 1
+        shapes[key] = entry
+        while len(shapes) > WORKLOAD_MAX_SHAPES:
+            shapes.popitem(last=False)
+
+def record_mysql_workload(connection, query):
+    """
+    Remember an executed MySQL query for the index advisor.
+    """
+    record_query_workload(mysql_connection_key(connection), normalize_sql_text(query), query)
+
+def record_mongodb_workload(collection, query_type, query):
+    """
+    Remember an executed MongoDB query for the index advisor.
+    """
+    record_query_workload(collection.database, (collection.name, query_type, json_util.dumps(query)),
+                          (collection.name, query_type, query))
+
+def _workload_snapshot(owner):
+    """
+    Return the recorded (count, query) pairs of a MySQL pool or MongoDB database.
+    """
+    with _workload_lock:
+        return [(entry["count"], entry["query"]) for entry in _query_workloads.get(owner, {}).values()]
+
+def _dedupe(items):
+    return list(dict.fromkeys(items))
+
+def sql_index_candidates(query, tables):
+    """
+    Derive the indexes that would support a SELECT from its equality and range predicates,
+    join keys and GROUP BY / ORDER BY columns. tables is the catalog's table dict.
+    Returns {(table, columns): {"alias": ...}} with columns ordered equality, sort, range.
+    """
+    def literal(match):
+        return "'%'" if match.group().startswith("'%") else "'?'"
+    text = re.sub(r"'(?:[^'\\]|\\.|'')*'", literal, query.strip().rstrip(";"))
+
+    aliases = {}
+    order = []
+    lower_tables = {name.lower(): name for name in tables}
+    for table, alias in _SQL_TABLE_REFERENCE.findall(text):
+        table = lower_tables.get(table.lower())
+        if table is None:
+            continue
+        order.append(table)
+        aliases[table.lower()] = table
+        if alias and alias.upper() not in _SQL_KEYWORDS:
+            aliases[alias.lower()] = table
+    if not order:
+        return {}
+    order = _dedupe(order)
+
+    def resolve(qualifier, column):
+        if column.upper() in _SQL_KEYWORDS:
+            return None
+        candidates = [aliases[qualifier.lower()]] if qualifier else order
+        for table in candidates:
+            if table is None:
+                continue
+            for name, _ in tables[table]["columns"]:
+                if name.lower() == column.lower():
+                    return table, name
+        return None
+
+    keys = {table: {"equality": [], "range": [], "join": [], "sort": []} for table in order}
+    parts = _SQL_CLAUSE_KEYWORD.split(text)
+    sort_keys = []
+    for keyword, body in zip(parts[1::2], parts[2::2]):
+        keyword = re.sub(r"\s+", " ", keyword.upper())
+        if keyword in ("WHERE", "ON", "HAVING"):
+            for term in re.split(r"\bAND\b|\bOR\b", body, flags=re.IGNORECASE):
+                match = _SQL_PREDICATE.match(term)
+                if not match:
+                    continue
+                qualifier, column, operator, rest = match.groups()
+                resolved = resolve(qualifier, column)
+                if resolved is None:
+                    continue
+                operator = operator.upper()
+                other = _SQL_COLUMN_ONLY.match(rest)
+                other = resolve(*other.groups()) if other and operator == "=" else None
+                if other is not None:
+                    keys[resolved[0]]["join"].append(resolved[1])
+                    keys[other[0]]["join"].append(other[1])
+                elif operator in ("=", "<=>", "IN"):
+                    keys[resolved[0]]["equality"].append(resolved[1])
+                elif operator == "LIKE":
+                    if not rest.strip().startswith("'%"):  # a leading wildcard cannot use an index
+                        keys[resolved[0]]["range"].append(resolved[1])
+                elif operator not in ("!=", "<>"):
+                    keys[resolved[0]]["range"].append(resolved[1])
+        elif keyword in ("GROUP BY", "ORDER BY"):
+            for item in body.split(","):
+                item = re.sub(r"\s+(?:ASC|DESC)\s*$", "", item.strip(), flags=re.IGNORECASE)
+                match = _SQL_COLUMN_ONLY.match(item)
+                resolved = resolve(*match.groups()) if match else None
+                if resolved is not None:
+                    sort_keys.append(resolved)
+
+    # An index can only provide the grouping or order when all of its keys come from one table
+    if sort_keys and len({table for table, _ in sort_keys}) == 1:
+        keys[sort_keys[0][0]]["sort"] = [column for _, column in sort_keys]
+
+    candidates = {}
+    for table, table_keys in keys.items():
+        columns = _dedupe(table_keys["equality"] + table_keys["sort"] + table_keys["range"][:1])
+        if columns:
+            candidates[(table, tuple(columns[:INDEX_ADVISOR_MAX_COLUMNS]))] = {}
+        for column in _dedupe(table_keys["join"]):
+            candidates.setdefault((table, (column,)), {})
+    return candidates
+
+def _index_covers(existing, wanted):
+    """
+    True if an existing index's leading keys are the wanted keys (compared case-insensitively).
+    """
+    normalize = [str(key).lower() for key in wanted]
+    return [str(key).lower() for key in existing[:len(wanted)]] == normalize
+
+def mysql_index_statement(table, columns, column_types):
+    """
+    Return the CREATE INDEX statement for the columns, using a prefix for TEXT and BLOB columns.
+    """
+    parts = []
+    for column in columns:
+        column_type = column_types.get(column, "").lower()
+        prefix = f"({INDEX_TEXT_PREFIX_LENGTH})" if "text" in column_type or "blob" in column_type else ""
+        parts.append(f"`{column}`{prefix}")
+    name = f"ix_{table}_{'_'.join(columns)}"[:64]
+    return f"CREATE INDEX `{name}` ON `{table}` ({', '.join(parts)})"
+
+def advise_mysql_indexes(connection):
+    """
+    Rank the missing indexes of the recorded MySQL workload. The benefit of an index is the
+    number of executions times the rows EXPLAIN expects the queries to examine in its table.
+    """
+    tables = get_mysql_catalog(connection)["tables"]
+    advice = {}
+    for count, query in _workload_snapshot(mysql_connection_key(connection)):
+        for (table, columns) in sql_index_candidates(query, tables):
+            if any(_index_covers(index["columns"], columns) for index in tables[table]["indexes"].values()):
+                continue
+            entry = advice.setdefault((table, columns), {"table": table, "columns": list(columns), "count": 0,
+                                                         "benefit": 0, "queries": []})
+            entry["count"] += count
+            entry["queries"].append((count, query))
+
+    for entry in advice.values():
+        for count, query in entry["queries"]:
+            # EXPLAIN names tables by their alias in the query
+            aliases = {table.lower(): table for table in tables}
+            for table, alias in _SQL_TABLE_REFERENCE.findall(query):
+                if alias and alias.upper() not in _SQL_KEYWORDS:
+                    aliases[alias.lower()] = table
+            plan = explain_mysql_query(connection, query)
+            if plan is None:
+                continue
+            entry["benefit"] += count * max((rows for name, rows in plan["table_rows"].items()
+                                             if aliases.get(str(name).lower(), name) == entry["table"]), default=0)
+        entry["statement"] = mysql_index_statement(entry["table"], entry["columns"], tables[entry["table"]]["column_types"])
+    return sorted(advice.values(), key=lambda entry: (entry["benefit"], entry["count"]), reverse=True)
+
+def mongo_index_candidates(collection_name, query_type, query):
+    """
+    Derive the indexes that would support a find or aggregate query: equality fields, then sort or
+    $group keys, then one range field; $lookup stages add their foreignField on the joined collection.
+    Returns {(collection, ((field, direction), ...)): {}}.
+    """
+    equality, ranges, sort = [], [], []
+
+    def read_filter(condition):
+        for field, value in (condition or {}).items():
+            if field == "$and":
+                for part in value:
+                    read_filter(part)
+            elif field.startswith("$"):
+                continue  # $or, $expr, ... need separate indexes per branch
+            elif isinstance(value, dict) and any(key.startswith("$") for key in value):
+                if "$eq" in value or "$in" in value:
+                    equality.append(field)
+                elif any(key in value for key in _MONGO_RANGE_OPERATORS):
+                    ranges.append(field)
+                elif str(value.get("$regex", "")).startswith("^"):
+                    ranges.append(field)
+            else:
+                equality.append(field)
+
+    candidates = {}
+    if query_type == "aggregate":
+        leading = True
+        for stage in query:
+            name, body = next(iter(stage.items()))
+            if name == "$lookup" and isinstance(body, dict) and body.get("foreignField"):
+                candidates[(body["from"], ((body["foreignField"], 1),))] = {}
+            # Only the stages at the start of a pipeline can use an index
+            if not leading:
+                continue
+            if name == "$match":
+                read_filter(body)
+            elif name == "$sort":
+                sort.extend((field, direction) for field, direction in body.items())
+                leading = False
+            elif name == "$group":
+                group_key = body.get("_id")
+                if isinstance(group_key, str) and group_key.startswith("$"):
+                    sort.append((group_key[1:], 1))
+                leading = False
+            else:
+                leading = False
+    else:
+        if query and set(query) <= {"filter", "sort", "limit"}:
+            read_filter(query.get("filter"))
+            sort_spec = query.get("sort") or []
+            sort.extend(sort_spec.items() if isinstance(sort_spec, dict) else sort_spec)
+        else:
+            read_filter(query)
+
+    keys = [(field, 1) for field in _dedupe(equality)]
+    keys += [(field, direction) for field, direction in sort if field not in equality]
+    keys += [(field, 1) for field in _dedupe(ranges)[:1] if field not in equality and field not in dict(sort)]
+    if keys:
+        candidates[(collection_name, tuple(keys[:INDEX_ADVISOR_MAX_COLUMNS]))] = {}
+    return candidates
+
+def _mongo_index_covers(existing, wanted):
+    """
+    True if an existing index key pattern starts with the wanted keys, in the same or the fully reversed direction.
+    """
+    prefix = [(field, int(direction)) for field, direction in existing[:len(wanted)]
+              if isinstance(direction, (int, float))]
+    wanted = [(field, int(direction)) for field, direction in wanted]
+    return prefix == wanted or prefix == [(field, -direction) for field, direction in wanted]
+
+def advise_mongodb_indexes(db):
+    """
+    Rank the missing indexes of the recorded MongoDB workload by executions times the documents
+    examined: the whole collection when explain shows a collection scan or an in-memory sort.
+    """
+    existing = {}
+    advice = {}
+    for count, (collection_name, query_type, query) in _workload_snapshot(db):
+        for (target, keys) in mongo_index_candidates(collection_name, query_type, query):
+            if target not in existing:
+                existing[target] = [index["key"] for index in db[target].index_information().values()]
+            if any(_mongo_index_covers(index, keys) for index in existing[target]):
+                continue
+            entry = advice.setdefault((target, keys), {"collection": target, "keys": list(keys), "count": 0,
+                                                       "benefit": 0, "queries": []})
+            entry["count"] += count
+            entry["queries"].append((count, (collection_name, query_type, query)))
+
+    for entry in advice.values():
+        documents = db[entry["collection"]].estimated_document_count()
+        for count, (collection_name, query_type, query) in entry["queries"]:
+            if collection_name != entry["collection"]:
+                entry["benefit"] += count * documents  # $lookup without an index scans the joined collection
+                continue
+            plan = explain_mongodb_query(db[collection_name], query_type, query)
+            if plan is not None and (plan["full_scans"] or plan["notes"]):
+                entry["benefit"] += count * documents
+        entry["statement"] = f"db.{entry['collection']}.createIndex({json.dumps(dict(entry['keys']))})"
+    return sorted(advice.values(), key=lambda entry: (entry["benefit"], entry["count"]), reverse=True)
+
+def index_advisor(connection=None, db=None, db_type="MySQL"):
+    """
+    Show the ranked index suggestions for the queries executed so far and create the chosen ones after a preview.
+    """
+    advice = advise_mysql_indexes(connection) if db_type == "MySQL" else advise_mongodb_indexes(db)
+    if not advice:
+        print("No missing indexes found for the queries executed so far.")
+        return
+
+    print("\nSuggested indexes (most beneficial first):")
+    for number, entry in enumerate(advice, start=1):
+        target = entry["table"] if db_type == "MySQL" else entry["collection"]
+        print(f"{number}. {target}: {entry['statement']}")
+        print(f"   used by {len(entry['queries'])} query shapes, {entry['count']} executions, "
+              f"estimated rows examined without it: {entry['benefit']:,}")
+
+    selection = input("Enter the numbers of the indexes to create (comma-separated), or press Enter to skip: ").strip()
+    chosen = []
+    for item in filter(None, (part.strip() for part in selection.split(","))):
+        if item.isdigit() and 1 <= int(item) <= len(advice):
+            chosen.append(advice[int(item) - 1])
+        else:
+            print(f"Ignoring invalid choice: {item}")
+    if not chosen:
+        return
+
+    print("\nThe following statements will be run:")
+    for entry in chosen:
+        print(f"  {entry['statement']}")
+    if input("Create these indexes? (yes/no): ").strip().lower() != "yes":
+        print("No indexes created.")
+        return
+
+    for entry in chosen:
+        try:
+            if db_type == "MySQL":
+                cursor = connection.cursor()
+                cursor.execute(entry["statement"])
+                cursor.close()
+            else:
+                db[entry["collection"]].create_index(entry["keys"])
+            print(f"Created: {entry['statement']}")
+        except Exception as e:
+            print(f"Error creating index: {e}")
+    if db_type == "MySQL":
+        invalidate_mysql_catalog(connection)
+
+# Candidate probes run on a thread pool; MySQL probes each borrow a pooled connection,
+# so stay below the pool size to leave the menu connection and a spare free
+VALIDATION_WORKERS = 6
+
+def validate_candidates_concurrently(candidates, validate, max_valid, max_attempts=None, workers=VALIDATION_WORKERS, label="query",
+                                     ordered=False, report=print):
+    """
+    Run validate(candidate) for up to max_attempts candidates on a thread pool and return the first
+    max_valid that pass, in candidate order. Probes that have not started yet are cancelled once
+    enough have passed; probes already running finish in the background.
+    By default the first probes to finish win; with ordered=True results are taken in candidate order,
+    so the same candidates give the same queries as a serial run. Failures are passed to report,
+    which may be called from the worker threads.
+    """
+    candidates = list(itertools.islice(candidates, max_attempts))
+    valid = []
+
+    def report_failure(candidate, error):
+        report(f"Query validation failed: {candidate[label]}\nError: {error}")
+
+    if workers <= 1 or len(candidates) <= 1:
+        for candidate in candidates:
+            if len(valid) >= max_valid:
+                break
             try:
-                cursor.execute(query_example["query"])
-                result = cursor.fetchall()
+                if validate(candidate):
+                    valid.append(candidate)
+            except Exception as e:
+                report_failure(candidate, e)
+        return valid
 
-                if result:  # Ensure the query returns results
-                    valid_queries.append(query_example)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(candidates)))
+    futures = {executor.submit(validate, candidate): index for index, candidate in enumerate(candidates)}
+    passed = []
+    try:
+        for future in futures if ordered else concurrent.futures.as_completed(futures):
+            index = futures[future]
+            try:
+                if future.result():
+                    passed.append(index)
             except Exception as e:
-                print(f"Query failed: {query_example['query']}\nError: {e}")
-            finally:
-                attempts += 1
+                report_failure(candidates[index], e)
+            if len(passed) >= max_valid:
+                break
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+    return [candidates[index] for index in sorted(passed)]
+
+def validate_mysql_candidates(connection, candidates, max_valid, max_attempts=None, report=print):
+    """
+    Validate generated MySQL queries concurrently, each probe on its own pooled connection.
+    Connections not opened through a pool, and connections that are themselves borrowed (service
+    workers, the warm-up), are probed one at a time on the connection itself.
+    """
+    if getattr(connection, "pool_name", None) is None or connection in _borrowed_connections:
+        cursor = connection.cursor()
+        return validate_candidates_concurrently(candidates, lambda candidate: validate_mysql_query(cursor, candidate["query"]),
+                                                max_valid, max_attempts, workers=1, report=report)
 
-    if valid_queries:
-        return valid_queries
-    else:
-        print("No meaningful sample queries found or not enough columns to generate queries.")
-        return []
+    database = connection.database
 
-def generate_mysql_construct_queries(connection, construct, max_queries=2):
-    if connection is None:
-        print("MySQL connection is not available.")
-        return []
+    def validate(candidate):
+        probe_connection = borrow_mysql_connection(connection, database)
+        try:
+            return validate_mysql_query(probe_connection.cursor(), candidate["query"])
+        finally:
+            probe_connection.close()
 
+    # A seeded run must pick the same candidates every time
+    return validate_candidates_concurrently(candidates, validate, max_valid, max_attempts,
+                                            ordered=QUERY_LIBRARY_SEED is not None, report=report)
+
+def validate_mongodb_candidates(db, candidates, max_valid, max_attempts=None, report=print):
+    """
+    Validate generated MongoDB queries concurrently over the shared client.
+    """
+    return validate_candidates_concurrently(candidates, lambda query: validate_mongodb_query(db[query["collection"]], query),
+                                            max_valid, max_attempts, label="title", ordered=QUERY_LIBRARY_SEED is not None,
+                                            report=report)
+
+# Column statistics: a random sample of up to COLUMN_STATS_SAMPLE_ROWS rows per table, cached in the
+# catalog entry of the table. Generators take their literals from these so predicates match real rows.
+COLUMN_STATS_SAMPLE_ROWS = 1000
+# Tables with an integer primary key are sampled as this many blocks of consecutive keys starting at
+# random key values (index range reads); other tables by a RAND() filter over one scan
+COLUMN_STATS_SAMPLE_BLOCKS = 10
+_INTEGER_COLUMN_TYPE = re.compile(r"(tiny|small|medium|big)?int\b", re.IGNORECASE)
+STATS_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+_UNPROFILED_COLUMN_TYPES = ("blob", "binary", "geometry", "point", "polygon", "linestring", "json")
+
+def _comparable_values(values):
+    """
+    Return the largest group of mutually comparable values: numbers, strings or dates.
+    """
+    numbers = [v for v in values if isinstance(v, (int, float, decimal.Decimal)) and not isinstance(v, bool)]
+    texts = [v for v in values if isinstance(v, str)]
+    dates = [v for v in values if isinstance(v, (datetime.date, datetime.time, datetime.timedelta))]
+    return max((numbers, texts, dates), key=len)
+
+def summarize_values(values, total=None):
+    """
+    Approximate statistics of one column from sampled values (None is NULL): null ratio, distinct count,
+    estimated cardinality over total rows, min/max, quantiles and the most common values.
+    """
+    sampled = len(values)
+    present = [value for value in values if value is not None]
+    counts = Counter(present)
+    singletons = sum(1 for count in counts.values() if count == 1)
+    if total and present and total > sampled:
+        # GEE estimator: values seen once stand for many unseen ones
+        cardinality = round(math.sqrt(total / sampled) * singletons + (len(counts) - singletons))
+    else:
+        cardinality = len(counts)
+
+    ordered = sorted(_comparable_values(present))
+    return {
+        "sampled": sampled,
+        "null_ratio": (sampled - len(present)) / sampled if sampled else 0.0,
+        "distinct": len(counts),
+        "cardinality": cardinality,
+        "min": ordered[0] if ordered else None,
+        "max": ordered[-1] if ordered else None,
+        # Every quantile is a value that occurs in the data, so predicates built on it are never empty
+        "quantiles": {q: ordered[int(q * (len(ordered) - 1))] for q in STATS_QUANTILES} if ordered else {},
+        "top_values": counts.most_common(5),
+    }
+
+def _sample_mysql_rows(cursor, table_name, entry, column_list, estimate):
+    """
+    Read a random sample of about COLUMN_STATS_SAMPLE_ROWS rows of the table, or all of a smaller one.
+    With --seed the sample is reproducible.
+    """
+    limit = COLUMN_STATS_SAMPLE_ROWS
+    if estimate <= limit:
+        cursor.execute(f"SELECT {column_list} FROM `{table_name}` LIMIT {limit}")
+        rows = cursor.fetchall()
+        if len(rows) < limit:
+            return rows  # The whole table (the estimate may be low)
+    rng = random if QUERY_LIBRARY_SEED is None else random.Random(f"{QUERY_LIBRARY_SEED}/{table_name}")
+    keys = entry["primary_keys"]
+    if len(keys) == 1 and _INTEGER_COLUMN_TYPE.match(entry["column_types"].get(keys[0], "")):
+        key = keys[0]
+        cursor.execute(f"SELECT MIN(`{key}`), MAX(`{key}`) FROM `{table_name}`")
+        low, high = cursor.fetchall()[0]
+        if low is None:
+            return []
+        rows, next_key = [], low
+        block = -(-limit // COLUMN_STATS_SAMPLE_BLOCKS)
+        for start in sorted(rng.randint(low, high) for _ in range(COLUMN_STATS_SAMPLE_BLOCKS)):
+            # Blocks never overlap: each starts after the last key of the one before
+            cursor.execute(f"SELECT {column_list}, `{key}` FROM `{table_name}` WHERE `{key}` >= %s "
+                           f"ORDER BY `{key}` LIMIT {block}", (max(start, next_key),))
+            fetched = cursor.fetchall()
+            if fetched:
+                rows.extend(row[:-1] for row in fetched)
+                next_key = fetched[-1][-1] + 1
+        return rows
+    # Bernoulli sample: each row is kept with a probability that yields a little over limit rows
+    # (TABLE_ROWS is an estimate), then cut down to limit here rather than by a LIMIT that would
+    # drop the end of the table
+    probability = min(1.0, 1.2 * limit / max(estimate, 1))
+    seed = "" if QUERY_LIBRARY_SEED is None else rng.randrange(2 ** 31)
+    cursor.execute(f"SELECT {column_list} FROM `{table_name}` WHERE RAND({seed}) < {probability} LIMIT {2 * limit}")
+    rows = cursor.fetchall()
+    return rng.sample(rows, limit) if len(rows) > limit else rows
+
+def profile_mysql_table(connection, table_name):
+    """
+    Compute column statistics for a table from a random sample of COLUMN_STATS_SAMPLE_ROWS rows.
+    Literals stay non-empty because they are taken from rows that exist.
+    """
+    entry = get_mysql_catalog(connection)["tables"][table_name]
+    columns = [name for name, column_type in entry["columns"]
+               if not any(kind in column_type.lower() for kind in _UNPROFILED_COLUMN_TYPES)]
     cursor = connection.cursor()
-    cursor.execute("SHOW TABLES;")
-    tables = cursor.fetchall()
+    try:
+        cursor.execute("""
+            SELECT TABLE_ROWS FROM INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, (table_name,))
+        estimate = cursor.fetchall()
+        if not columns:
+            return {"rows": estimate[0][0] if estimate else None, "columns": {}}
+        column_list = ", ".join(f"`{column}`" for column in columns)
+        rows = _sample_mysql_rows(cursor, table_name, entry, column_list, (estimate[0][0] or 0) if estimate else 0)
+    finally:
+        cursor.close()
 
-    if not tables:
-        print("No tables found in the database.")
-        return []
+    total = max((estimate[0][0] or 0) if estimate else 0, len(rows))
+    return {"rows": total,
+            "columns": {column: summarize_values([row[index] for row in rows], total) for index, column in enumerate(columns)}}
 
-    valid_queries = []
-    attempts = 0
+def get_table_statistics(connection, table_name):
+    """
+    Return the cached column statistics of a table, profiling it on first use.
+    They live in the catalog, so refreshing or invalidating the catalog drops them as well.
+    """
+    entry = get_mysql_catalog(connection)["tables"][table_name]
+    if "statistics" not in entry:
+        entry["statistics"] = profile_mysql_table(connection, table_name)
+    return entry["statistics"]
 
-    for table in tables:
-        table_name = table[0]
-        cursor.execute(f"SHOW COLUMNS FROM {table_name};")
-        columns = cursor.fetchall()
+def column_quantile(statistics, column, q):
+    """
+    Return the q-quantile of a profiled column, or None if it has no comparable values.
+    """
+    return statistics.get(column, {}).get("quantiles", {}).get(q)
 
-        column_names = [column[0] for column in columns]
-        column_types = {column[0]: column[1] for column in columns}
+def common_value(statistics, column):
+    """
+    Return the most common non-null value of a profiled column, or None.
+    """
+    top_values = statistics.get(column, {}).get("top_values")
+    return top_values[0][0] if top_values else None
 
-        cursor.execute(f"SHOW INDEX FROM {table_name} WHERE Key_name = 'PRIMARY';")
-        primary_keys = [index[4] for index in cursor.fetchall()]
+def text_fragment(value):
+    """
+    A leading fragment of a common text value, used for substring and prefix predicates.
+    """
+    value = str(value).strip()
+    return value if len(value) <= 3 else value[:max(3, len(value) // 2)]
 
-        cursor.execute(f"""
-                SELECT COLUMN_NAME
-                FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
-                WHERE TABLE_NAME = '{table_name}' AND TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL;
-            """)
-        foreign_keys = [row[0] for row in cursor.fetchall()]
+def sql_literal(value):
+    """
+    Render a Python value as a SQL literal, escaping quotes and backslashes in strings.
+    """
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return f"X'{bytes(value).hex()}'"
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat(sep=" ")
+    elif isinstance(value, (datetime.date, datetime.time)):
+        value = value.isoformat()
+    text = str(value).replace("\\", "\\\\").replace("'", "''").replace("\0", "\\0")
+    return f"'{text}'"
+
+def sql_like_contains(fragment):
+    """
+    Render a LIKE pattern literal matching values that contain the fragment.
+    """
+    escaped = fragment.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return sql_literal(f"%{escaped}%")
 
-        id_columns = set(primary_keys + foreign_keys)
+# Generated candidates are drawn lazily: each generator describes its candidates as families of known
+# size over the cross product of some columns, and only the drawn indexes are turned into queries
+def candidate_family(build, *axes):
+    """
+    A family of candidates over the cross product of the axes (lists). build(*items) returns the
+    candidate for one combination of items, or None if that combination has no usable query.
+    """
+    sizes = [len(axis) for axis in axes]
 
-        column_types = {col[0]: col[1] for col in columns}
+    def build_at(index):
+        items = []
+        for axis, size in zip(axes[::-1], sizes[::-1]):
+            index, position = divmod(index, size)
+            items.append(axis[position])
+        return build(*items[::-1])
 
-        numeric_columns = [col for col, dtype in column_types.items() if "int" in dtype or "float" in dtype]
-        text_columns = [col for col, dtype in column_types.items() if "varchar" in dtype or "text" in dtype]
-        date_columns = [col for col, dtype in column_types.items() if "date" in dtype or "time" in dtype]
+    return {"size": math.prod(sizes), "build": build_at}
 
-        numeric_columns_for_aggregation = [
-            col for col in numeric_columns if col not in id_columns
-        ]
+def weigh_equally(families):
+    """
+    Give a group of families (e.g. those of one table) a combined weight of 1, so every group is
+    drawn equally often however many columns it has.
+    """
+    total = sum(family["size"] for family in families)
+    for family in families:
+        family["weight"] = family["size"] / total if total else 0
+    return families
 
-        group_by_columns = text_columns + primary_keys
-
-        query_patterns = []
-        if construct == "GROUP BY":
-            for group_by_col in group_by_columns:
-                for numeric_col in numeric_columns_for_aggregation:
-                    query_patterns.append({
-                        "title": f"Total {numeric_col} by {group_by_col} in {table_name}",
-                        "query": f"SELECT {group_by_col}, SUM({numeric_col}) AS total_{numeric_col} FROM {table_name} GROUP BY {group_by_col};",
-                        "description": f"This query groups the data by '{group_by_col}' and calculates the total sum "
-                                       f"of '{numeric_col}' for each group."
-                    })
-                for numeric_col in numeric_columns_for_aggregation:
-                    query_patterns.append({
-                        "title": f"Average {numeric_col} by {group_by_col} in {table_name}",
-                        "query": f"SELECT {group_by_col}, AVG({numeric_col}) AS avg_{numeric_col} FROM {table_name} GROUP BY {group_by_col};",
-                        "description": f"This query groups the data by '{group_by_col}' and calculates the average value of '{numeric_col}' for each group."
-                    })
-                query_patterns.append({
-                    "title": f"Count of records grouped by {group_by_col} in {table_name}",
-                    "query": f"SELECT {group_by_col}, COUNT(*) AS record_count FROM {table_name} GROUP BY {group_by_col};",
-                    "description": f"This query groups the data by '{group_by_col}' and counts the number of records in each group."
-                })
-
-        elif construct == "HAVING":
-            for group_by_col in group_by_columns:
-                for numeric_col in numeric_columns_for_aggregation:
-                    query_patterns.append({
-                        "title": f"Total {numeric_col} by {group_by_col} with HAVING in {table_name}",
-                        "query": f"SELECT {group_by_col}, SUM({numeric_col}) AS total_{numeric_col} FROM {table_name} GROUP BY {group_by_col} HAVING total_{numeric_col} > 0;",
-                        "description": f"This query groups the data by '{group_by_col}', calculates the total sum of '{numeric_col}', and filters groups where the sum exceeds 0."
-                    })
-                    query_patterns.append({
-                        "title": f"Average {numeric_col} by {group_by_col} with HAVING in {table_name}",
-                        "query": f"SELECT {group_by_col}, AVG({numeric_col}) AS avg_{numeric_col} FROM {table_name} GROUP BY {group_by_col} HAVING avg_{numeric_col} > 0;",
-                        "description": f"This query groups the data by '{group_by_col}', calculates the average value of '{numeric_col}', and filters groups where the average exceeds 0."
-                    })
-                query_patterns.append({
-                    "title": f"Count of records grouped by {group_by_col} with HAVING in {table_name}",
-                    "query": f"SELECT {group_by_col}, COUNT(*) AS record_count FROM {table_name} GROUP BY {group_by_col} HAVING record_count > 1;",
-                    "description": f"This query groups the data by '{group_by_col}', counts the number of records in each group, and filters groups where the count exceeds 1."
-                })
-
-
-        elif construct == "JOIN":
-            for other_table in tables:
-                other_table_name = other_table[0]
-                if other_table_name != table_name:
-                    cursor.execute(f"SHOW COLUMNS FROM {other_table_name};")
-                    other_columns = [col[0] for col in cursor.fetchall()]
-                    if primary_keys and other_columns:
-                        query_patterns.append({
-                            "title": f"Join {table_name} with {other_table_name}",
-                            "query": f"SELECT a.*, b.* FROM {table_name} a JOIN {other_table_name} b ON a.{primary_keys[0]} = b.{other_columns[0]} LIMIT 10;",
-                            "description": f"This query joins '{table_name}' with '{other_table_name}' on the key '{primary_keys[0]}'."
-                        })
-
-        elif construct == "EXISTS":
-            for col in text_columns:
-                query_patterns.append({
-                    "title": f"Select records if EXISTS in {table_name}",
-                    "query": f"SELECT * FROM {table_name} t1 WHERE EXISTS (SELECT 1 FROM {table_name} t2 WHERE t1.{col} = t2.{col});",
-                    "description": f"This query checks if a record exists in '{table_name}' where '{col}' matches."
-                })
-
-        elif construct == "ORDER BY":
-            for col in numeric_columns + text_columns + date_columns:
-                query_patterns.append({
-                    "title": f"Order records by {col} ascending in {table_name}",
-                    "query": f"SELECT * FROM {table_name} ORDER BY {col} ASC;",
-                    "description": f"This query orders the data in ascending order based on the column '{col}'."
-                })
-                query_patterns.append({
-                    "title": f"Order records by {col} descending in {table_name}",
-                    "query": f"SELECT * FROM {table_name} ORDER BY {col} DESC;",
-                    "description": f"This query orders the data in descending order based on the column '{col}'."
-                })
-
-    while len(valid_queries) < max_queries and attempts < max_queries * 5:
-        if not query_patterns:
-            break
-        query_example = random.choice(query_patterns)
-        try:
-            cursor.execute(query_example["query"])
-            result = cursor.fetchall()
+def sample_candidates(families, limit, rng=None):
+    """
+    Yield up to limit distinct candidates drawn at random from the families without building the
+    others. A family is picked in proportion to its "weight" (its size by default), then a uniformly
+    random index inside it; exhausted families drop out, so every candidate is drawn at most once.
+    """
+    rng = rng or random
+    families = [family for family in families if family["size"] and family.get("weight", 1)]
+    drawn = {}  # position -> indexes drawn so far
+    weights = [family.get("weight", family["size"]) for family in families]
+    yielded = 0
+    while yielded < limit and any(weights):
+        position = rng.choices(range(len(families)), weights=weights)[0]
+        family = families[position]
+        taken = drawn.setdefault(position, set())
+        index = rng.randrange(family["size"])
+        while index in taken:
+            index = rng.randrange(family["size"])
+        taken.add(index)
+        if len(taken) == family["size"]:
+            weights[position] = 0
+        candidate = family["build"](index)
+        if candidate is not None:
+            yielded += 1
+            yield candidate
+
+def _mysql_column_kinds(entry):
+    """
+    Return the numeric columns (without key columns), text columns and date columns of a catalog table.
+    """
+    id_columns = set(entry["primary_keys"] + entry["foreign_keys"])
+    column_types = entry["column_types"]
+    numeric_columns = [col for col, dtype in column_types.items() if "int" in dtype or "float" in dtype]
+    text_columns = [col for col, dtype in column_types.items() if "varchar" in dtype or "text" in dtype]
+    date_columns = [col for col, dtype in column_types.items() if "date" in dtype or "time" in dtype]
+    return numeric_columns, [col for col in numeric_columns if col not in id_columns], text_columns, date_columns
+
+def _join_families(table_name, join_edges, title, description):
+    """
+    The family of foreign key joins of a table; title and description are format strings over table, other and keys.
+    """
+    def join(edge):
+        conditions = " AND ".join(f"a.{column} = b.{other}" for column, other in edge["on"])
+        key_columns = ", ".join(column for column, _ in edge["on"])
+        return {
+            "title": title.format(table=table_name, other=edge["table"]),
+            "query": f"SELECT a.*, b.* FROM {table_name} a JOIN {edge['table']} b ON {conditions} LIMIT 10;",
+            "description": description.format(table=table_name, other=edge["table"], keys=key_columns)
+        }
+    return candidate_family(join, join_edges)
+
+def mysql_sample_families(connection, table_name, entry, join_edges):
+    """
+    The candidate families of generate_mysql_sample_queries for one table. Column statistics are
+    only read when a candidate that needs them is drawn.
+    """
+    _, numeric_columns, text_columns, _ = _mysql_column_kinds(entry)
+
+    def statistics():
+        return get_table_statistics(connection, table_name)["columns"]
+
+    def total(numeric_col, text_col):
+        return {
+            "title": f"Total {numeric_col} by {text_col}",
+            "query": f"SELECT {text_col}, SUM({numeric_col}) AS total FROM {table_name} GROUP BY {text_col} LIMIT 10;",
+            "description": f"This query calculates the total of {numeric_col} grouped by {text_col}, inspired by the '{table_name}' table."
+        }
+
+    def total_above_median(numeric_col, text_col):
+        # A group's total is at least its largest value, so some group exceeds the median value
+        median = column_quantile(statistics(), numeric_col, 0.5)
+        if median is None:
+            return None
+        return {
+            "title": f"Filter Groups by {numeric_col} Total",
+            "query": f"SELECT {text_col}, SUM({numeric_col}) AS total FROM {table_name} GROUP BY {text_col} HAVING total > {sql_literal(median)} LIMIT 10;",
+            "description": f"This query filters groups where the total {numeric_col} exceeds {median}, grouped by {text_col}, inspired by the '{table_name}' table."
+        }
+
+    def ordered(numeric_col, direction):
+        if direction == "DESC":
+            return {
+                "title": f"Top 10 Records Ordered by {numeric_col}",
+                "query": f"SELECT * FROM {table_name} ORDER BY {numeric_col} DESC LIMIT 10;",
+                "description": f"This query retrieves the top 10 records ordered by {numeric_col} in descending order, inspired by the '{table_name}' table."
+            }
+        return {
+            "title": f"Bottom 10 Records Ordered by {numeric_col}",
+            "query": f"SELECT * FROM {table_name} ORDER BY {numeric_col} ASC LIMIT 10;",
+            "description": f"This query retrieves the bottom 10 records ordered by {numeric_col} in ascending order, inspired by the '{table_name}' table."
+        }
+
+    def filtered(numeric_col, variant):
+        # Quartiles of the sampled values keep the filters selective but non-empty
+        column_statistics = statistics()
+        lower, upper = column_quantile(column_statistics, numeric_col, 0.25), column_quantile(column_statistics, numeric_col, 0.75)
+        if lower is None:
+            return None
+        if variant == "above":
+            return {
+                "title": f"Select rows where {numeric_col} > {lower}",
+                "query": f"SELECT * FROM {table_name} WHERE {numeric_col} > {sql_literal(lower)} LIMIT 10;",
+                "description": f"This query selects rows where {numeric_col} is greater than {lower}, inspired by the '{table_name}' table."
+            }
+        return {
+            "title": f"Select rows where {numeric_col} is between two values",
+            "query": f"SELECT * FROM {table_name} WHERE {numeric_col} BETWEEN {sql_literal(lower)} AND {sql_literal(upper)} LIMIT 10;",
+            "description": f"This query selects rows where {numeric_col} is between {lower} and {upper}, inspired by the '{table_name}' table."
+        }
+
+    def search(text_col):
+        value = common_value(statistics(), text_col)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        fragment = text_fragment(value)
+        return {
+            "title": f"Search for Partial Matches in {text_col}",
+            "query": f"SELECT * FROM {table_name} WHERE {text_col} LIKE {sql_like_contains(fragment)} LIMIT 10;",
+            "description": f"This query searches for rows where {text_col} contains the substring '{fragment}', inspired by the '{table_name}' table."
+        }
+
+    return [
+        candidate_family(total, numeric_columns, text_columns),
+        candidate_family(total_above_median, numeric_columns, text_columns),
+        candidate_family(ordered, numeric_columns, ("DESC", "ASC")),
+        candidate_family(filtered, numeric_columns, ("above", "between")),
+        candidate_family(search, text_columns),
+        # Joins follow foreign keys, preferring those indexed on both sides
+        _join_families(table_name, [edge for edge in join_edges if edge["indexed"]] or join_edges,
+                       "Join {table} with {other}",
+                       "This query joins the '{table}' table with the '{other}' table using the foreign key {keys}.")
+    ]
+
+def generate_mysql_sample_queries(connection, max_queries=2, rng=None, report=print):
+    if connection is None:
+        report("MySQL connection is not available.")
+        return []
 
-            if result:
-                valid_queries.append(query_example)
-                query_patterns.remove(query_example)
-        except Exception as e:
-            print(f"Query validation failed: {query_example['query']}\nError: {e}")
-        finally:
-            attempts += 1
+    catalog_tables = get_mysql_catalog(connection)["tables"]
+    join_graph = get_join_graph(connection)
+
+    if not catalog_tables:
+        report("No tables found in the database.")
+        return []
+
+    # Every table is drawn equally often, then a random query of that table; up to
+    # max_queries * 5 candidates are validated concurrently
+    families = []
+    for table_name, entry in catalog_tables.items():
+        families.extend(weigh_equally(mysql_sample_families(connection, table_name, entry, join_graph[table_name])))
+    candidates = sample_candidates(families, max_queries * 5, rng)
+
+    # Ensure the queries return results
+    valid_queries = validate_mysql_candidates(connection, candidates, max_queries, max_attempts=max_queries * 5, report=report)
 
     if valid_queries:
         return valid_queries
     else:
-        print("No meaningful sample queries found or not enough columns to generate queries.")
+        report("No meaningful sample queries found or not enough columns to generate queries.")
         return []
 
-def generate_mongodb_sample_queries(db, max_queries=1):
+def mysql_construct_families(connection, construct, table_name, entry, join_edges):
+    """
+    The candidate families of generate_mysql_construct_queries for one table.
+    """
+    numeric_columns, numeric_columns_for_aggregation, text_columns, date_columns = _mysql_column_kinds(entry)
+    primary_keys = entry["primary_keys"]
+    group_by_columns = text_columns + primary_keys
 
-    if db is None:
-        print("MongoDB connection is not available.")
-        return []
+    def statistics():
+        return get_table_statistics(connection, table_name)["columns"]
 
-    collections = db.list_collection_names()
+    if construct == "GROUP BY":
+        def total(group_by_col, numeric_col):
+            return {
+                "title": f"Total {numeric_col} by {group_by_col} in {table_name}",
+                "query": f"SELECT {group_by_col}, SUM({numeric_col}) AS total_{numeric_col} FROM {table_name} GROUP BY {group_by_col};",
+                "description": f"This query groups the data by '{group_by_col}' and calculates the total sum "
+                               f"of '{numeric_col}' for each group."
+            }
 
-    if not collections:
-        print("No collections found in the MongoDB database.")
+        def average(group_by_col, numeric_col):
+            return {
+                "title": f"Average {numeric_col} by {group_by_col} in {table_name}",
+                "query": f"SELECT {group_by_col}, AVG({numeric_col}) AS avg_{numeric_col} FROM {table_name} GROUP BY {group_by_col};",
+                "description": f"This query groups the data by '{group_by_col}' and calculates the average value of '{numeric_col}' for each group."
+            }
+
+        def count(group_by_col):
+            return {
+                "title": f"Count of records grouped by {group_by_col} in {table_name}",
+                "query": f"SELECT {group_by_col}, COUNT(*) AS record_count FROM {table_name} GROUP BY {group_by_col};",
+                "description": f"This query groups the data by '{group_by_col}' and counts the number of records in each group."
+            }
+
+        return [candidate_family(total, group_by_columns, numeric_columns_for_aggregation),
+                candidate_family(average, group_by_columns, numeric_columns_for_aggregation),
+                candidate_family(count, group_by_columns)]
+
+    if construct == "HAVING":
+        # Thresholds from the column's distribution: some group total exceeds the median value,
+        # and some group average exceeds the lower quartile
+        def total_above(group_by_col, numeric_col):
+            median = column_quantile(statistics(), numeric_col, 0.5)
+            if median is None:
+                return None
+            return {
+                "title": f"Total {numeric_col} by {group_by_col} with HAVING in {table_name}",
+                "query": f"SELECT {group_by_col}, SUM({numeric_col}) AS total_{numeric_col} FROM {table_name} GROUP BY {group_by_col} HAVING total_{numeric_col} > {sql_literal(median)};",
+                "description": f"This query groups the data by '{group_by_col}', calculates the total sum of '{numeric_col}', and filters groups where the sum exceeds {median}."
+            }
+
+        def average_above(group_by_col, numeric_col):
+            lower = column_quantile(statistics(), numeric_col, 0.25)
+            if lower is None:
+                return None
+            return {
+                "title": f"Average {numeric_col} by {group_by_col} with HAVING in {table_name}",
+                "query": f"SELECT {group_by_col}, AVG({numeric_col}) AS avg_{numeric_col} FROM {table_name} GROUP BY {group_by_col} HAVING avg_{numeric_col} > {sql_literal(lower)};",
+                "description": f"This query groups the data by '{group_by_col}', calculates the average value of '{numeric_col}', and filters groups where the average exceeds {lower}."
+            }
+
+        def count_above(group_by_col):
+            return {
+                "title": f"Count of records grouped by {group_by_col} with HAVING in {table_name}",
+                "query": f"SELECT {group_by_col}, COUNT(*) AS record_count FROM {table_name} GROUP BY {group_by_col} HAVING record_count > 1;",
+                "description": f"This query groups the data by '{group_by_col}', counts the number of records in each group, and filters groups where the count exceeds 1."
+            }
+
+        return [candidate_family(total_above, group_by_columns, numeric_columns_for_aggregation),
+                candidate_family(average_above, group_by_columns, numeric_columns_for_aggregation),
+                candidate_family(count_above, group_by_columns)]
+
+    if construct == "JOIN":
+        return [_join_families(table_name, join_edges, "Join {table} with {other}",
+                               "This query joins '{table}' with '{other}' on the key '{keys}'.")]
+
+    if construct == "EXISTS":
+        def exists(col):
+            return {
+                "title": f"Select records if EXISTS in {table_name}",
+                "query": f"SELECT * FROM {table_name} t1 WHERE EXISTS (SELECT 1 FROM {table_name} t2 WHERE t1.{col} = t2.{col});",
+                "description": f"This query checks if a record exists in '{table_name}' where '{col}' matches."
+            }
+        return [candidate_family(exists, text_columns)]
+
+    if construct == "ORDER BY":
+        def ordered(col, direction):
+            order = "ascending" if direction == "ASC" else "descending"
+            return {
+                "title": f"Order records by {col} {order} in {table_name}",
+                "query": f"SELECT * FROM {table_name} ORDER BY {col} {direction};",
+                "description": f"This query orders the data in {order} order based on the column '{col}'."
+            }
+        return [candidate_family(ordered, numeric_columns + text_columns + date_columns, ("ASC", "DESC"))]
+
+    return []
+
+def generate_mysql_construct_queries(connection, construct, max_queries=2, rng=None, report=print):
+    if connection is None:
+        report("MySQL connection is not available.")
         return []
 
-    valid_queries = []
+    catalog_tables = get_mysql_catalog(connection)["tables"]
+    join_graph = get_join_graph(connection)
 
-    for collection_name in collections:
-        collection = db[collection_name]
-        sample_doc = collection.find_one()
-        if not sample_doc:
-            print(f"Collection '{collection_name}' is empty. Skipping.")
-            continue
+    if not catalog_tables:
+        report("No tables found in the database.")
+        return []
 
-        numeric_fields = [key for key, value in sample_doc.items() if isinstance(value, (int, float))]
-        text_fields = [key for key, value in sample_doc.items() if isinstance(value, str)]
-        date_fields = [key for key, value in sample_doc.items() if isinstance(value, dict) and "$date" in value]
-
-        query_patterns = []
-
-        # Aggregation Queries
-        if numeric_fields and (text_fields or date_fields):
-            for numeric_field in numeric_fields:
-                for group_field in text_fields + date_fields:
-                    query_patterns.append({
-                        "title": f"Total {numeric_field} grouped by {group_field} in {collection_name}",
-                        "query": [
-                            {"$group": {"_id": f"${group_field}", "total": {"$sum": f"${numeric_field}"}}}
-                        ],
-                        "description": f"Groups documents by '{group_field}' and calculates the total of '{numeric_field}'.",
-                        "type": "aggregate",
-                        "collection": collection_name
-                    })
-                    query_patterns.append({
-                        "title": f"Average {numeric_field} grouped by {group_field} in {collection_name}",
-                        "query": [
-                            {"$group": {"_id": f"${group_field}", "avg": {"$avg": f"${numeric_field}"}}}
-                        ],
-                        "description": f"Groups documents by '{group_field}' and calculates the average of '{numeric_field}'.",
-                        "type": "aggregate",
-                        "collection": collection_name
-                    })
+    # Candidates of every table; up to max_queries * 5 random ones are validated concurrently
+    families = []
+    for table_name, entry in catalog_tables.items():
+        families.extend(mysql_construct_families(connection, construct, table_name, entry, join_graph[table_name]))
+    candidates = sample_candidates(families, max_queries * 5, rng)
+    valid_queries = validate_mysql_candidates(connection, candidates, max_queries, max_attempts=max_queries * 5, report=report)
 
-        # Text Search Queries
-        for text_field in text_fields:
-            query_patterns.append({
-                "title": f"Find documents where {text_field} contains 'sample' (case-insensitive) in {collection_name}",
-                "query": {text_field: {"$regex": "sample", "$options": "i"}},
-                "description": f"Finds documents where the field '{text_field}' contains the substring 'sample' (case-insensitive).",
-                "type": "find",
-                "collection": collection_name
-            })
+    if valid_queries:
+        return valid_queries
+    else:
+        report("No meaningful sample queries found or not enough columns to generate queries.")
+        return []
 
-            query_patterns.append({
-                "title": f"Find documents where {text_field} is exactly 'example' in {collection_name}",
-                "query": {text_field: "example"},
-                "description": f"Finds documents where the field '{text_field}' is exactly 'example'.",
-                "type": "find",
-                "collection": collection_name
-            })
+def mongodb_sample_families(collection_name, profile):
+    """
+    The candidate families of generate_mongodb_sample_queries for one collection.
+    """
+    numeric_fields, text_fields, date_fields = mongo_field_kinds(profile)
+    statistics = functools.lru_cache(maxsize=None)(lambda: mongo_field_statistics(profile))
 
-            query_patterns.append({
-                "title": f"Count occurrences of unique values in {text_field} in {collection_name}",
+    # Aggregation Queries
+    def aggregate(numeric_field, group_field, accumulator):
+        if accumulator == "total":
+            return {
+                "title": f"Total {numeric_field} grouped by {group_field} in {collection_name}",
                 "query": [
-                    {"$group": {"_id": f"${text_field}", "count": {"$sum": 1}}},
-                    {"$sort": {"count": -1}}
+                    {"$group": {"_id": f"${group_field}", "total": {"$sum": f"${numeric_field}"}}}
                 ],
-                "description": f"Counts the occurrences of each unique value in the field '{text_field}', sorted in descending order.",
+                "description": f"Groups documents by '{group_field}' and calculates the total of '{numeric_field}'.",
                 "type": "aggregate",
                 "collection": collection_name
-            })
-
-        # Sorting Queries
-        for field in numeric_fields + text_fields + date_fields:
-            query_patterns.extend([
-                {
-                    "title": f"Sort documents by {field} in ascending order in {collection_name}",
-                    "query": {"sort": {field: 1}},
-                    "description": f"Sorts documents in ascending order by '{field}'.",
-                    "type": "find",
-                    "collection": collection_name
-                },
-                {
-                    "title": f"Sort documents by {field} in descending order in {collection_name}",
-                    "query": {"sort": {field: -1}},
-                    "description": f"Sorts documents in descending order by '{field}'.",
-                    "type": "find",
-                    "collection": collection_name
-                }
-            ])
+            }
+        return {
+            "title": f"Average {numeric_field} grouped by {group_field} in {collection_name}",
+            "query": [
+                {"$group": {"_id": f"${group_field}", "avg": {"$avg": f"${numeric_field}"}}}
+            ],
+            "description": f"Groups documents by '{group_field}' and calculates the average of '{numeric_field}'.",
+            "type": "aggregate",
+            "collection": collection_name
+        }
+
+    # Text Search Queries, using a common value of the field so they match documents
+    def search(text_field, variant):
+        value = common_value(statistics(), text_field)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        fragment = text_fragment(value)
+        if variant == "contains":
+            return {
+                "title": f"Find documents where {text_field} contains '{fragment}' (case-insensitive) in {collection_name}",
+                "query": {text_field: {"$regex": re.escape(fragment), "$options": "i"}},
+                "description": f"Finds documents where the field '{text_field}' contains the substring '{fragment}' (case-insensitive).",
+                "type": "find",
+                "collection": collection_name
+            }
+        return {
+            "title": f"Find documents where {text_field} is exactly '{value}' in {collection_name}",
+            "query": {text_field: value},
+            "description": f"Finds documents where the field '{text_field}' is exactly '{value}'.",
+            "type": "find",
+            "collection": collection_name
+        }
+
+    def count_values(text_field):
+        return {
+            "title": f"Count occurrences of unique values in {text_field} in {collection_name}",
+            "query": [
+                {"$group": {"_id": f"${text_field}", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}}
+            ],
+            "description": f"Counts the occurrences of each unique value in the field '{text_field}', sorted in descending order.",
+            "type": "aggregate",
+            "collection": collection_name
+        }
+
+    return [
+        candidate_family(aggregate, numeric_fields, text_fields + date_fields, ("total", "average")),
+        candidate_family(search, text_fields, ("contains", "exactly")),
+        candidate_family(count_values, text_fields),
+        candidate_family(lambda field, direction: _mongodb_sort_candidate(collection_name, field, direction),
+                         numeric_fields + text_fields + date_fields, (1, -1))
+    ]
+
+def _mongodb_sort_candidate(collection_name, field, direction):
+    """
+    A find query sorting a collection by one field.
+    """
+    order = "ascending" if direction == 1 else "descending"
+    return {
+        "title": f"Sort documents by {field} in {order} order in {collection_name}",
+        "query": {"sort": {field: direction}},
+        "description": f"Sorts documents in {order} order by '{field}'.",
+        "type": "find",
+        "collection": collection_name
+    }
 
-        # Randomly select a limited number of patterns
-        if query_patterns:
-            selected_queries = random.sample(query_patterns, min(max_queries, len(query_patterns)))
+def generate_mongodb_sample_queries(db, max_queries=1, rng=None, report=print):
 
-            # Validate the queries
-            for query in selected_queries:
-                try:
-                    if query["type"] == "aggregate":
-                        collection.aggregate(query["query"])
-                    elif query["type"] == "find":
-                        collection.find(query["query"])
-                    valid_queries.append(query)
-                except Exception as e:
-                    print(f"Query validation failed for collection '{collection_name}': {query['title']}")
-                    print(f"Error: {e}")
-
-    return valid_queries
-
-def generate_mongodb_construct_queries(db, construct, max_queries=2):
     if db is None:
-        print("MongoDB connection is not available.")
+        report("MongoDB connection is not available.")
         return []
 
     collections = db.list_collection_names()
 
     if not collections:
-        print("No collections found in the MongoDB database.")
+        report("No collections found in the MongoDB database.")
         return []
 
-    valid_queries = []
+    selected_queries = []
 
+    profiles = get_mongo_schema_profiles(db)
     for collection_name in collections:
-        collection = db[collection_name]
-        sample_doc = collection.find_one()
-        if not sample_doc:
-            print(f"Collection '{collection_name}' is empty. Skipping.")
+        profile = profiles.get(collection_name)
+        if not profile or not profile["sampled"]:
+            report(f"Collection '{collection_name}' is empty. Skipping.")
             continue
 
-        numeric_fields = [key for key, value in sample_doc.items() if isinstance(value, (int, float))]
-        text_fields = [key for key, value in sample_doc.items() if isinstance(value, str)]
-        date_fields = [key for key, value in sample_doc.items() if isinstance(value, dict) and "$date" in value]
+        # Randomly select a limited number of patterns
+        selected_queries.extend(sample_candidates(mongodb_sample_families(collection_name, profile), max_queries, rng))
 
-        query_patterns = []
+    # Validate the queries of all collections concurrently
+    return validate_mongodb_candidates(db, selected_queries, len(selected_queries), report=report)
 
-        # Handle MATCH
-        if construct == "$match":
-            # Match numeric fields
-            for numeric_field in numeric_fields:
-                query_patterns.append({
-                    "title": f"Filter documents where {numeric_field} > 10 in {collection_name}",
-                    "query": [{ "$match": { numeric_field: { "$gt": 10 } } }],
-                    "description": f"Filters documents where the field '{numeric_field}' is greater than 10 using the MATCH stage.",
-                    "type": "aggregate",
-                    "collection": collection_name
-                })
-                query_patterns.append({
-                    "title": f"Filter documents where {numeric_field} is exactly 5 in {collection_name}",
-                    "query": [{ "$match": { numeric_field: 5 } }],
-                    "description": f"Filters documents where the field '{numeric_field}' is exactly 5 using the MATCH stage.",
-                    "type": "aggregate",
-                    "collection": collection_name
-                })
-
-            # Match text fields
-            for text_field in text_fields:
-                query_patterns.append({
-                    "title": f"Find documents where {text_field} contains 'sample' (case-insensitive) in {collection_name}",
-                    "query": [{ "$match": { text_field: {"$regex": "sample", "$options": "i"} } }],
-                    "description": f"Finds documents where the field '{text_field}' contains the substring 'sample' (case-insensitive) using the MATCH stage.",
+def mongodb_construct_families(construct, collection_name, profile):
+    """
+    The candidate families of generate_mongodb_construct_queries for one collection.
+    """
+    numeric_fields, text_fields, date_fields = mongo_field_kinds(profile)
+    statistics = functools.lru_cache(maxsize=None)(lambda: mongo_field_statistics(profile))
+
+    # Handle MATCH, with literals taken from the sampled values of each field
+    if construct == "$match":
+        def match_number(numeric_field, variant):
+            if variant == "above":
+                upper = column_quantile(statistics(), numeric_field, 0.75)
+                if upper is None:
+                    return None
+                return {
+                    "title": f"Filter documents where {numeric_field} > {upper} in {collection_name}",
+                    "query": [{ "$match": { numeric_field: { "$gt": upper } } }],
+                    "description": f"Filters documents where the field '{numeric_field}' is greater than {upper} using the MATCH stage.",
                     "type": "aggregate",
                     "collection": collection_name
-                })
-                query_patterns.append({
-                    "title": f"Find documents where {text_field} starts with 'example' (case-sensitive) in {collection_name}",
-                    "query": [{ "$match": { text_field: {"$regex": "^example"} } }],
-                    "description": f"Finds documents where the field '{text_field}' starts with 'example' (case-sensitive) using the MATCH stage.",
+                }
+            value = common_value(statistics(), numeric_field)
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                return None
+            return {
+                "title": f"Filter documents where {numeric_field} is exactly {value} in {collection_name}",
+                "query": [{ "$match": { numeric_field: value } }],
+                "description": f"Filters documents where the field '{numeric_field}' is exactly {value} using the MATCH stage.",
+                "type": "aggregate",
+                "collection": collection_name
+            }
+
+        def match_text(text_field, variant):
+            value = common_value(statistics(), text_field)
+            if not isinstance(value, str) or not value.strip():
+                return None
+            fragment = text_fragment(value)
+            if variant == "contains":
+                return {
+                    "title": f"Find documents where {text_field} contains '{fragment}' (case-insensitive) in {collection_name}",
+                    "query": [{ "$match": { text_field: {"$regex": re.escape(fragment), "$options": "i"} } }],
+                    "description": f"Finds documents where the field '{text_field}' contains the substring '{fragment}' (case-insensitive) using the MATCH stage.",
                     "type": "aggregate",
                     "collection": collection_name
-                })
-                query_patterns.append({
-                    "title": f"Find documents where {text_field} is exactly 'example' in {collection_name}",
-                    "query": [{ "$match": { text_field: "example" } }],
-                    "description": f"Finds documents where the field '{text_field}' is exactly 'example' using the MATCH stage.",
+                }
+            if variant == "prefix":
+                return {
+                    "title": f"Find documents where {text_field} starts with '{fragment}' (case-sensitive) in {collection_name}",
+                    "query": [{ "$match": { text_field: {"$regex": "^" + re.escape(fragment)} } }],
+                    "description": f"Finds documents where the field '{text_field}' starts with '{fragment}' (case-sensitive) using the MATCH stage.",
                     "type": "aggregate",
                     "collection": collection_name
-                })
-
-        # Handle GROUP
-        if construct == "$group":
-            for numeric_field in numeric_fields:
-                for group_field in text_fields:
-                    query_patterns.append({
-                        "title": f"Group by {group_field} and calculate total {numeric_field} in {collection_name}",
-                        "query": [{ "$group": { "_id": f"${group_field}", "total": { "$sum": f"${numeric_field}" } } }],
-                        "description": f"Groups documents by '{group_field}' and calculates the total of '{numeric_field}' using the GROUP stage.",
-                        "type": "aggregate",
-                        "collection": collection_name
-                    })
-                    query_patterns.append({
-                        "title": f"Group by {group_field} and calculate average {numeric_field} in {collection_name}",
-                        "query": [{ "$group": { "_id": f"${group_field}", "average": { "$avg": f"${numeric_field}" } } }],
-                        "description": f"Groups documents by '{group_field}' and calculates the average of '{numeric_field}' using the GROUP stage.",
-                        "type": "aggregate",
-                        "collection": collection_name
-                    })
+                }
+            return {
+                "title": f"Find documents where {text_field} is exactly '{value}' in {collection_name}",
+                "query": [{ "$match": { text_field: value } }],
+                "description": f"Finds documents where the field '{text_field}' is exactly '{value}' using the MATCH stage.",
+                "type": "aggregate",
+                "collection": collection_name
+            }
 
-            # Count documents grouped by text fields
-            for group_field in text_fields:
-                query_patterns.append({
-                    "title": f"Group by {group_field} and count documents in {collection_name}",
-                    "query": [{ "$group": { "_id": f"${group_field}", "count": { "$sum": 1 } } }],
-                    "description": f"Groups documents by '{group_field}' and counts the number of documents in each group using the GROUP stage.",
-                    "type": "aggregate",
-                    "collection": collection_name
-                })
-
-            # Calculate maximum and minimum values for numeric fields
-            for numeric_field in numeric_fields:
-                for group_field in text_fields:
-                    query_patterns.append({
-                        "title": f"Group by {group_field} and find maximum {numeric_field} in {collection_name}",
-                        "query": [{ "$group": { "_id": f"${group_field}", "maxValue": { "$max": f"${numeric_field}" } } }],
-                        "description": f"Groups documents by '{group_field}' and finds the maximum value of '{numeric_field}' using the GROUP stage.",
-                        "type": "aggregate",
-                        "collection": collection_name
-                    })
-                    query_patterns.append({
-                        "title": f"Group by {group_field} and find minimum {numeric_field} in {collection_name}",
-                        "query": [{ "$group": { "_id": f"${group_field}", "minValue": { "$min": f"${numeric_field}" } } }],
-                        "description": f"Groups documents by '{group_field}' and finds the minimum value of '{numeric_field}' using the GROUP stage.",
-                        "type": "aggregate",
-                        "collection": collection_name
-                    })
+        return [candidate_family(match_number, numeric_fields, ("above", "exactly")),
+                candidate_family(match_text, text_fields, ("contains", "prefix", "exactly"))]
+
+    # Handle GROUP
+    if construct == "$group":
+        accumulators = {
+            "total": ("$sum", "calculate total", "calculates the total of"),
+            "average": ("$avg", "calculate average", "calculates the average of"),
+            "maxValue": ("$max", "find maximum", "finds the maximum value of"),
+            "minValue": ("$min", "find minimum", "finds the minimum value of"),
+        }
+
+        def group(numeric_field, group_field, output):
+            operator, title, description = accumulators[output]
+            return {
+                "title": f"Group by {group_field} and {title} {numeric_field} in {collection_name}",
+                "query": [{ "$group": { "_id": f"${group_field}", output: { operator: f"${numeric_field}" } } }],
+                "description": f"Groups documents by '{group_field}' and {description} '{numeric_field}' using the GROUP stage.",
+                "type": "aggregate",
+                "collection": collection_name
+            }
 
-        # Handle SORT
-        if construct == "$sort":
-            for field in numeric_fields + text_fields + date_fields:
-                query_patterns.extend([
-                    {
-                        "title": f"Sort documents by {field} in ascending order in {collection_name}",
-                        "query": {"sort": {field: 1}},
-                        "description": f"Sorts documents in ascending order by '{field}'.",
-                        "type": "find",
-                        "collection": collection_name
-                    },
-                    {
-                        "title": f"Sort documents by {field} in descending order in {collection_name}",
-                        "query": {"sort": {field: -1}},
-                        "description": f"Sorts documents in descending order by '{field}'.",
-                        "type": "find",
-                        "collection": collection_name
-                    }
-                ])
-
-        # Handle LIMIT
-        if construct == "$limit":
-            query_patterns.append({
+        # Count documents grouped by text fields
+        def count(group_field):
+            return {
+                "title": f"Group by {group_field} and count documents in {collection_name}",
+                "query": [{ "$group": { "_id": f"${group_field}", "count": { "$sum": 1 } } }],
+                "description": f"Groups documents by '{group_field}' and counts the number of documents in each group using the GROUP stage.",
+                "type": "aggregate",
+                "collection": collection_name
+            }
+
+        return [candidate_family(group, numeric_fields, text_fields, list(accumulators)),
+                candidate_family(count, text_fields)]
+
+    # Handle SORT
+    if construct == "$sort":
+        return [candidate_family(lambda field, direction: _mongodb_sort_candidate(collection_name, field, direction),
+                                 numeric_fields + text_fields + date_fields, (1, -1))]
+
+    # Handle LIMIT
+    if construct == "$limit":
+        def limit_examples():
+            yield {
                 "title": f"Limit results to 10 documents in {collection_name}",
                 "query": [{ "$limit": 10 }],
                 "description": f"Limits the number of documents returned to 10 using the LIMIT stage.",
                 "type": "aggregate",
                 "collection": collection_name
-            })
+            }
             # Example: Limit to 5 documents
-            query_patterns.append({
+            yield {
                 "title": f"Limit results to 5 documents in {collection_name}",
                 "query": [{ "$limit": 5 }],
                 "description": f"Limits the number of documents returned to 5 using the LIMIT stage.",
                 "type": "aggregate",
                 "collection": collection_name
-            })
-
+            }
             # Example: Combine with $sort (descending order by _id)
-            query_patterns.append({
+            yield {
                 "title": f"Sort by _id in descending order and limit to 3 documents in {collection_name}",
                 "query": [{ "$sort": { "_id": -1 } }, { "$limit": 3 }],
                 "description": f"Sorts documents by '_id' in descending order and limits the results to 3 documents using the LIMIT stage.",
                 "type": "aggregate",
                 "collection": collection_name
-            })
-
+            }
             # Example: Combine with $skip and $limit (pagination)
-            query_patterns.append({
+            yield {
                 "title": f"Skip the first 5 documents and limit to 5 documents in {collection_name}",
                 "query": [{ "$skip": 5 }, { "$limit": 5 }],
                 "description": f"Skips the first 5 documents and then limits the results to 5 documents, useful for pagination, using the LIMIT stage.",
                 "type": "aggregate",
                 "collection": collection_name
-            })
-
+            }
             # Example: Complex pipeline with $match, $sort, and $limit
-            if numeric_fields:
-                query_patterns.append({
+            median = column_quantile(statistics(), numeric_fields[0], 0.5) if numeric_fields else None
+            if median is not None:
+                yield {
                     "title": f"Filter by a numeric field, sort, and limit results to 2 documents in {collection_name}",
                     "query": [
-                        { "$match": { numeric_fields[0]: { "$gt": 0 } } },
+                        { "$match": { numeric_fields[0]: { "$gte": median } } },
                         { "$sort": { numeric_fields[0]: -1 } },
                         { "$limit": 2 }
                     ],
-                    "description": f"Filters documents where '{numeric_fields[0]}' is greater than 0, sorts them in descending order, and limits the results to 2 documents.",
+                    "description": f"Filters documents where '{numeric_fields[0]}' is at least {median}, sorts them in descending order, and limits the results to 2 documents.",
                     "type": "aggregate",
                     "collection": collection_name
-                })
+                }
+
+        # A handful of fixed examples per collection, so they are simply listed
+        return [candidate_family(lambda example: example, list(limit_examples()))]
+
+    return []
+
+def generate_mongodb_construct_queries(db, construct, max_queries=2, rng=None, report=print):
+    if db is None:
+        report("MongoDB connection is not available.")
+        return []
+
+    collections = db.list_collection_names()
+
+    if not collections:
+        report("No collections found in the MongoDB database.")
+        return []
+
+    families = []
+
+    profiles = get_mongo_schema_profiles(db)
+    for collection_name in collections:
+        profile = profiles.get(collection_name)
+        if not profile or not profile["sampled"]:
+            report(f"Collection '{collection_name}' is empty. Skipping.")
+            continue
+        families.extend(mongodb_construct_families(construct, collection_name, profile))
+
+    # Validate randomly chosen candidates concurrently until `max_queries` return documents
+    candidates = sample_candidates(families, max_queries * 5, rng)
+    return validate_mongodb_candidates(db, candidates, max_queries, max_attempts=max_queries * 5, report=report)
+
+# Validated example queries are kept on disk, keyed by backend, database and schema fingerprint and
+# tagged by construct ("sample" for the sample generator). Entries remember the versions of the tables
+# they read, so only entries whose tables changed are validated again.
+QUERY_LIBRARY_PATH = os.environ.get("CHATDB_QUERY_LIBRARY", os.path.join(os.path.expanduser("~"), ".chatdb_query_library.json"))
+QUERY_LIBRARY_MAX_SCHEMAS = 20  # Least recently used schemas are dropped beyond this
+QUERY_LIBRARY_SEED = None  # Set with --seed to make generated queries reproducible
+# Entries whose table versions are unknown (no UPDATE_TIME) are trusted for this long after validation
+QUERY_LIBRARY_REVALIDATE_SECONDS = 24 * 3600
+_query_library = None
+_query_library_lock = threading.Lock()
+
+def load_query_library(path=None, report=print):
+    """
+    Return the query library, reading it from disk on first use. A missing or unreadable file gives an empty library.
+    """
+    global _query_library
+    with _query_library_lock:
+        if _query_library is None:
+            try:
+                with open(path or QUERY_LIBRARY_PATH, "r", encoding="utf-8") as library_file:
+                    _query_library = json_util.loads(library_file.read())
+            except FileNotFoundError:
+                _query_library = {}
+            except (OSError, ValueError) as e:
+                report(f"Ignoring the query library at {path or QUERY_LIBRARY_PATH}: {e}")
+                _query_library = {}
+        return _query_library
+
+def save_query_library(path=None, report=print):
+    """
+    Write the query library to disk, replacing the previous file atomically.
+    """
+    path = path or QUERY_LIBRARY_PATH
+    with _query_library_lock:
+        libraries = sorted(_query_library.items(), key=lambda item: item[1].get("used", 0), reverse=True)
+        data = dict(libraries[:QUERY_LIBRARY_MAX_SCHEMAS])
+        try:
+            with open(f"{path}.tmp", "w", encoding="utf-8") as library_file:
+                library_file.write(json_util.dumps(data, indent=1))
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            report(f"Could not save the query library: {e}")
+
+def schema_fingerprint(connection=None, db=None, db_type="MySQL"):
+    """
+    Return a short hash of the tables and column types (or collection names and index keys) of the current database.
+    MongoDB has no declared columns, and sampled field names differ between sessions, so they are not used.
+    """
+    if db_type == "MySQL":
+        shape = sorted((table, entry["columns"]) for table, entry in get_mysql_catalog(connection)["tables"].items())
+    else:
+        shape = sorted((name, sorted(str(index["key"]) for index in db[name].index_information().values()))
+                       for name in db.list_collection_names())
+    return hashlib.sha1(json.dumps(shape, default=str).encode()).hexdigest()[:16]
+
+def query_library_key(connection=None, db=None, db_type="MySQL"):
+    """
+    The library key of the current database: backend, database name and schema fingerprint.
+    """
+    database = connection.database if db_type == "MySQL" else db.name
+    return f"{db_type}/{database}/{schema_fingerprint(connection, db, db_type)}"
+
+def clear_query_library(connection=None, db=None, db_type="MySQL"):
+    """
+    Forget the saved queries of the current database, so the next request generates new ones.
+    """
+    library = load_query_library()
+    if library.pop(query_library_key(connection, db, db_type), None) is not None:
+        save_query_library()
+
+def library_queries(construct, connection=None, db=None, db_type="MySQL", max_queries=None, report=print):
+    """
+    Return validated queries for the construct from the library. Entries whose tables changed since
+    they were saved (versions from mysql_table_versions, which reads UPDATE_TIME live), or whose
+    versions are unknown and were validated more than QUERY_LIBRARY_REVALIDATE_SECONDS ago, are
+    validated again; new queries are generated (seeded by QUERY_LIBRARY_SEED) only when no saved
+    entry is left.
+    """
+    key = query_library_key(connection, db, db_type)
+    if db_type == "MySQL":
+        versions_of = lambda query: mysql_table_versions(connection, query["query"])
+        validate = lambda queries: validate_mysql_candidates(connection, queries, len(queries), report=report)
+    else:
+        versions_of = lambda query: mongodb_collection_versions(db, query["collection"], query["query"])
+        validate = lambda queries: validate_mongodb_candidates(db, queries, len(queries), report=report)
+
+    library = load_query_library(report=report)
+    with _query_library_lock:
+        entries = library.setdefault(key, {"constructs": {}})["constructs"].get(construct, [])
+    current, changed, versions, validated = [], [], {}, {}
+    now = time.time()
+    for entry in entries:
+        versions[id(entry["query"])] = token = json_util.dumps(versions_of(entry["query"]))
+        if token == "null":
+            # An entry saved with known versions that are now unknown (a table written in the
+            # last RESULT_CACHE_SETTLE_SECONDS) may have changed; only never-known ones are trusted
+            fresh = (entry["versions"] == "null"
+                     and now - entry.get("validated", 0) < QUERY_LIBRARY_REVALIDATE_SECONDS)
+        else:
+            fresh = token == entry["versions"]
+        if fresh:
+            current.append(entry["query"])
+            validated[id(entry["query"])] = entry.get("validated", now)
+        else:
+            changed.append(entry["query"])
+    queries = current + (validate(changed) if changed else [])
+
+    if queries:
+        report(f"(Served from the query library; {len(changed)} of {len(entries)} entries re-validated)")
+    else:
+        rng = random.Random(f"{QUERY_LIBRARY_SEED}/{key}/{construct}") if QUERY_LIBRARY_SEED is not None else None
+        options = {"rng": rng, "report": report}
+        if max_queries is not None:
+            options["max_queries"] = max_queries
+        if db_type == "MySQL":
+            queries = (generate_mysql_sample_queries(connection, **options) if construct == "sample"
+                       else generate_mysql_construct_queries(connection, construct, **options))
+        else:
+            queries = (generate_mongodb_sample_queries(db, **options) if construct == "sample"
+                       else generate_mongodb_construct_queries(db, construct, **options))
+
+    saved = [{"query": query, "versions": versions.get(id(query)) or json_util.dumps(versions_of(query)),
+              "validated": validated.get(id(query), now)} for query in queries]
+    with _query_library_lock:
+        library.setdefault(key, {"constructs": {}})["constructs"][construct] = saved
+        library[key]["used"] = time.time()
+    save_query_library(report=report)
+    return queries
+
+# Background warm-up: after connecting, a daemon thread fills the schema catalog, column statistics
+# (or collection profiles) and the query library, one step at a time, so the first menu actions are
+# fast. Progress is shown above the menu; cancelling stops it after the current step.
+WARMUP_MYSQL_CONSTRUCTS = ("sample", "GROUP BY", "HAVING", "ORDER BY", "JOIN", "EXISTS")
+WARMUP_MONGODB_CONSTRUCTS = ("sample", "$match", "$group", "$sort", "$limit")
+
+def _run_warmup(state, prepare):
+    """
+    Warm-up thread body: prepare() returns (steps, close); each step is (stage, function).
+    """
+    started = time.perf_counter()
+    close = None
+    try:
+        steps, close = prepare()
+        state["total"] = len(steps)
+        for stage, step in steps:
+            if state["cancel"].is_set():
+                state["stage"] = "cancelled"
+                return
+            state["stage"] = stage
+            step()
+            state["done"] += 1
+        state["stage"] = "finished"
+    except Exception as e:
+        state["stage"] = "failed"
+        state["error"] = str(e)
+    finally:
+        if close is not None:
+            close()
+        state["seconds"] = time.perf_counter() - started
+
+def start_warmup(connection=None, db=None, db_type="MySQL"):
+    """
+    Start warming up the caches of a new MySQL or MongoDB connection in the background and return its state.
+    MySQL work runs on a single connection borrowed from the pool, never on the menu's connection, and
+    validates example queries one at a time on it, so the rest of the pool stays free.
+    Messages of the warm-up steps are kept in the state's log instead of interrupting the menu.
+    """
+    state = {"stage": "starting", "done": 0, "total": 0, "error": None, "seconds": None,
+             "cancel": threading.Event(), "log": deque(maxlen=100), "reported": False}
+    report = state["log"].append
+
+    if db_type == "MySQL":
+        database = connection.database
+
+        def prepare():
+            warm_connection = borrow_mysql_connection(connection, database)
+            tables = get_mysql_catalog(warm_connection)["tables"]
+            get_join_graph(warm_connection)
+            steps = [(f"profiling column statistics of {table}",
+                      functools.partial(get_table_statistics, warm_connection, table)) for table in tables]
+            steps += [(f"validating {construct} examples",
+                       functools.partial(library_queries, construct, connection=warm_connection, db_type="MySQL",
+                                         report=report))
+                      for construct in WARMUP_MYSQL_CONSTRUCTS]
+            return steps, warm_connection.close
+    else:
+        def prepare():
+            steps = [(f"sampling fields of {name}", functools.partial(get_mongo_collection_profile, db, name))
+                     for name in db.list_collection_names()]
+            steps.append(("building the schema", functools.partial(mongo_get_collection_schema, db)))
+            steps += [(f"validating {construct} examples",
+                       functools.partial(library_queries, construct, db=db, db_type="MongoDB", report=report))
+                      for construct in WARMUP_MONGODB_CONSTRUCTS]
+            return steps, None
+
+    state["thread"] = threading.Thread(target=_run_warmup, args=(state, prepare), name="chatdb-warmup", daemon=True)
+    state["thread"].start()
+    return state
+
+def cancel_warmup(state, wait=False):
+    """
+    Ask the warm-up to stop after its current step; with wait=True, also wait until it has stopped.
+    Returns True if it was still running.
+    """
+    if state is None or not state["thread"].is_alive():
+        return False
+    state["cancel"].set()
+    if wait:
+        print("Waiting for the background warm-up to finish its current step...")
+        state["thread"].join()
+    return True
+
+def report_warmup(state):
+    """
+    Print the warm-up progress above the menu while it runs, and its outcome once.
+    """
+    if state is None or state["reported"]:
+        return
+    if state["thread"].is_alive():
+        print(f"[Warm-up: {state['stage']} ({state['done']}/{state['total'] or '?'} steps)]")
+        return
+    state["reported"] = True
+    if state["stage"] == "finished":
+        print(f"[Warm-up finished in {state['seconds']:.1f}s: schema, statistics and example queries are ready]")
+    elif state["stage"] == "failed":
+        print(f"[Warm-up failed: {state['error']}]")
+    else:
+        print(f"[Warm-up cancelled after {state['done']} of {state['total']} steps]")
+
+# Streaming reader for .sql dumps
+SQL_READ_CHUNK_SIZE = 1 << 16
+_SQL_LOOKAHEAD = 64
+_SQL_WHITESPACE = re.compile(r"\s*")
+_SQL_QUOTE_PATTERNS = {
+    "'": re.compile(r"[\\']"),
+    '"': re.compile(r'[\\"]'),
+    "`": re.compile(r"`")
+}
+
+def _sql_token_pattern(delimiter):
+    return re.compile(r"['\"`#]|--|/\*|" + re.escape(delimiter))
+
+def iter_sql_statements(file_obj, chunk_size=SQL_READ_CHUNK_SIZE):
+    """
+    Lazily yield the statements of a SQL script, reading file_obj in chunks.
+    Quotes, comments and DELIMITER changes are tracked, so semicolons inside string literals and
+    trigger or procedure bodies do not split statements. Plain comments are dropped; MySQL
+    conditional comments (/*! ... */) are kept, since the server executes them.
+    Only the statement being built is held in memory.
+    """
+    delimiter = ";"
+    token_pattern = _sql_token_pattern(delimiter)
+    parts = []  # Text of the statement being built
+    buffer = ""
+    pos = 0  # Scan position in the buffer
+    mark = 0  # Start of the buffer text not yet copied into parts
+    state = None  # None, an open quote character, "--", "/*" or "/*!"
+    at_start = True  # Only whitespace and comments seen so far in the current statement
+    eof = False
+    need_more = False
+
+    while True:
+        if (need_more or len(buffer) - pos < _SQL_LOOKAHEAD) and not eof:
+            chunk = file_obj.read(chunk_size)
+            if chunk:
+                parts.append(buffer[mark:pos])
+                buffer = buffer[pos:] + chunk
+                pos = mark = 0
+            else:
+                eof = True
+            need_more = False
+            continue
+
+        if pos >= len(buffer):
+            break
+
+        if state is None:
+            if at_start:
+                pos = _SQL_WHITESPACE.match(buffer, pos).end()
+                if len(buffer) - pos < len("DELIMITER ") and not eof:
+                    need_more = True
+                    continue
+                if buffer[pos:pos + 9].upper() == "DELIMITER" and buffer[pos + 9:pos + 10] in (" ", "\t"):
+                    # Client-side command: switch the statement delimiter until the next DELIMITER line
+                    newline = buffer.find("\n", pos)
+                    if newline == -1 and not eof:
+                        need_more = True
+                        continue
+                    line_end = newline if newline != -1 else len(buffer)
+                    words = buffer[pos:line_end].split()
+                    if len(words) > 1:
+                        delimiter = words[1]
+                        token_pattern = _sql_token_pattern(delimiter)
+                    pos = mark = line_end
+                    continue
+                if not buffer.startswith(("--", "#", "/*"), pos) or buffer.startswith("/*!", pos):
+                    at_start = False
+
+            match = token_pattern.search(buffer, pos)
+            if match is None:
+                # Keep a short tail in case a token is split across chunks
+                pos = len(buffer) if eof else max(pos, len(buffer) - len(delimiter) - 2)
+                need_more = not eof
+                continue
+            if match.end() >= len(buffer) and not eof:
+                # The character after the token decides what it is
+                pos = match.start()
+                need_more = True
+                continue
+
+            token = match.group()
+            following = buffer[match.end():match.end() + 1]
+            if token in ("'", '"', "`"):
+                state = token
+                pos = match.end()
+                at_start = False
+            elif token == "#" or (token == "--" and following in ("", " ", "\t", "\r", "\n")):
+                parts.append(buffer[mark:match.start()])
+                state = "--"
+                pos = mark = match.end()
+            elif token == "/*" and following != "!":
+                parts.append(buffer[mark:match.start()])
+                parts.append(" ")
+                state = "/*"
+                pos = mark = match.end()
+            elif token == "/*":
+                state = "/*!"
+                pos = match.end()
+            elif token == "--":
+                pos = match.end()
+                at_start = False
+            else:
+                # Statement delimiter
+                parts.append(buffer[mark:match.start()])
+                statement = "".join(parts).strip()
+                if statement:
+                    yield statement
+                parts = []
+                pos = mark = match.end()
+                at_start = True
+
+        elif state in _SQL_QUOTE_PATTERNS:
+            match = _SQL_QUOTE_PATTERNS[state].search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                continue
+            if match.group() == "\\":
+                if match.end() >= len(buffer) and not eof:
+                    pos = match.start()
+                    need_more = True
+                    continue
+                pos = match.end() + 1  # Skip the escaped character
+            else:
+                state = None
+                pos = match.end()
+
+        elif state == "--":
+            newline = buffer.find("\n", pos)
+            if newline == -1:
+                pos = mark = len(buffer)
+            else:
+                state = None
+                pos = mark = newline
+
+        else:
+            # Block comment: plain ones are dropped, conditional ones stay in the statement text
+            end = buffer.find("*/", pos)
+            if end == -1:
+                pos = len(buffer) if eof else max(pos, len(buffer) - 1)  # "*/" may be split across chunks
+            else:
+                pos = end + 2
+            if state == "/*":
+                mark = pos
+            if end != -1:
+                state = None
+
+    parts.append(buffer[mark:pos])
+    statement = "".join(parts).strip()
+    if statement:
+        yield statement
+
+# Bulk-load mode for .sql uploads: consecutive INSERTs into the same table are merged
+# into multi-row statements and committed once per batch.
+BULK_INSERT_MAX_ROWS = 5000
+BULK_INSERT_MAX_BYTES = 4 * 1024 * 1024  # Stays below the default max_allowed_packet
+_INSERT_PREFIX = re.compile(
+    r"INSERT\s+(?:IGNORE\s+)?INTO\s+(?P<table>(?:`[^`]+`|\w+)(?:\.(?:`[^`]+`|\w+))?)\s*(?:\([^)]*\))?\s*VALUES\s*",
+    re.IGNORECASE
+)
+_INSERT_VALUE_TOKENS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|[()]", re.DOTALL)
+
+def split_insert_statement(statement):
+    """
+    Split a plain INSERT ... VALUES statement into (prefix, values, row count).
+    Returns None for any other statement, or when the VALUES list is followed by other clauses
+    (e.g. ON DUPLICATE KEY UPDATE), since those cannot be merged safely.
+    """
+    match = _INSERT_PREFIX.match(statement)
+    if not match:
+        return None
+
+    values = statement[match.end():].strip()
+    rows = depth = 0
+    previous_end = 0
+    for token in _INSERT_VALUE_TOKENS.finditer(values):
+        if token.group() == "(":
+            if depth == 0:
+                # Only a comma may separate two top-level row tuples
+                if values[previous_end:token.start()].strip() != ("," if rows else ""):
+                    return None
+                rows += 1
+            depth += 1
+        elif token.group() == ")":
+            depth -= 1
+            if depth == 0:
+                previous_end = token.end()
+    if rows == 0 or depth != 0 or values[previous_end:].strip():
+        return None
+
+    return " ".join(match.group().split()), values, rows
+
+def bulk_load_sql_statements(connection, statements, max_rows=BULK_INSERT_MAX_ROWS, max_bytes=BULK_INSERT_MAX_BYTES,
+                             disable_checks=False):
+    """
+    Execute SQL statements, merging consecutive INSERTs into the same table into batches of at most
+    max_rows rows and max_bytes bytes. Each batch is committed and reported with the running rows/sec.
+    Optionally disables unique_checks and foreign_key_checks for the session while loading.
+    """
+    cursor = connection.cursor()
+    stats = {"rows": 0, "batches": 0, "statements": 0}
+    pending = {"prefix": None, "values": [], "rows": 0, "bytes": 0}
+    start = time.perf_counter()
+
+    def flush():
+        if pending["prefix"] is None:
+            return
+        cursor.execute(f"{pending['prefix']} {', '.join(pending['values'])}")
+        connection.commit()
+        stats["rows"] += pending["rows"]
+        stats["batches"] += 1
+        elapsed = time.perf_counter() - start
+        print(f"Batch {stats['batches']}: {stats['rows']} rows committed ({stats['rows'] / max(elapsed, 1e-9):.0f} rows/sec)")
+        pending.update(prefix=None, values=[], rows=0, bytes=0)
+
+    saved_checks = None
+    if disable_checks:
+        cursor.execute("SELECT @@SESSION.unique_checks, @@SESSION.foreign_key_checks;")
+        saved_checks = cursor.fetchone()
+        cursor.execute("SET SESSION unique_checks = 0, foreign_key_checks = 0;")
+
+    try:
+        for statement in statements:
+            stats["statements"] += 1
+            insert = split_insert_statement(statement)
+            if insert is None:
+                flush()
+                cursor.execute(statement)
+                if cursor.with_rows:
+                    cursor.fetchall()
+                continue
+
+            prefix, values, rows = insert
+            if pending["prefix"] is not None and (
+                    prefix != pending["prefix"] or
+                    pending["rows"] + rows > max_rows or
+                    pending["bytes"] + len(values) > max_bytes):
+                flush()
+            pending["prefix"] = prefix
+            pending["values"].append(values)
+            pending["rows"] += rows
+            pending["bytes"] += len(values)
+        flush()
+        connection.commit()
+    except Exception:
+        print(f"Bulk load stopped after {stats['batches']} committed batches ({stats['rows']} rows, "
+              f"{stats['statements']} statements read).")
+        raise
+    finally:
+        if saved_checks is not None:
+            cursor.execute(f"SET SESSION unique_checks = {int(saved_checks[0])}, foreign_key_checks = {int(saved_checks[1])};")
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+# Streaming reader and chunked inserts for .json / .jsonl uploads
+JSON_READ_CHUNK_SIZE = 1 << 16
+MONGO_INSERT_MAX_DOCS = 1000
+MONGO_INSERT_MAX_BYTES = 8 * 1024 * 1024  # Well below MongoDB's 48 MB message size limit
+JSON_FILE_EXTENSIONS = ('.json', '.jsonl', '.ndjson')
+_JSON_WHITESPACE = re.compile(r"\s*")
+_JSON_ARRAY_SEPARATORS = re.compile(r"[\s,]*")
+_JSON_INCOMPLETE = object()  # No complete value in the buffer yet (JSON null decodes to None)
+
+def iter_json_documents(file_obj, chunk_size=JSON_READ_CHUNK_SIZE):
+    """
+    Lazily yield the documents of a JSON array, a single JSON document or newline-delimited JSON,
+    reading file_obj in chunks. MongoDB Extended JSON values ($oid, $date, ...) are converted to BSON types.
+    Raises ValueError for a top-level value or array element that is not an object (including null).
+    """
+    decoder = json.JSONDecoder(object_hook=json_util.object_hook)
+    buffer = ""
+    pos = 0
+    eof = False
+    in_array = None  # Decided by the first non-whitespace character
+    read_size = chunk_size
+
+    while True:
+        separators = _JSON_ARRAY_SEPARATORS if in_array else _JSON_WHITESPACE
+        pos = separators.match(buffer, pos).end()
+
+        document = _JSON_INCOMPLETE
+        if pos < len(buffer):
+            if in_array is None:
+                in_array = buffer[pos] == "["
+                if in_array:
+                    pos += 1
+                continue
+            if in_array and buffer[pos] == "]":
+                return
+            try:
+                document, end = decoder.raw_decode(buffer, pos)
+                # A top-level scalar at the end of the buffer may still be incomplete
+                if not isinstance(document, dict) and end == len(buffer) and not eof:
+                    document = _JSON_INCOMPLETE
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                document = _JSON_INCOMPLETE
+
+        if document is not _JSON_INCOMPLETE:
+            if not isinstance(document, dict):
+                raise ValueError(f"Expected a JSON object, found {json.dumps(document, default=str)[:50]}.")
+            yield document
+            pos = end
+            read_size = chunk_size
+            continue
+
+        if eof:
+            return
+        chunk = file_obj.read(read_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        # Grow reads while a single document spans many chunks, keeping re-parsing linear overall
+        read_size = max(chunk_size, len(buffer))
+
+def insert_documents_in_chunks(collection, documents, max_docs=MONGO_INSERT_MAX_DOCS, max_bytes=MONGO_INSERT_MAX_BYTES):
+    """
+    Insert documents with unordered insert_many calls of at most max_docs documents and max_bytes of BSON,
+    printing progress and throughput after each chunk. Returns the insert statistics.
+    """
+    stats = {"inserted": 0, "failed": 0, "chunks": 0}
+    chunk = []
+    chunk_bytes = 0
+    start = time.perf_counter()
+
+    def flush():
+        if not chunk:
+            return
+        try:
+            result = collection.insert_many(chunk, ordered=False)
+            stats["inserted"] += len(result.inserted_ids)
+        except BulkWriteError as bwe:
+            write_errors = bwe.details.get("writeErrors", [])
+            stats["inserted"] += bwe.details.get("nInserted", 0)
+            stats["failed"] += len(write_errors)
+            if write_errors:
+                print(f"{len(write_errors)} documents were rejected, e.g.: {write_errors[0].get('errmsg')}")
+        stats["chunks"] += 1
+        elapsed = time.perf_counter() - start
+        print(f"Chunk {stats['chunks']}: {stats['inserted']} documents inserted "
+              f"({stats['inserted'] / max(elapsed, 1e-9):.0f} docs/sec)")
+        chunk.clear()
+
+    for document in documents:
+        size = len(bson.encode(document))
+        if chunk and (len(chunk) >= max_docs or chunk_bytes + size > max_bytes):
+            flush()
+            chunk_bytes = 0
+        chunk.append(document)
+        chunk_bytes += size
+    flush()
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+# Opt-in parallel upload pipeline: a reader thread splits the file, worker processes parse and
+# convert batches, and a pool of database connections inserts them. Stages are connected by
+# bounded queues, so memory stays bounded and the slowest stage sets the pace.
+UPLOAD_PIPELINE_WORKERS = os.cpu_count() or 2
+UPLOAD_PIPELINE_CONNECTIONS = 4
+UPLOAD_PIPELINE_BATCH_SIZE = 500  # Statements or documents per batch handed to a worker
+UPLOAD_PIPELINE_QUEUE_SIZE = 8  # Batches buffered between two stages
+_JSON_STRING_TOKENS = re.compile(r'["\\]')
+_JSON_STRUCTURE_TOKENS = re.compile(r'["{}\[\]]')
+# Session statements run on every connection; COMMIT and ROLLBACK are included so AUTOCOMMIT=0 blocks end everywhere
+_SQL_SESSION_STATEMENT = re.compile(r"^(?:/\*!\d*\s*)?(?:SET|USE|COMMIT|ROLLBACK)\b", re.IGNORECASE)
+# LOCK TABLES and explicit transactions hold locks until they end, so their statements run in order on one connection
+_SQL_SERIAL_START = re.compile(r"^(?:/\*!\d*\s*)?(?:LOCK\s+TABLES?|START\s+TRANSACTION|BEGIN)\b", re.IGNORECASE)
+_SQL_SERIAL_END = re.compile(r"^(?:/\*!\d*\s*)?(?:UNLOCK\s+TABLES?|COMMIT|ROLLBACK(?!\s+(?:WORK\s+)?TO\b))\b",
+                             re.IGNORECASE)
+
+def iter_json_raw_documents(file_obj, chunk_size=JSON_READ_CHUNK_SIZE):
+    """
+    Yield the raw text of each top-level object of a JSON array, a single JSON object or
+    newline-delimited JSON, without decoding it.
+    """
+    buffer = ""
+    pos = 0
+    parts = []  # Text of the document being read, when it spans chunks
+    start = None  # Start of the current document in the buffer
+    depth = 0
+    in_string = False
+    escape_pending = False
+    in_array = None
+
+    while True:
+        if pos >= len(buffer):
+            if start is not None:
+                parts.append(buffer[start:])
+                start = 0
+            buffer = file_obj.read(chunk_size)
+            if not buffer:
+                if depth:
+                    raise ValueError("The JSON file ends in the middle of a document.")
+                return
+            pos = 1 if escape_pending else 0
+            escape_pending = False
+            continue
+
+        if depth == 0:
+            separators = _JSON_ARRAY_SEPARATORS if in_array else _JSON_WHITESPACE
+            pos = separators.match(buffer, pos).end()
+            if pos >= len(buffer):
+                continue
+            character = buffer[pos]
+            if in_array is None:
+                in_array = character == "["
+                if in_array:
+                    pos += 1
+                    continue
+            if in_array and character == "]":
+                return
+            if character != "{":
+                raise ValueError(f"Expected a JSON object, found {character!r}.")
+            start = pos
+            depth = 1
+            pos += 1
+
+        elif in_string:
+            match = _JSON_STRING_TOKENS.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+            elif match.group() == "\\":
+                pos = match.end() + 1
+                escape_pending = pos > len(buffer)
+            else:
+                in_string = False
+                pos = match.end()
+
+        else:
+            match = _JSON_STRUCTURE_TOKENS.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                continue
+            token = match.group()
+            pos = match.end()
+            if token == '"':
+                in_string = True
+            elif token in "{[":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    parts.append(buffer[start:pos])
+                    yield "".join(parts)
+                    parts = []
+                    start = None
+
+def _prepare_sql_batch(statements, max_rows, max_bytes):
+    """
+    Worker process step: merge a batch of INSERT statements into multi-row statements.
+    Returns (list of (sql, rows), seconds spent).
+    """
+    started = time.perf_counter()
+    prepared = []
+    pending = None
+    for statement in statements:
+        insert = split_insert_statement(statement)
+        if insert is None:
+            # Keep statement order: finish the pending merged INSERT first
+            if pending:
+                prepared.append((f"{pending[0]} {', '.join(pending[1])}", pending[2]))
+                pending = None
+            prepared.append((statement, 0))
+            continue
+        prefix, values, rows = insert
+        if pending and (pending[0] != prefix or pending[2] + rows > max_rows or pending[3] + len(values) > max_bytes):
+            prepared.append((f"{pending[0]} {', '.join(pending[1])}", pending[2]))
+            pending = None
+        if pending is None:
+            pending = [prefix, [], 0, 0]
+        pending[1].append(values)
+        pending[2] += rows
+        pending[3] += len(values)
+    if pending:
+        prepared.append((f"{pending[0]} {', '.join(pending[1])}", pending[2]))
+    return prepared, time.perf_counter() - started
+
+def _prepare_json_batch(raw_documents, max_docs, max_bytes):
+    """
+    Worker process step: decode raw JSON documents (Extended JSON aware) and encode them to BSON,
+    split into insert_many sized chunks. Returns (list of chunks of BSON bytes, seconds spent).
+    """
+    started = time.perf_counter()
+    chunks = [[]]
+    chunk_bytes = 0
+    for raw_document in raw_documents:
+        document = json.loads(raw_document, object_hook=json_util.object_hook)
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        encoded = bson.encode(document)
+        if chunks[-1] and (len(chunks[-1]) >= max_docs or chunk_bytes + len(encoded) > max_bytes):
+            chunks.append([])
+            chunk_bytes = 0
+        chunks[-1].append(encoded)
+        chunk_bytes += len(encoded)
+    return [chunk for chunk in chunks if chunk], time.perf_counter() - started
+
+def run_upload_pipeline(file_path, connection=None, collection=None, workers=UPLOAD_PIPELINE_WORKERS,
+                        connections=UPLOAD_PIPELINE_CONNECTIONS, batch_size=UPLOAD_PIPELINE_BATCH_SIZE,
+                        queue_size=UPLOAD_PIPELINE_QUEUE_SIZE, disable_checks=False):
+    """
+    Upload a .sql file (when connection is given) or a JSON / NDJSON file (when collection is given)
+    through the three-stage pipeline and return per-stage timings.
+
+    For .sql files, statements other than INSERTs act as barriers: queued inserts are finished
+    first, then the statement runs on its own (session statements such as SET, COMMIT and ROLLBACK run
+    on every connection). LOCK TABLES ... UNLOCK TABLES regions and explicit transactions run serially
+    on the main connection. INSERTs into one table always go to the same connection, so each table's
+    rows are inserted in file order.
+    """
+    is_sql = connection is not None
+    stop = threading.Event()
+    errors = []
+    lock = threading.Lock()
+    timings = {"read": 0.0, "read_wait": 0.0, "parse": 0.0, "insert": 0.0, "insert_wait": 0.0}
+    totals = {"rows": 0, "batches": 0}
+    raw_queue = queue.Queue(maxsize=queue_size)
+    insert_queues = [queue.Queue(maxsize=queue_size) for _ in range(connections)]
+    insert_connections = []
+    routed = itertools.count()  # Round-robin for JSON chunks, which have no per-table order to keep
+
+    def add_time(stage, seconds):
+        with lock:
+            timings[stage] += seconds
+
+    def put(target_queue, item, wait_stage=None):
+        started = time.perf_counter()
+        while not stop.is_set():
+            try:
+                target_queue.put(item, timeout=0.2)
+                break
+            except queue.Full:
+                continue
+        if wait_stage:
+            add_time(wait_stage, time.perf_counter() - started)
 
-        # Append queries for the current collection to the overall results
-        valid_queries.extend(query_patterns)
+    def reader():
+        started = time.perf_counter()
+        try:
+            with open(file_path, 'r', encoding='utf-8') as file:
+                items = iter_sql_statements(file) if is_sql else iter_json_raw_documents(file)
+                batch = []
+                in_region = False  # Inside a LOCK TABLES or transaction region
+                region = []  # Its statements not yet queued; a long region is queued in chunks
+                for item in items:
+                    if stop.is_set():
+                        return
+                    if is_sql and (in_region or _SQL_SERIAL_START.match(item)):
+                        if batch:
+                            put(raw_queue, ("batch", batch), "read_wait")
+                            batch = []
+                        starts = not in_region
+                        in_region = True
+                        region.append(item)
+                        if not starts and _SQL_SERIAL_END.match(item):
+                            put(raw_queue, ("serial", region), "read_wait")
+                            in_region = False
+                            region = []
+                        elif len(region) >= batch_size:
+                            put(raw_queue, ("serial", region), "read_wait")
+                            region = []
+                        continue
+                    if is_sql and not _INSERT_PREFIX.match(item):
+                        if batch:
+                            put(raw_queue, ("batch", batch), "read_wait")
+                            batch = []
+                        put(raw_queue, ("barrier", item), "read_wait")
+                        continue
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        put(raw_queue, ("batch", batch), "read_wait")
+                        batch = []
+                if batch:
+                    put(raw_queue, ("batch", batch), "read_wait")
+                if region:
+                    put(raw_queue, ("serial", region), "read_wait")
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            # Reading time is everything the reader did except waiting for room in the queue
+            add_time("read", time.perf_counter() - started - timings["read_wait"])
+            put(raw_queue, ("end", None))
+
+    def inserter(insert_connection, insert_queue):
+        cursor = insert_connection.cursor() if is_sql else None
+        while True:
+            started = time.perf_counter()
+            item = insert_queue.get()
+            add_time("insert_wait", time.perf_counter() - started)
+            try:
+                if item is None:
+                    return
+                if stop.is_set():
+                    continue
+                started = time.perf_counter()
+                if is_sql:
+                    sql, rows = item
+                    cursor.execute(sql)
+                    if cursor.with_rows:
+                        cursor.fetchall()
+                    insert_connection.commit()
+                else:
+                    rows = 0
+                    try:
+                        rows = len(collection.insert_many([RawBSONDocument(document) for document in item],
+                                                          ordered=False).inserted_ids)
+                    except BulkWriteError as bwe:
+                        rows = bwe.details.get("nInserted", 0)
+                add_time("insert", time.perf_counter() - started)
+                with lock:
+                    totals["rows"] += rows
+                    totals["batches"] += 1
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                insert_queue.task_done()
+
+    def run_on(statement, targets):
+        for target in targets:
+            cursor = target.cursor()
+            cursor.execute(statement)
+            if cursor.with_rows:
+                cursor.fetchall()
+
+    def run_barrier(statement):
+        # Every queued insert must be finished before a schema or session statement runs
+        for insert_queue in insert_queues:
+            insert_queue.join()
+        if stop.is_set():
+            return
+        targets = [connection] + insert_connections if _SQL_SESSION_STATEMENT.match(statement) else [connection]
+        run_on(statement, targets)
+        for target in targets:
+            target.commit()
+
+    def run_serial(statements):
+        # A LOCK TABLES or transaction region: the inserters would wait on its locks, so the main
+        # connection runs it alone and in order. The region's own UNLOCK TABLES or COMMIT ends it.
+        for insert_queue in insert_queues:
+            insert_queue.join()
+        if stop.is_set():
+            return
+        prepared, seconds = _prepare_sql_batch(statements, BULK_INSERT_MAX_ROWS, BULK_INSERT_MAX_BYTES)
+        add_time("parse", seconds)
+        started = time.perf_counter()
+        for sql, rows in prepared:
+            session = not rows and _SQL_SESSION_STATEMENT.match(sql)
+            run_on(sql, [connection] + insert_connections if session else [connection])
+            with lock:
+                totals["rows"] += rows
+        add_time("insert", time.perf_counter() - started)
+        with lock:
+            totals["batches"] += 1
+
+    def route(unit):
+        # INSERTs into one table always use the same connection, which keeps their order
+        if not is_sql:
+            return next(routed) % connections
+        match = _INSERT_PREFIX.match(unit[0])
+        return hash(match.group("table").strip("`").lower()) % connections if match else 0
+
+    if is_sql:
+        for _ in range(connections):
+            insert_connections.append(borrow_mysql_connection(connection))
+        if disable_checks:
+            for insert_connection in insert_connections:
+                insert_connection.cursor().execute("SET SESSION unique_checks = 0, foreign_key_checks = 0;")
+
+    wall_started = time.perf_counter()
+    threads = [threading.Thread(target=reader, daemon=True)]
+    for index in range(connections):
+        threads.append(threading.Thread(target=inserter, args=(insert_connections[index] if is_sql else None,
+                                                                insert_queues[index]), daemon=True))
+    for thread in threads:
+        thread.start()
+
+    in_flight = deque()
+
+    def drain(limit):
+        # Hand finished worker results to the inserters, oldest first, until at most limit remain
+        while in_flight and (len(in_flight) > limit or in_flight[0].done()):
+            prepared, seconds = in_flight.popleft().result()
+            add_time("parse", seconds)
+            for unit in prepared:
+                put(insert_queues[route(unit)], unit)
 
-    # Randomly select up to `max_queries` queries
-    return random.sample(valid_queries, min(max_queries, len(valid_queries)))
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            while not stop.is_set():
+                try:
+                    kind, payload = raw_queue.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                if kind == "end":
+                    break
+                if kind == "barrier":
+                    drain(0)
+                    run_barrier(payload)
+                    continue
+                if kind == "serial":
+                    drain(0)
+                    run_serial(payload)
+                    continue
+                if is_sql:
+                    future = executor.submit(_prepare_sql_batch, payload, BULK_INSERT_MAX_ROWS, BULK_INSERT_MAX_BYTES)
+                else:
+                    future = executor.submit(_prepare_json_batch, payload, MONGO_INSERT_MAX_DOCS, MONGO_INSERT_MAX_BYTES)
+                in_flight.append(future)
+                drain(queue_size)
+            drain(0)
+            for insert_queue in insert_queues:
+                insert_queue.join()
+            if is_sql and not stop.is_set():
+                connection.commit()  # A region left open at the end of the file
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        for insert_queue in insert_queues:
+            insert_queue.put(None)  # The inserters keep draining their queue, so this cannot block for long
+        for thread in threads[1:]:
+            thread.join()
+        for insert_connection in insert_connections:
+            insert_connection.close()
+
+    if errors:
+        raise errors[0]
+
+    return {
+        "rows": totals["rows"],
+        "batches": totals["batches"],
+        "seconds": time.perf_counter() - wall_started,
+        "workers": workers,
+        "connections": connections,
+        "timings": timings
+    }
+
+def print_pipeline_report(stats):
+    """
+    Print per-stage timings of an upload pipeline run and name the bottleneck stage.
+    """
+    timings = stats["timings"]
+    print(f"Uploaded {stats['rows']} rows/documents in {stats['batches']} batches, {stats['seconds']:.1f}s "
+          f"({stats['rows'] / max(stats['seconds'], 1e-9):.0f} per second).")
+    print(f"{'Stage':<8}{'Busy (s)':>10}{'Waiting (s)':>13}{'Parallelism':>13}")
+    print(f"{'read':<8}{timings['read']:>10.2f}{timings['read_wait']:>13.2f}{1:>13}")
+    print(f"{'parse':<8}{timings['parse']:>10.2f}{'':>13}{stats['workers']:>13}")
+    print(f"{'insert':<8}{timings['insert']:>10.2f}{timings['insert_wait']:>13.2f}{stats['connections']:>13}")
+    load = {
+        "read": timings["read"],
+        "parse": timings["parse"] / stats["workers"],
+        "insert": timings["insert"] / stats["connections"]
+    }
+    print(f"Bottleneck: {max(load, key=load.get)} stage.")
 
 def upload_dataset_to_database(connection=None, db=None, db_type="MySQL"):
     """
     Upload a dataset into the connected database and display the updated tables or collections.
     """
-    file_path = input("Enter the full path (.sql or.json) to the dataset file: ").strip()
+    file_path = input("Enter the full path (.sql, .json or .jsonl) to the dataset file: ").strip()
 
     try:
         if db_type == "MySQL" and connection:
@@ -715,13 +3442,42 @@ def upload_dataset_to_database(connection=None, db=None, db_type="MySQL"):
                 print(f"Using the currently connected database '{connection.database}'.")
 
             if file_path.endswith('.sql'):
-                # Execute SQL script
-                with open(file_path, 'r') as file:
-                    sql_script = file.read()
-                for statement in sql_script.split(';'):
-                    if statement.strip():  # Skip empty statements
-                        cursor.execute(statement)
-                connection.commit()
+                parallel_mode = input("Use the parallel upload pipeline? (yes/no): ").strip().lower() == "yes"
+                bulk_mode = not parallel_mode and input("Use bulk-load mode (batched INSERTs, committed per batch)? (yes/no): ").strip().lower() == "yes"
+                if parallel_mode:
+                    workers = input(f"Number of parser processes (default: {UPLOAD_PIPELINE_WORKERS}): ").strip()
+                    connections = input(f"Number of insert connections (default: {UPLOAD_PIPELINE_CONNECTIONS}): ").strip()
+                    disable_checks = input("Disable unique and foreign key checks during the load? (yes/no): ").strip().lower() == "yes"
+                    stats = run_upload_pipeline(
+                        file_path,
+                        connection=connection,
+                        workers=int(workers) if workers else UPLOAD_PIPELINE_WORKERS,
+                        connections=int(connections) if connections else UPLOAD_PIPELINE_CONNECTIONS,
+                        disable_checks=disable_checks
+                    )
+                    print_pipeline_report(stats)
+                elif bulk_mode:
+                    max_rows = input(f"Maximum rows per batch (default: {BULK_INSERT_MAX_ROWS}): ").strip()
+                    max_bytes = input(f"Maximum bytes per batch (default: {BULK_INSERT_MAX_BYTES}): ").strip()
+                    disable_checks = input("Disable unique and foreign key checks during the load? (yes/no): ").strip().lower() == "yes"
+                    with open(file_path, 'r', encoding='utf-8') as file:
+                        stats = bulk_load_sql_statements(
+                            connection,
+                            iter_sql_statements(file),
+                            max_rows=int(max_rows) if max_rows else BULK_INSERT_MAX_ROWS,
+                            max_bytes=int(max_bytes) if max_bytes else BULK_INSERT_MAX_BYTES,
+                            disable_checks=disable_checks
+                        )
+                    print(f"Bulk load finished: {stats['rows']} rows in {stats['batches']} batches, "
+                          f"{stats['seconds']:.1f}s ({stats['rows'] / max(stats['seconds'], 1e-9):.0f} rows/sec).")
+                else:
+                    # Execute SQL script, one statement at a time as it is read
+                    with open(file_path, 'r', encoding='utf-8') as file:
+                        for statement in iter_sql_statements(file):
+                            cursor.execute(statement)
+                            if cursor.with_rows:
+                                cursor.fetchall()  # Discard result sets of statements such as SELECT
+                    connection.commit()
                 print("SQL file executed successfully. Dataset uploaded to MySQL database.")
 
                 # Display updated tables
@@ -737,18 +3493,30 @@ def upload_dataset_to_database(connection=None, db=None, db_type="MySQL"):
                 print("Invalid file format for MySQL. Please provide a .sql file.")
 
         elif db_type == "MongoDB" and db is not None:
-            if file_path.endswith('.json'):
-                # Insert JSON data
-                import json
-                with open(file_path, 'r') as file:
-                    data = json.load(file)
+            if file_path.endswith(JSON_FILE_EXTENSIONS):
+                # Stream JSON / NDJSON documents into the collection in chunks
                 collection_name = input("Enter the collection name to insert data: ").strip()
                 collection = db[collection_name]
-                if isinstance(data, list):
-                    collection.insert_many(data)
+                parallel_mode = input("Use the parallel upload pipeline? (yes/no): ").strip().lower() == "yes"
+                if parallel_mode:
+                    workers = input(f"Number of parser processes (default: {UPLOAD_PIPELINE_WORKERS}): ").strip()
+                    connections = input(f"Number of insert threads (default: {UPLOAD_PIPELINE_CONNECTIONS}): ").strip()
+                    stats = run_upload_pipeline(
+                        file_path,
+                        collection=collection,
+                        workers=int(workers) if workers else UPLOAD_PIPELINE_WORKERS,
+                        connections=int(connections) if connections else UPLOAD_PIPELINE_CONNECTIONS
+                    )
+                    print(f"JSON file inserted successfully into '{collection_name}' collection.")
+                    print_pipeline_report(stats)
                 else:
-                    collection.insert_one(data)
-                print(f"JSON file inserted successfully into '{collection_name}' collection.")
+                    with open(file_path, 'r', encoding='utf-8') as file:
+                        stats = insert_documents_in_chunks(collection, iter_json_documents(file))
+                    print(f"JSON file inserted successfully into '{collection_name}' collection: "
+                          f"{stats['inserted']} documents in {stats['seconds']:.1f}s "
+                          f"({stats['inserted'] / max(stats['seconds'], 1e-9):.0f} docs/sec).")
+                    if stats["failed"]:
+                        print(f"{stats['failed']} documents could not be inserted.")
 
                 # Display updated collections
                 collections = db.list_collection_names()
@@ -759,18 +3527,27 @@ def upload_dataset_to_database(connection=None, db=None, db_type="MySQL"):
                 else:
                     print("No collections found in the database.")
             else:
-                print("Invalid file format for MongoDB. Please provide a .json file.")
+                print("Invalid file format for MongoDB. Please provide a .json, .jsonl or .ndjson file.")
         else:
             print("Invalid database type or no active connection.")
     except FileNotFoundError:
         print(f"File not found: {file_path}")
     except Exception as e:
         print(f"Error uploading dataset: {e}")
+    finally:
+        if connection:
+            # Even a partially executed script may have changed the schema
+            invalidate_mysql_catalog(connection)
+            invalidate_result_cache(mysql_connection_key(connection))
+        if db is not None:
+            invalidate_mongo_schema(db)
+            invalidate_result_cache(db)
 
 def drop_tables_or_schema(connection=None, db=None, db_type="MySQL"):
     """
     Drop specific tables or the entire schema (MySQL) or collections or the entire database (MongoDB),
     and allow users to choose a new schema/database if the current one is dropped.
+    Returns True when the caller should go back to the main menu.
     """
     try:
         if db_type == "MySQL" and connection:
@@ -839,7 +3616,7 @@ def drop_tables_or_schema(connection=None, db=None, db_type="MySQL"):
                             print(f"Error switching to new schema '{new_schema}': {e}")
                     else:
                         print("No new schema selected. You are now outside any schema context.")
-                        chatdb_menu()
+                        return True
                 else:
                     print("Drop operation cancelled.")
             else:
@@ -887,7 +3664,7 @@ def drop_tables_or_schema(connection=None, db=None, db_type="MySQL"):
 
                     # Return to main menu after dropping the database
                     print("Returning to the main menu.")
-                    chatdb_menu()  # Call main menu
+                    return True
                 else:
                     print("Drop operation cancelled.")
             else:
@@ -897,51 +3674,187 @@ def drop_tables_or_schema(connection=None, db=None, db_type="MySQL"):
             print("Invalid database type or no active connection.")
     except Exception as e:
         print(f"Error dropping tables or schema/database: {e}")
+    finally:
+        if connection:
+            invalidate_mysql_catalog(connection)
+            invalidate_result_cache(mysql_connection_key(connection))
+        if db is not None:
+            invalidate_mongo_schema(db)
+            invalidate_result_cache(db)
 
 def get_table_schema(connection):
     """
-    Fetch table schema information dynamically from the database.
+    Fetch table schema information from the connection's schema catalog.
     """
-    cursor = connection.cursor()
-    cursor.execute("SHOW TABLES;")
-    tables = cursor.fetchall()
-
-    schema = {}
-    for (table,) in tables:
-        cursor.execute(f"SHOW COLUMNS FROM {table};")
-        columns = cursor.fetchall()
-        schema[table] = [column[0].lower() for column in columns]
-    return schema
+    return get_mysql_catalog(connection)["schema"]
 
-def map_field_to_column(user_field, schema):
+# NLTK tools are created once per process, on first use
+_nltk_tools = {}
+_nltk_tools_lock = threading.Lock()
+
+def get_nltk_tools():
     """
-    Map user-provided field names to actual database columns using schema.
-    Leverage NLTK for tokenization, lemmatization, and normalization.
+    Return the shared WordNet lemmatizer and English stopword set.
+    """
+    if "stop_words" not in _nltk_tools:
+        with _nltk_tools_lock:
+            if "stop_words" not in _nltk_tools:
+                lemmatizer = WordNetLemmatizer()
+                # WordNet loads lazily on first use, and that load is not thread safe: force it here
+                lemmatizer.lemmatize("warmup")
+                _nltk_tools["lemmatizer"] = lemmatizer
+                _nltk_tools["stop_words"] = set(stopwords.words("english"))  # Set last: it marks the tools ready
+    return _nltk_tools["lemmatizer"], _nltk_tools["stop_words"]
+
+@functools.lru_cache(maxsize=4096)
+def normalize_field_text(text):
+    """
+    Normalize a field or column name: tokenize, lemmatize and remove stopwords.
+    """
+    lemmatizer, stop_words = get_nltk_tools()
+    tokens = word_tokenize(text.lower())  # Tokenize and lowercase
+    tokens = [lemmatizer.lemmatize(token) for token in tokens]  # Lemmatize
+    tokens = [token for token in tokens if token not in stop_words]  # Remove stopwords
+    return "".join(tokens)  # Join tokens to form a normalized string
+
+# Fuzzy matching through a character-trigram inverted index. Only keys that share
+# trigrams with the user's text are scored with SequenceMatcher, using the same
+# scoring and cutoff as difflib.get_close_matches.
+TRIGRAM_CANDIDATE_LIMIT = 200
+
+def text_trigrams(text):
+    """
+    Return the set of character trigrams of the text, padded so short names still produce trigrams.
+    """
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def build_trigram_index(keys):
+    """
+    Build a trigram -> keys inverted index.
+    """
+    index = {}
+    for key in keys:
+        for trigram in text_trigrams(key):
+            index.setdefault(trigram, set()).add(key)
+    return index
+
+def score_close_matches(word, candidates, cutoff=0.6):
+    """
+    Score candidates against word exactly like difflib.get_close_matches and return {candidate: score} above cutoff.
+    """
+    scores = {}
+    matcher = SequenceMatcher()
+    matcher.set_seq2(word)
+    for candidate in candidates:
+        matcher.set_seq1(candidate)
+        if (matcher.real_quick_ratio() >= cutoff and
+                matcher.quick_ratio() >= cutoff and
+                matcher.ratio() >= cutoff):
+            scores[candidate] = matcher.ratio()
+    return scores
+
+def trigram_candidates(word, trigram_index):
+    """
+    Return the keys sharing the most trigrams with word, capped at TRIGRAM_CANDIDATE_LIMIT.
+    """
+    shared = {}
+    for trigram in text_trigrams(word):
+        for key in trigram_index.get(trigram, ()):
+            shared[key] = shared.get(key, 0) + 1
+    if len(shared) <= TRIGRAM_CANDIDATE_LIMIT:
+        return list(shared)
+    return heapq.nlargest(TRIGRAM_CANDIDATE_LIMIT, shared, key=shared.get)
+
+def trigram_close_matches(word, keys, trigram_index, n=1, cutoff=0.6):
     """
+    Drop-in replacement for difflib.get_close_matches backed by a trigram index over keys.
+    Falls back to the linear difflib scan when no key shares a trigram with word.
+    """
+    candidates = trigram_candidates(word, trigram_index)
+    if not candidates:
+        return get_close_matches(word, keys, n=n, cutoff=cutoff)
+
+    scores = score_close_matches(word, candidates, cutoff)
+    best = heapq.nlargest(n, ((score, candidate) for candidate, score in scores.items()))
+    return [candidate for score, candidate in best]
 
-    # Initialize NLTK tools
-    lemmatizer = WordNetLemmatizer()
-    stop_words = set(stopwords.words("english"))
+# Normalized column indexes keyed by id() of the schema dict they were built from.
+# Catalog schemas are rebuilt on refresh, so each entry covers one schema version.
+_schema_field_indexes = {}
+_schema_field_indexes_lock = threading.Lock()
+SCHEMA_FIELD_INDEX_LIMIT = 8
 
-    # Normalize user field (tokenize, lemmatize, and remove stopwords)
-    def normalize(text):
-        tokens = word_tokenize(text.lower())  # Tokenize and lowercase
-        tokens = [lemmatizer.lemmatize(token) for token in tokens]  # Lemmatize
-        tokens = [token for token in tokens if token not in stop_words]  # Remove stopwords
-        return "".join(tokens)  # Join tokens to form a normalized string
-    # Normalize schema columns
+def _cached_schema_index(schema, build):
+    """
+    Return the index built by build(schema), building it once per schema dict.
+    """
+    key = (id(schema), build)
+    with _schema_field_indexes_lock:
+        cached = _schema_field_indexes.get(key)
+    if cached is not None and cached[0] is schema:
+        return cached[1]
+
+    index = build(schema)
+    with _schema_field_indexes_lock:
+        # Keep the schema itself alive next to its index so the id() cannot be reused
+        _schema_field_indexes[key] = (schema, index)
+        while len(_schema_field_indexes) > SCHEMA_FIELD_INDEX_LIMIT:
+            _schema_field_indexes.pop(next(iter(_schema_field_indexes)))
+    return index
+
+def _build_schema_field_index(schema):
     field_mapping = {}
+    column_tables = {}
     for table, columns in schema.items():
         for column in columns:
-            normalized_column = normalize(column)
-            field_mapping[normalized_column] = column  # Map normalized column to the original
+            field_mapping[normalize_field_text(column)] = column  # Map normalized column to the original
+            column_tables.setdefault(column, set()).add(table)
+    return {
+        "fields": field_mapping,
+        "column_tables": column_tables,
+        "positions": {table: position for position, table in enumerate(schema)},
+        "trigrams": build_trigram_index(field_mapping)
+    }
+
+def get_schema_field_index(schema):
+    """
+    Return the normalized column -> original column mapping, the inverted column -> tables index
+    and the trigram index for a MySQL schema, building them once per schema version.
+    """
+    return _cached_schema_index(schema, _build_schema_field_index)
+
+def _build_collection_field_index(schema):
+    field_collections = {}
+    for collection, fields in schema.items():
+        for field in fields:
+            field_collections.setdefault(field, set()).add(collection)
+    return {
+        "field_collections": field_collections,
+        "positions": {collection: position for position, collection in enumerate(schema)},
+        "trigrams": build_trigram_index(field_collections)
+    }
+
+def get_collection_field_index(schema):
+    """
+    Return the inverted field -> collections index and its trigram index for a MongoDB schema.
+    """
+    return _cached_schema_index(schema, _build_collection_field_index)
+
+def map_field_to_column(user_field, schema):
+    """
+    Map user-provided field names to actual database columns using schema.
+    Leverage NLTK for tokenization, lemmatization, and normalization.
+    """
+    index = get_schema_field_index(schema)
+    field_mapping = index["fields"]
 
     # Normalize user input
-    user_field_normalized = normalize(user_field)
+    user_field_normalized = normalize_field_text(user_field)
 
     # Attempt to find the closest match
-    match = get_close_matches(user_field_normalized, field_mapping.keys(), n=1, cutoff=0.6)
-    
+    match = trigram_close_matches(user_field_normalized, field_mapping.keys(), index["trigrams"], n=1, cutoff=0.6)
+
     if match:
         mapped_field = field_mapping[match[0]]
         return mapped_field
@@ -949,51 +3862,165 @@ def map_field_to_column(user_field, schema):
     print(f"Failed to map field '{user_field}'.")
     return user_field
 
-def find_table_for_columns(columns, schema):
-   
-    for table, table_columns in schema.items():
-       
-        if all(column in table_columns for column in columns):
-          
-            return table
+def benchmark_fuzzy_matching(num_columns=20000, num_lookups=200, seed=0):
+    """
+    Compare the trigram index against the linear difflib scan on a synthetic schema and print timings.
+    """
+    rng = random.Random(seed)
+    words = ["customer", "order", "payment", "amount", "total", "date", "name", "first", "last", "address",
+             "city", "country", "store", "staff", "rental", "film", "category", "language", "price", "count",
+             "status", "email", "phone", "created", "updated", "inventory", "actor", "title", "rating", "score"]
+    columns = list({"_".join(rng.sample(words, rng.randint(2, 3))) + f"_{i % 97}" for i in range(num_columns)})
+
+    def perturb(column):
+        position = rng.randrange(len(column))
+        return column[:position] + rng.choice("abcdefghijklmnopqrstuvwxyz") + column[position + 1:]
+
+    lookups = [perturb(rng.choice(columns)) for _ in range(num_lookups)]
+
+    start = time.perf_counter()
+    index = build_trigram_index(columns)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    linear_results = [get_close_matches(word, columns, n=1, cutoff=0.6) for word in lookups]
+    linear_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    trigram_results = [trigram_close_matches(word, columns, index, n=1, cutoff=0.6) for word in lookups]
+    trigram_seconds = time.perf_counter() - start
+
+    agreement = sum(1 for a, b in zip(linear_results, trigram_results) if a == b) / num_lookups
+    print(f"Columns: {len(columns)}, lookups: {num_lookups}")
+    print(f"Trigram index build: {build_seconds * 1000:.1f} ms")
+    print(f"difflib.get_close_matches: {linear_seconds * 1000 / num_lookups:.2f} ms per lookup")
+    print(f"Trigram index lookup:      {trigram_seconds * 1000 / num_lookups:.2f} ms per lookup")
+    print(f"Speedup: {linear_seconds / max(trigram_seconds, 1e-9):.1f}x, same result for {agreement:.1%} of lookups")
+
+def intersect_postings(postings, keys):
+    """
+    Return the set of tables (or collections) listed under every key of an inverted index,
+    intersecting from the smallest set.
+    """
+    sets = sorted((postings.get(key, set()) for key in keys), key=len)
+    if not sets:
+        return set()
+    return sets[0].intersection(*sets[1:])
 
-    return None
+def _best_ranked(names, ranking, positions):
+    """
+    Pick the highest ranked name, falling back to schema order.
+    """
+    return max(names, key=lambda name: (ranking.get(name, ()), -positions[name]))
+
+def find_table_for_columns(columns, schema, ranking=None):
+    """
+    Return the table containing all the columns. When several do, the highest ranked one
+    (see mysql_table_ranking) wins, then the first in schema order.
+    """
+    index = get_schema_field_index(schema)
+    tables = intersect_postings(index["column_tables"], columns)
+    if not tables:
+        return None
+    return _best_ranked(tables, ranking or {}, index["positions"])
 
 sql_patterns = [
     {
+        "name": "count",
+        "keywords": ["count", "number of", "how many"],
         "pattern": r"\b(count|number of|how many)\b\s+([\w\s]+)\s+(group by|by|categorized by|organized by)\s+(\w+)(?:\s+having\s+([\w\s<>!=\'\"]+))?",
         "description": "Counts occurrences of '<field>' grouped by '<group_field>' with optional 'HAVING' clause.",
-        "query_template": "SELECT {group_by}, COUNT({total_field}) AS total FROM {table} GROUP BY {group_by} {having_clause};"
+        "query_template": "SELECT {group_by}, COUNT({total_field}) AS total FROM {table} GROUP BY {group_by} {having_clause};",
+        "field_placeholder": "total_field"
     },
     {
+        "name": "sum",
+        "keywords": ["sum", "add up", "aggregate", "total"],
         "pattern": r"\b(sum|add up|aggregate|total)\b\s+([\w\s]+)\s+(groupby|by|group by|categorized by|organized by)\s+(\w+)(?:\s+having\s+([\w\s<>!=().]+))?",
         "description": "Calculates the sum of '<field>' grouped by '<group_field>' with optional 'HAVING' clause.",
-        "query_template": "SELECT {group_by}, SUM({sum_field}) AS total_sum FROM {table} GROUP BY {group_by} {having_clause};"
+        "query_template": "SELECT {group_by}, SUM({sum_field}) AS total_sum FROM {table} GROUP BY {group_by} {having_clause};",
+        "field_placeholder": "sum_field",
+        "having_alias": "total_sum"
     },
     {
+        "name": "average",
+        "keywords": ["average", "avg", "mean", "compute average"],
         "pattern": r"\b(average|avg|mean|compute average)\s+([\w\s]+)\s+(groupby|by|group by|categorized by|organized by)\s+(\w+)(?:\s+having\s+(.+))?",
         "description": "Calculates the average of '<field>' grouped by '<group_field>' with optional 'HAVING' clause.",
-        "query_template": "SELECT {group_by}, AVG({avg_field}) AS average FROM {table} GROUP BY {group_by} {having_clause};"
+        "query_template": "SELECT {group_by}, AVG({avg_field}) AS average FROM {table} GROUP BY {group_by} {having_clause};",
+        "field_placeholder": "avg_field",
+        "having_alias": "average"
     },
-    
-   {
-    "pattern": r"\b(select|filter|find)\b\s+([\w\s]+)\s+(group by|groupby|by)\s+([\w\s]+)\s+where\s+(.+)",
-    "description": "Selects rows from '<table>' where '<condition>' grouped by '<group_field>'.",
-    "query_template": "SELECT * FROM {table} {where_clause} GROUP BY {group_by};"
-}
-
-
+    {
+        "name": "select",
+        "keywords": ["select", "filter", "find"],
+        "pattern": r"\b(select|filter|find)\b\s+([\w\s]+)\s+(group by|groupby|by)\s+([\w\s]+)\s+where\s+(.+)",
+        "description": "Selects rows from '<table>' where '<condition>' grouped by '<group_field>'.",
+        "query_template": "SELECT * FROM {table} {where_clause} GROUP BY {group_by};",
+        "field_placeholder": "total_field"
+    }
+]
 
+def build_pattern_registry(patterns):
+    """
+    Build a registry of natural language patterns, compiled once and dispatched by keyword.
+    """
+    registry = {"patterns": [], "keyword_index": {}, "unfiltered": [], "keyword_matcher": None}
+    for pattern in patterns:
+        register_nl_pattern(registry, pattern)
+    return registry
 
+def register_nl_pattern(registry, pattern):
+    """
+    Add a pattern to a registry. Patterns are tried in registration order; a pattern is only
+    tried when one of its "keywords" occurs in the query (patterns without keywords are always tried).
+    """
+    entry = dict(pattern)
+    entry["compiled"] = re.compile(pattern["pattern"], re.IGNORECASE)
+    entry["position"] = len(registry["patterns"])
+    registry["patterns"].append(entry)
+
+    keywords = [keyword.lower() for keyword in pattern.get("keywords", [])]
+    if not keywords:
+        registry["unfiltered"].append(entry["position"])
+    for keyword in keywords:
+        registry["keyword_index"].setdefault(keyword, []).append(entry["position"])
+
+    # One alternation over every keyword, longest first so multi-word keywords win
+    alternatives = sorted(registry["keyword_index"], key=len, reverse=True)
+    registry["keyword_matcher"] = re.compile(
+        r"\b(" + "|".join(re.escape(keyword) for keyword in alternatives) + r")\b", re.IGNORECASE
+    ) if alternatives else None
+    return entry
+
+def match_nl_intent(registry, user_query):
+    """
+    Return the intent of the first registered pattern matching the query, or None.
+    The intent holds the pattern name, the matched operation, the regex groups and the pattern entry.
+    """
+    positions = set(registry["unfiltered"])
+    if registry["keyword_matcher"] is not None:
+        for keyword in registry["keyword_matcher"].findall(user_query):
+            positions.update(registry["keyword_index"][keyword.lower()])
+
+    for position in sorted(positions):
+        entry = registry["patterns"][position]
+        match = entry["compiled"].search(user_query)
+        if match:
+            return {
+                "name": entry["name"],
+                "operation": match.group(1).lower(),
+                "groups": match.groups(),
+                "pattern": entry
+            }
+    return None
 
-]
+SQL_PATTERN_REGISTRY = build_pattern_registry(sql_patterns)
 
 def process_natural_language_query_mysql(user_query, connection=None, db_type="MySQL"):
     """
     Process the natural language query and map it to a SQL query, with support for HAVING, WHERE, and comparison operators.
     """
-    import re
-
     user_query = user_query.replace("group by", "by")
     # Fetch schema dynamically if MySQL
     if connection and db_type == "MySQL":
@@ -1001,83 +4028,91 @@ def process_natural_language_query_mysql(user_query, connection=None, db_type="M
     else:
         schema = {}
 
-    for pattern in sql_patterns:
-        match = re.search(pattern["pattern"], user_query, re.IGNORECASE)
-        if match:
-            groups = match.groups()
-            print(f"Matched groups: {groups}")
-            operation = groups[0]  # Extract operation (e.g., "count", "sum")
-            field = groups[1]  # Extract target field
-            group_by = groups[3] if len(groups) > 3 else None  # Extract group by field
-            if len(groups) > 4 and groups[4]:
-                condition = groups[4].strip()
-              
-            else:
-                condition = None
-                print("Condition not captured.")
-
-           
-            # Map fields to schema columns
-            field_mapped = clean_and_map_field(field, schema)
-            group_by_mapped = clean_and_map_field(group_by, schema) if group_by else None
-
-            total_field_mapped = map_field_to_column(field_mapped, schema)
-            group_by_mapped = map_field_to_column(group_by_mapped, schema)
+    intent = match_nl_intent(SQL_PATTERN_REGISTRY, user_query)
+    if intent:
+        pattern = intent["pattern"]
+        groups = intent["groups"]
+        print(f"Matched groups: {groups}")
+        field = groups[1]  # Extract target field
+        group_by = groups[3] if len(groups) > 3 else None  # Extract group by field
+        if len(groups) > 4 and groups[4]:
+            condition = groups[4].strip()
+          
+        else:
+            condition = None
+            print("Condition not captured.")
+
+
+        # Map fields to schema columns
+        field_mapped = clean_and_map_field(field, schema)
+        group_by_mapped = clean_and_map_field(group_by, schema) if group_by else None
+
+        total_field_mapped = map_field_to_column(field_mapped, schema)
+        group_by_mapped = map_field_to_column(group_by_mapped, schema)
+
+        # Identify the table that contains the fields, or join the tables holding them
+        # along the shortest foreign key path
+        fields = [total_field_mapped] + ([group_by_mapped] if group_by else [])
+        table = find_table_for_columns(fields, schema, mysql_table_ranking(connection) if connection else None)
+        join_plan = None
+        if not table and connection:
+            # The condition's columns must be reachable from the joined tables too
+            schema_columns = {column for columns in schema.values() for column in columns}
+            condition_columns = [name for name in sql_expression_columns(condition or "") if name in schema_columns]
+            join_plan = plan_join(list(dict.fromkeys(fields + condition_columns)), schema, get_join_graph(connection))
+            if join_plan:
+                table = join_clause(join_plan)
+        if not table:
+            print(f"Error: Could not find a table containing the fields '{field}' and '{group_by}'.")
+            return None
+
+        # The pattern names the template placeholder for the target field and the HAVING alias
+        field_placeholder = pattern["field_placeholder"]
+        if condition and "having" in user_query.lower():
+            if pattern.get("having_alias"):
+                condition = condition.replace(total_field_mapped, pattern["having_alias"])
+            having_clause = f"HAVING {qualify_join_columns(condition, join_plan) if join_plan else condition}"
+        else:
+            having_clause = ""
 
-            # Identify the table that contains the fields
-            table = find_table_for_columns([total_field_mapped] + ([group_by_mapped] if group_by else []), schema)
-            if not table:
-                print(f"Error: Could not find a table containing the fields '{field}' and '{group_by}'.")
-                return None
+        if condition and "where" in user_query.lower():
+            where_clause = f"WHERE {qualify_join_columns(condition, join_plan) if join_plan else condition}"
+        else:
+            where_clause = ""
 
-            # Determine the placeholder dynamically based on the operation
-            field_placeholder = (
-                "avg_field" if operation.lower() in ["average", "avg", "mean", "compute average"] else
-                "sum_field" if operation.lower() in ["sum", "add up", "aggregate", "total"] else
-                "total_field"
-            )
-            if condition and "having" in user_query.lower():
-                if "sum_field" in field_placeholder:
-                    condition = condition.replace(total_field_mapped, "total_sum")
-                elif "avg_field" in field_placeholder:
-                    condition = condition.replace(total_field_mapped, "average")
-                having_clause = f"HAVING {condition}"
-            else:
-                having_clause = ""
+        # Ensure there is no duplicate WHERE
+        if where_clause.startswith("WHERE WHERE"):
+            where_clause = where_clause.replace("WHERE WHERE", "WHERE")
 
-            if condition and "where" in user_query.lower():
-                where_clause = f"WHERE {condition}"
-            else:
-                where_clause = ""
+        print(f"Condition: {condition}, Having Clause: {having_clause}, Where Clause: {where_clause}")
 
-            # Ensure there is no duplicate WHERE
-            if where_clause.startswith("WHERE WHERE"):
-                where_clause = where_clause.replace("WHERE WHERE", "WHERE")
+        if join_plan:
+            total_field_mapped = qualify_join_columns(total_field_mapped, join_plan)
+            if group_by_mapped:
+                group_by_mapped = qualify_join_columns(group_by_mapped, join_plan)
 
-            print(f"Condition: {condition}, Having Clause: {having_clause}, Where Clause: {where_clause}")
-        
-            # Construct the query dynamically
-            try:
-                query = pattern["query_template"].format(
-                    **{
-                        field_placeholder: total_field_mapped,
-                        "group_by": group_by_mapped,
-                        "table": table, 
-                        "having_clause": having_clause,
-                        "where_clause": where_clause
-                    }
-                )
-            except KeyError as e:
-                print(f"Error: Missing placeholder in the query template: {e}")
-                return None
+        # Construct the query dynamically
+        try:
+            query = pattern["query_template"].format(
+                **{
+                    field_placeholder: total_field_mapped,
+                    "group_by": group_by_mapped,
+                    "table": table, 
+                    "having_clause": having_clause,
+                    "where_clause": where_clause
+                }
+            )
+        except KeyError as e:
+            print(f"Error: Missing placeholder in the query template: {e}")
+            return None
 
-            # Dynamically update the description
-            description = pattern["description"].replace("<field>", field).replace("<group_field>", group_by)
+        # Dynamically update the description
+        description = pattern["description"].replace("<field>", field).replace("<group_field>", group_by)
 
-            return {
-                "description": description,
-                "query": query
-            }
+        return {
+            "description": description,
+            "query": query
+        }
 
     print("No matching query pattern found for the given natural language query.")
     return None
@@ -1088,47 +4123,253 @@ def clean_field(field):
     cleaned_field = re.sub(r"\b(grouped|group by|from|where|having|select|order|as|into)\b", "", field, flags=re.IGNORECASE).strip()
    
     return cleaned_field.strip()
-def generate_join_query(columns, schema):
-   
-    tables_with_columns = {table: [col for col in columns if col in table_columns] 
-                           for table, table_columns in schema.items()}
-    involved_tables = [table for table, cols in tables_with_columns.items() if cols]
-    if len(involved_tables) > 1:
-        
-        join_query = f"SELECT {columns[0]}, COUNT({columns[1]}) FROM {involved_tables[0]} "
-        join_query += f"INNER JOIN {involved_tables[1]} ON {involved_tables[0]}.key = {involved_tables[1]}.key "
-        join_query += f"GROUP BY {columns[0]}"
-        return join_query
-    return None
 def clean_and_map_field(field, schema):
    
     cleaned_field = clean_field(field)  
     mapped_field = map_field_to_column(cleaned_field, schema) 
     return mapped_field
 
-def mongo_get_collection_schema(db):
+# Schema inference: each collection is profiled from a $sample of MONGO_SCHEMA_SAMPLE_SIZE documents.
+# A profile counts, per dotted field path, the documents containing it and the BSON types seen.
+MONGO_SCHEMA_SAMPLE_SIZE = 200
+MONGO_SCHEMA_MAX_DEPTH = 4
+# Fields present in fewer sampled documents than this are not used for generated queries
+MONGO_FIELD_MIN_PRESENCE = 0.1
+_MONGO_TYPE_NAMES = {
+    str: "string", int: "int", bson.int64.Int64: "long", float: "double", bson.decimal128.Decimal128: "decimal",
+    bool: "bool", dict: "object", list: "array", type(None): "null", datetime.datetime: "date",
+    ObjectId: "objectId", bytes: "binData", bson.binary.Binary: "binData", bson.timestamp.Timestamp: "timestamp",
+}
+_MONGO_TYPE_KINDS = {"int": "numeric", "long": "numeric", "double": "numeric", "decimal": "numeric",
+                     "string": "text", "date": "date"}
+_mongo_collection_profiles = {}
+# Field names per collection, cached per MongoDB database so the field index is reused across queries
+_mongo_schemas = {}
 
+def mongo_type_name(value):
     """
-    Fetch schema information dynamically from MongoDB collections.
+    BSON type name of a decoded value. Documents uploaded as plain JSON keep dates as {"$date": ...}.
     """
-    schema = {}
-    collections = db.list_collection_names()
-    for collection_name in collections:
-        collection = db[collection_name]
-        sample_doc = collection.find_one()
-        if sample_doc:
-            schema[collection_name] = list(sample_doc.keys())  # Collect field names from a sample document
+    if isinstance(value, dict) and "$date" in value:
+        return "date"
+    return _MONGO_TYPE_NAMES.get(type(value), type(value).__name__)
+
+def _record_document_fields(fields, document, prefix="", depth=0, seen=None):
+    """
+    Add one document's field paths and value types to the histogram. Embedded documents, also inside
+    arrays, are recorded under dotted paths; each path counts at most once per document.
+    """
+    seen = set() if seen is None else seen
+    for key, value in document.items():
+        path = prefix + key
+        entry = fields.setdefault(path, {"count": 0, "types": {}, "values": []})
+        if path not in seen:
+            seen.add(path)
+            entry["count"] += 1
+        type_name = mongo_type_name(value)
+        entry["types"][type_name] = entry["types"].get(type_name, 0) + 1
+        if type_name in _MONGO_TYPE_KINDS or type_name in ("bool", "null"):
+            entry["values"].append(value)
+        if depth >= MONGO_SCHEMA_MAX_DEPTH:
+            continue
+        if type_name == "object":
+            _record_document_fields(fields, value, path + ".", depth + 1, seen)
+        elif type_name == "array":
+            for item in value:
+                if isinstance(item, dict):
+                    _record_document_fields(fields, item, path + ".", depth + 1, seen)
+
+def sample_collection_fields(collection, sample_size=None, match=None):
+    """
+    Build field histograms from a $sample of the collection (optionally of the documents matching match).
+    With --seed the first documents in _id order are used instead, so generated literals are reproducible.
+    """
+    size = sample_size or MONGO_SCHEMA_SAMPLE_SIZE
+    sample = [{"$sample": {"size": size}}] if QUERY_LIBRARY_SEED is None else [{"$sort": {"_id": 1}}, {"$limit": size}]
+    pipeline = ([{"$match": match}] if match else []) + sample
+    profile = {"sampled": 0, "fields": {}}
+    for document in collection.aggregate(pipeline):
+        profile["sampled"] += 1
+        _record_document_fields(profile["fields"], document)
+    return profile
+
+def _scale_collection_fields(profile, documents):
+    """
+    Shrink a profile to stand for a sample of the given number of documents: field and type counts
+    are scaled and the values subsampled by the same factor, so every ratio keeps its denominator.
+    """
+    if documents >= profile["sampled"]:
+        return
+    factor = documents / profile["sampled"] if profile["sampled"] else 0
+    profile["sampled"] = documents
+    for path in list(profile["fields"]):
+        entry = profile["fields"][path]
+        entry["count"] = round(entry["count"] * factor)
+        if not entry["count"]:
+            del profile["fields"][path]
+            continue
+        entry["types"] = {type_name: round(count * factor) for type_name, count in entry["types"].items()}
+        rng = random if QUERY_LIBRARY_SEED is None else random.Random(f"{QUERY_LIBRARY_SEED}/{path}")
+        entry["values"] = rng.sample(entry["values"], round(len(entry["values"]) * factor))
+        entry.pop("statistics", None)
+
+def _merge_collection_fields(profile, addition, populations=None):
+    """
+    Add the histograms of a newer sample to an existing profile. Beyond MONGO_SCHEMA_SAMPLE_SIZE
+    documents both are first scaled down, each to its share of the documents they were sampled from
+    (populations, as (profile's, addition's) document counts; by default their sample sizes).
+    """
+    excess = profile["sampled"] + addition["sampled"] - MONGO_SCHEMA_SAMPLE_SIZE
+    if excess > 0:
+        old, new = populations or (profile["sampled"], addition["sampled"])
+        share = round(MONGO_SCHEMA_SAMPLE_SIZE * old / (old + new)) if old + new else 0
+        keep = min(profile["sampled"], max(MONGO_SCHEMA_SAMPLE_SIZE - addition["sampled"], share))
+        _scale_collection_fields(profile, keep)
+        _scale_collection_fields(addition, MONGO_SCHEMA_SAMPLE_SIZE - keep)
+    profile["sampled"] += addition["sampled"]
+    for path, new_entry in addition["fields"].items():
+        entry = profile["fields"].setdefault(path, {"count": 0, "types": {}, "values": []})
+        entry["count"] += new_entry["count"]
+        for type_name, count in new_entry["types"].items():
+            entry["types"][type_name] = entry["types"].get(type_name, 0) + count
+        entry["values"] = entry["values"] + new_entry["values"]
+        entry.pop("statistics", None)  # Recomputed on next use
+
+def _newest_object_id(collection):
+    """
+    Return the largest _id of the collection if it is an ObjectId (insertion order), otherwise None.
+    """
+    newest = next(iter(collection.find({}, {"_id": 1}).sort([("_id", -1)]).limit(1)), None)
+    return newest["_id"] if newest and isinstance(newest.get("_id"), ObjectId) else None
+
+def get_mongo_collection_profile(db, collection_name, refresh=False):
+    """
+    Return the cached field profile of a collection. On refresh (or after invalidate_mongo_schema) the
+    collection statistics are compared first: an unchanged collection keeps its profile, one that only
+    grew is sampled among the new documents and merged in, anything else is sampled again.
+    """
+    key = (db, collection_name)
+    profile = _mongo_collection_profiles.get(key)
+    if profile is not None and not refresh and not profile["stale"]:
+        return profile
+
+    version = mongodb_collection_versions(db, collection_name, [])[0][1:]
+    if profile is not None and profile["version"] == version:
+        profile["stale"] = False
+        return profile
+
+    # Sample outside the lock, so collections are profiled concurrently; the merge works on a copy
+    # and the result is published under the lock, so readers never see a half-merged profile
+    collection = db[collection_name]
+    if (profile is not None and profile["newest_id"] is not None
+            and version[0] is not None and profile["version"][0] is not None and version[0] > profile["version"][0]):
+        addition = sample_collection_fields(collection, match={"_id": {"$gt": profile["newest_id"]}})
+    else:
+        addition = None
+        new_profile = sample_collection_fields(collection)
+    newest_id = _newest_object_id(collection)
+    with _catalog_lock:
+        current = _mongo_collection_profiles.get(key)
+        if current is not None and current is not profile and current["version"] == version:
+            return current  # Another thread refreshed it meanwhile
+        if addition is not None:
+            new_profile = {"sampled": profile["sampled"],
+                           "fields": {path: {"count": entry["count"], "types": dict(entry["types"]),
+                                             "values": list(entry["values"])}
+                                      for path, entry in profile["fields"].items()}}
+            _merge_collection_fields(new_profile, addition, (profile["version"][0], version[0] - profile["version"][0]))
+        new_profile.update(version=version, newest_id=newest_id, stale=False)
+        _mongo_collection_profiles[key] = new_profile
+    return new_profile
+
+def get_mongo_schema_profiles(db, refresh=False):
+    """
+    Return {collection name: profile} for every collection, profiling collections concurrently.
+    """
+    collection_names = db.list_collection_names()
+    with _catalog_lock:
+        for key in [key for key in _mongo_collection_profiles if key[0] == db and key[1] not in collection_names]:
+            del _mongo_collection_profiles[key]
+    if not collection_names:
+        return {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(VALIDATION_WORKERS, len(collection_names))) as executor:
+        profiles = executor.map(lambda name: get_mongo_collection_profile(db, name, refresh), collection_names)
+        return dict(zip(collection_names, profiles))
+
+def mongo_field_kinds(profile):
+    """
+    Split a profile's fields by their most common type into (numeric, text, date) field lists.
+    Rare fields (below MONGO_FIELD_MIN_PRESENCE) are left out.
+    """
+    kinds = {"numeric": [], "text": [], "date": []}
+    for path, entry in profile["fields"].items():
+        if entry["count"] < profile["sampled"] * MONGO_FIELD_MIN_PRESENCE:
+            continue
+        kind = _MONGO_TYPE_KINDS.get(max(entry["types"], key=entry["types"].get))
+        if kind:
+            kinds[kind].append(path)
+    return kinds["numeric"], kinds["text"], kinds["date"]
+
+def mongo_field_statistics(profile):
+    """
+    Return {field path: statistics} for a collection profile, computed from the sampled values
+    the first time they are needed and cached in the profile.
+    """
+    total = profile["version"][0] if profile.get("version") else None
+    statistics = {}
+    for path, entry in profile["fields"].items():
+        if "statistics" not in entry:
+            # Documents without the field count as nulls, like a NULL column in SQL
+            values = entry["values"] + [None] * (profile["sampled"] - entry["count"])
+            entry["statistics"] = summarize_values(values, total)
+        statistics[path] = entry["statistics"]
+    return statistics
+
+def mongo_get_collection_schema(db, refresh=False):
+
+    """
+    Fetch schema information dynamically from MongoDB collections: every field path found
+    in a sample of each collection. The result is cached per database until refreshed or invalidated.
+    """
+    if not refresh and db in _mongo_schemas:
+        return _mongo_schemas[db]
+
+    schema = {collection_name: list(profile["fields"])
+              for collection_name, profile in get_mongo_schema_profiles(db, refresh).items() if profile["sampled"]}
+    _mongo_schemas[db] = schema
     return schema
-def mongo_find_collection_for_fields(fields, schema):
+
+def invalidate_mongo_schema(db):
     """
-    Find a MongoDB collection containing all specified fields.
+    Drop the cached MongoDB schema so the next lookup re-reads the collections.
+    Collection profiles are kept but re-checked against the collection statistics.
     """
-    for collection, collection_fields in schema.items():
-        if all(field in collection_fields for field in fields):
-            return collection
-    return None
+    _mongo_schemas.pop(db, None)
+    with _catalog_lock:
+        for key, profile in _mongo_collection_profiles.items():
+            if key[0] == db:
+                profile["stale"] = True
+
+def mongo_collection_ranking(db):
+    """
+    Rank profiled collections by their document count, for resolving fields found in several collections.
+    """
+    return {name: (profile["version"][0] or 0,) for (owner, name), profile in list(_mongo_collection_profiles.items())
+            if owner == db}
+
+def mongo_find_collection_for_fields(fields, schema, ranking=None):
+    """
+    Find a MongoDB collection containing all specified fields; the largest one (by ranking) when several do.
+    """
+    index = get_collection_field_index(schema)
+    collections = intersect_postings(index["field_collections"], fields)
+    if not collections:
+        return None
+    return _best_ranked(collections, ranking or {}, index["positions"])
 mongo_patterns = [
     {
+        "name": "count",
+        "keywords": ["count", "number of", "how many"],
         "pattern": r"\b(count|number of|how many)\b\s+([\w\s]+)\s+(group by|by|categorized by|organized by)\s+(\w+)(?:\s+having\s+([\w\s<>!=().]+))?",
         "description": "Counts occurrences of '<field>' grouped by '<group_field>' with optional 'HAVING' clause.",
         "query_template": [
@@ -1137,6 +4378,8 @@ mongo_patterns = [
         ]
     },
     {
+        "name": "sum",
+        "keywords": ["sum", "add up", "aggregate", "total"],
         "pattern": r"\b(sum|add up|aggregate|total)\b\s+([\w\s]+)\s+(groupby|by|group by|categorized by|organized by)\s+(\w+)(?:\s+having\s+([\w\s<>!=().]+))?",
         "description": "Calculates the sum of '<field>' grouped by '<group_field>' with optional 'HAVING' clause.",
         "query_template": [
@@ -1145,6 +4388,8 @@ mongo_patterns = [
         ]
     },
     {
+        "name": "average",
+        "keywords": ["average", "avg", "mean", "compute average"],
         "pattern": r"\b(average|avg|mean|compute average)\s+([\w\s]+)\s+(groupby|by|group by|categorized by|organized by)\s+(\w+)(?:\s+having\s+([\w\s<>!=().]+))?",
         "description": "Calculates the average of '<field>' grouped by '<group_field>' with optional 'HAVING' clause.",
         "query_template": [
@@ -1152,251 +4397,179 @@ mongo_patterns = [
             {"$match": {}}
         ]
     },
-   {
-    "pattern": r"\b(select|filter|find)\b\s+([\w\s]+)\s+(where)\s+(\w+)\s*(==|!=|>|<|>=|<=|=)\s*['\"]?(.+?)['\"]?$",
-    "description": "Finds documents from '<collection>' where '<field> <operator> <value>' applies.",
-    "query_template": [{"$match": {}}]
-}
-
+    {
+        "name": "select",
+        "keywords": ["select", "filter", "find"],
+        "pattern": r"\b(select|filter|find)\b\s+([\w\s]+)\s+(where)\s+(\w+)\s*(==|!=|>|<|>=|<=|=)\s*['\"]?(.+?)['\"]?$",
+        "description": "Finds documents from '<collection>' where '<field> <operator> <value>' applies.",
+        "query_template": [{"$match": {}}]
+    }
+]
 
+MONGO_PATTERN_REGISTRY = build_pattern_registry(mongo_patterns)
+
+# Comparison operators shared by HAVING and WHERE conditions
+MONGO_OPERATOR_MAP = {
+    ">": "$gt",
+    "<": "$lt",
+    ">=": "$gte",
+    "<=": "$lte",
+    "==": "$eq",
+    "=": "$eq",
+    "!=": "$ne"
+}
 
-]
+# $group output field, accumulator and HAVING condition parser for each grouping intent
+MONGO_GROUP_INTENTS = {
+    "count": {
+        "output": "count",
+        "accumulator": lambda field: {"$sum": 1},
+        "having": re.compile(r"(?i)(count)\s*(>|<|>=|<=|==|!=)\s*(\d+)")
+    },
+    "sum": {
+        "output": "total_sum",
+        "accumulator": lambda field: {"$sum": f"${field}"},
+        "having": re.compile(r"(?i)(sum|total_sum)\s*(>|<|>=|<=|==|!=)\s*(\d+)")
+    },
+    "average": {
+        "output": "average",
+        "accumulator": lambda field: {"$avg": f"${field}"},
+        "having": re.compile(r"(?i)(average)\s*(>|<|>=|<=|==|!=)\s*(\d+)")
+    }
+}
 
 def process_natural_language_query_mongodb(user_query, db=None):
     """
     Process natural language query for MongoDB and generate an aggregation pipeline.
     """
-    import re
     user_query = user_query.replace("group by", "by")
 
-    def normalize_field_name(user_field, schema):
+    def field_matches(user_field, index):
         """
-        Normalize user-provided field names to match MongoDB schema fields.
+        Score the schema fields close to a user-provided field name.
         """
-        from difflib import get_close_matches
         normalized_field = user_field.strip().lower().replace(" ", "_")  # Basic normalization
-        for collection, fields in schema.items():
-            closest_match = get_close_matches(normalized_field, fields, n=1, cutoff=0.6)
-            if closest_match:
-                return closest_match[0], collection
-        return None, None
+        candidates = trigram_candidates(normalized_field, index["trigrams"]) or index["field_collections"]
+        return score_close_matches(normalized_field, candidates, cutoff=0.6)
+
+    def best_field(scores, collection, index):
+        """
+        Return the closest matching field that the collection contains.
+        """
+        return max((score, field) for field, score in scores.items() if collection in index["field_collections"][field])[1]
 
     # Fetch the schema
     schema = mongo_get_collection_schema(db)
 
-    for pattern in mongo_patterns:
-        match = re.search(pattern["pattern"], user_query, re.IGNORECASE)
-        if match:
-            groups = match.groups()
-            print(f"Matched groups: {groups}")
-            operation = groups[0]  # Extract operation (e.g., "find", "filter")
-            field = groups[1]  # Extract target field
-            group_by = groups[3] if len(groups) > 3 else None  # Extract group by field
-            where_field = groups[3] if len(groups) > 3 else None
-            operator = groups[4] if len(groups) > 4 else None  # Extract operator
-            value = groups[5] if len(groups) > 5 else None  # Extract value
-
-            # Map fields to schema fields
-            field_mapped, collection_for_field = normalize_field_name(field, schema)
-            group_by_mapped, collection_for_group_by = normalize_field_name(group_by, schema) if group_by else (None, None)
-            where_field_mapped, collection_for_where = normalize_field_name(where_field, schema)
-
-            
-            if not field_mapped:
-                print(f"Error: Could not map the field '{field}' to any collection.")
-                return None
-
-            if group_by and not group_by_mapped:
-                print(f"Error: Could not map the group_by field '{group_by}' to any collection.")
-                return None
-            if not where_field_mapped:
-                print(f"Error: Could not map the where field '{where_field}' to any collection.")
-                return None
-
-            # Ensure both fields are in the same collection
-            if collection_for_field != collection_for_where:
-                print(f"Error: Fields '{field_mapped}' and '{where_field_mapped}' are in different collections.")
-                return None
-            collection = collection_for_field
-
-            # Ensure both fields are in the same collection
-            if group_by and collection_for_field != collection_for_group_by:
-                print(f"Error: Fields '{field_mapped}' and '{group_by_mapped}' are in different collections.")
+    intent = match_nl_intent(MONGO_PATTERN_REGISTRY, user_query)
+    if intent:
+        pattern = intent["pattern"]
+        groups = intent["groups"]
+        print(f"Matched groups: {groups}")
+        field = groups[1]  # Extract target field
+        group_by = groups[3] if len(groups) > 3 else None  # Extract group by field
+        where_field = groups[3] if len(groups) > 3 else None
+        operator = groups[4] if len(groups) > 4 else None  # Extract operator
+        value = groups[5] if len(groups) > 5 else None  # Extract value
+
+        # Map fields to schema fields
+        index = get_collection_field_index(schema)
+        field_scores = field_matches(field, index)
+        group_by_scores = field_matches(group_by, index) if group_by else {}
+        where_scores = field_matches(where_field, index)
+
+        if not field_scores:
+            print(f"Error: Could not map the field '{field}' to any collection.")
+            return None
+
+        if group_by and not group_by_scores:
+            print(f"Error: Could not map the group_by field '{group_by}' to any collection.")
+            return None
+        if not where_scores:
+            print(f"Error: Could not map the where field '{where_field}' to any collection.")
+            return None
+
+        # The collection must hold a match for every field: intersect the collections of the candidate
+        # matches, preferring the largest collection when several qualify
+        holders = [set().union(*(index["field_collections"][match] for match in scores))
+                   for scores in (field_scores, group_by_scores, where_scores) if scores]
+        collections = holders[0].intersection(*holders[1:])
+        if not collections:
+            print(f"Error: Fields '{field}' and '{group_by or where_field}' are in different collections.")
+            return None
+        collection = _best_ranked(collections, mongo_collection_ranking(db), index["positions"])
+
+        field_mapped = best_field(field_scores, collection, index)
+        group_by_mapped = best_field(group_by_scores, collection, index) if group_by else None
+        where_field_mapped = best_field(where_scores, collection, index)
+
+        # Build the aggregation pipeline
+        pipeline = []
+        if value:
+            try:
+                # Parse value type
+                value = value.strip()  # Remove any surrounding whitespace
+                if (value.startswith('"') and value.endswith('"')) or (value.startswith("'") and value.endswith("'")):
+                    # String value
+                    value = value.strip('"').strip("'")
+                elif value.isdigit():  # Integer value
+                    value = int(value)
+                else:
+                    # Float value or leave as string if it cannot be parsed
+                    try:
+                        value = float(value)
+                    except ValueError:
+                        value = str(value)
+            except ValueError as ve:
+                print(f"Error: Unable to parse the value '{value}'.")
                 return None
-
-            # Build the aggregation pipeline
-            pipeline = []
-            if value:
-                try:
-                    # Parse value type
-                    value = value.strip()  # Remove any surrounding whitespace
-                    if (value.startswith('"') and value.endswith('"')) or (value.startswith("'") and value.endswith("'")):
-                        # String value
-                        value = value.strip('"').strip("'")
-                    elif value.isdigit():  # Integer value
-                        value = int(value)
-                    else:
-                        # Float value or leave as string if it cannot be parsed
-                        try:
-                            value = float(value)
-                        except ValueError:
-                            value = str(value)
-                except ValueError as ve:
-                    print(f"Error: Unable to parse the value '{value}'.")
-                    return None
-            if operation.lower() in ["count", "number of", "how many"]:
-                pipeline.append({
-                    "$group": {
-                        "_id": f"${group_by_mapped}",
-                        "count": {"$sum": 1}
-                    }
-                })
-                if groups[4]:  # HAVING condition exists
-                    having_condition = groups[4].strip()
-                    operator_map = {
-                        ">": "$gt",
-                        "<": "$lt",
-                        ">=": "$gte",
-                        "<=": "$lte",
-                        "==": "$eq",
-                        "=": "$eq",
-                        "!=": "$ne"
-                    }
-                    having_parts = re.match(r"(?i)(count)\s*(>|<|>=|<=|==|!=)\s*(\d+)", having_condition)
-                    if having_parts:
-                        field_name, operator, value = having_parts.groups()
-                        value = int(value)  # Convert value to integer
-                        mongo_operator = operator_map[operator]
-                        pipeline.append({
-                            "$match": {"count": {mongo_operator: value}}
-                        })
-                    else:
-                        print(f"Error: Could not parse the HAVING condition: {having_condition}")
-            elif operation.lower() in ["sum", "add up", "aggregate", "total"]:
-                pipeline.append({
-                        "$group": {
-                            "_id": f"${group_by_mapped}",
-                            "total_sum": {"$sum": f"${field_mapped}"}
-                    }
-                })
-                if groups[4]:  # HAVING condition exists
-                    having_condition = groups[4].strip()
-                    operator_map = {
-                            ">": "$gt",
-                            "<": "$lt",
-                            ">=": "$gte",
-                            "<=": "$lte",
-                            "==": "$eq",
-                            "=": "$eq",
-                            "!=": "$ne"
+        if intent["name"] in MONGO_GROUP_INTENTS:
+            group_intent = MONGO_GROUP_INTENTS[intent["name"]]
+            pipeline.append({
+                "$group": {
+                    "_id": f"${group_by_mapped}",
+                    group_intent["output"]: group_intent["accumulator"](field_mapped)
                 }
-                        # Parse the HAVING clause
-                    having_parts = re.match(r"(?i)(sum|total_sum)\s*(>|<|>=|<=|==|!=)\s*(\d+)", having_condition)
-                    if having_parts:
-                        field_name, operator, value = having_parts.groups()
-                        value = int(value)  # Convert value to integer
-                        mongo_operator = operator_map[operator]
-                        pipeline.append({
-                                "$match": {f"total_sum": {mongo_operator: value}}
             })
-            elif operation.lower() in ["average", "avg", "mean", "compute average"]:
-                pipeline.append({
-                    "$group": {
-                        "_id": f"${group_by_mapped}",
-                        "average": {"$avg": f"${field_mapped}"}
-                         }
-                })
-                if groups[4]:  # HAVING condition exists
-                    having_condition = groups[4].strip()
-                    operator_map = {
-                        ">": "$gt",
-                        "<": "$lt",
-                        ">=": "$gte",
-                        "<=": "$lte",
-                        "==": "$eq",
-                        "=": "$eq",
-                        "!=": "$ne"
-                    }
-                    having_parts = re.match(r"(?i)(average)\s*(>|<|>=|<=|==|!=)\s*(\d+)", having_condition)
-                    if having_parts:
-                        field_name, operator, value = having_parts.groups()
-                        value = int(value)  # Convert value to integer
-                        mongo_operator = operator_map[operator]
-                        pipeline.append({
-                            "$match": {"average": {mongo_operator: value}}
-                        })
-                    else:
-                        print(f"Error: Could not parse the HAVING condition: {having_condition}")
-
-            elif operation.lower() in ["select", "filter", "find"]:
-                operator_map = {
-                    ">": "$gt",
-                    "<": "$lt",
-                    ">=": "$gte",
-                    "<=": "$lte",
-                    "==": "$eq",
-                    "=": "$eq",
-                    "!=": "$ne"
-                }
-                if operator in operator_map:
-                    mongo_operator = operator_map[operator]
-                    pipeline.append({"$match": {where_field: {mongo_operator: value}}})
+            if groups[4]:  # HAVING condition exists
+                having_condition = groups[4].strip()
+                having_parts = group_intent["having"].match(having_condition)
+                if having_parts:
+                    field_name, operator, value = having_parts.groups()
+                    value = int(value)  # Convert value to integer
+                    mongo_operator = MONGO_OPERATOR_MAP[operator]
                     pipeline.append({
-                    "$project": {
-                        "_id": 0,
-                        field_mapped: 1,
-                        group_by_mapped: 1 if group_by else None
-                    }
-                })
+                        "$match": {group_intent["output"]: {mongo_operator: value}}
+                    })
                 else:
-                    print(f"Error: Unsupported operator '{operator}'.")
-                    return None
-            
-
-           
+                    print(f"Error: Could not parse the HAVING condition: {having_condition}")
 
-            
+        elif intent["name"] == "select":
+            if operator in MONGO_OPERATOR_MAP:
+                mongo_operator = MONGO_OPERATOR_MAP[operator]
+                pipeline.append({"$match": {where_field_mapped: {mongo_operator: value}}})
+                pipeline.append({
+                "$project": {
+                    "_id": 0,
+                    field_mapped: 1,
+                    group_by_mapped: 1 if group_by else None
+                }
+            })
+            else:
+                print(f"Error: Unsupported operator '{operator}'.")
+                return None
 
-            description = pattern["description"].replace("<field>", field).replace("<field> <operator> <value>", f"{where_field} {operator} {value}").replace("<group_field>", group_by)
+        description = pattern["description"].replace("<field>", field).replace("<field> <operator> <value>", f"{where_field} {operator} {value}").replace("<group_field>", group_by)
 
-            return {
-                "description": description,
-                "pipeline": pipeline,
-                "collection": collection
-            }
+        return {
+            "description": description,
+            "pipeline": pipeline,
+            "collection": collection
+        }
 
     print("No matching query pattern found for the given natural language query.")
     return None
 
-def show_mongodb_collections_and_fields(db):
-    if db is None:
-        print("MongoDB connection is not available.")
-        return
-
-    # List all collections
-    collections = db.list_collection_names()
-
-    if not collections:
-        print("No collections found in the MongoDB database.")
-        return
-
-    print("\nAvailable MongoDB Collections:")
-    for collection_name in collections:
-        print(f"Collection: {collection_name}")
-
-        # Fetch a sample document to display its fields
-        collection = db[collection_name]
-        sample_doc = collection.find_one()
-
-        if sample_doc:
-            print("Fields:")
-            for key in sample_doc.keys():
-                print(f" - {key}")
-        else:
-            print(f" - No documents found in collection '{collection_name}'")
-
-        print("\n")  # Newline after each collection for clarity
-
 def query_decision(connection=None, db=None, db_type="MySQL"):
     generated_queries = []
     while True:
@@ -1410,14 +4583,15 @@ def query_decision(connection=None, db=None, db_type="MySQL"):
             print("3. Execute a sample MySQL query")
         if db_type == "MongoDB":
             print("3. Execute a sample MongoDB query")
+        print("4. Discard saved queries and generate new ones next time")
         print("0. Back")
 
-        decision = input("Enter your choice (1/2/3/0): ").strip()
+        decision = input("Enter your choice (1/2/3/4/0): ").strip()
 
         if decision == "1":
             if db_type == "MySQL":
                 if connection:
-                    generated_queries = generate_mysql_sample_queries(connection)
+                    generated_queries = library_queries("sample", connection=connection, db_type="MySQL")
                     if generated_queries:
                         print("\n\033[1mGenerated Queries:\033[0m")
                         for idx, query in enumerate(generated_queries, start=1):
@@ -1428,7 +4602,7 @@ def query_decision(connection=None, db=None, db_type="MySQL"):
                     print("MySQL connection is not available.")
             elif db_type == "MongoDB":
                 if db is not None:
-                    generated_queries = generate_mongodb_sample_queries(db)
+                    generated_queries = library_queries("sample", db=db, db_type="MongoDB")
                     if generated_queries:
                         print("\n\033[1mGenerated Queries:\033[0m")
                         for idx, query in enumerate(generated_queries, start=1):
@@ -1444,7 +4618,7 @@ def query_decision(connection=None, db=None, db_type="MySQL"):
             if db_type == "MySQL":
                 construct = input("Enter the construct (e.g., GROUP BY, ORDER BY, HAVING, JOIN, EXISTS for MySQL): ").strip().upper()
                 if connection:
-                    generated_queries = generate_mysql_construct_queries(connection, construct)
+                    generated_queries = library_queries(construct, connection=connection, db_type="MySQL")
                     if generated_queries:
                         print(f"\nThe \033[1m{construct}\033[0m clause in SQL is used as follows:")
                     if construct == "GROUP BY":
@@ -1480,7 +4654,7 @@ def query_decision(connection=None, db=None, db_type="MySQL"):
             elif db_type == "MongoDB":
                 construct = input("Enter the construct (e.g., $match, $group, $sort, $limit for MongoDB): ").strip().lower()
                 if db is not None:
-                    generated_queries = generate_mongodb_construct_queries(db, construct)
+                    generated_queries = library_queries(construct, db=db, db_type="MongoDB")
                     if generated_queries:
                         print(f"\nThe \033[1m{construct}\033[0m stage in MongoDB is used as follows:")
                     if construct == "$match":
@@ -1524,15 +4698,7 @@ def query_decision(connection=None, db=None, db_type="MySQL"):
                                 print(f"\nExecuting Query:\n{selected_query['title']}")
                                 print(f"{selected_query['description']}")
                                 print(f"Query:\n{selected_query['query']}\n")
-                                cursor = connection.cursor()
-                                cursor.execute(selected_query['query'])
-                                results = cursor.fetchall()
-                                if results:
-                                    print("\nQuery Results:")
-                                    for row in results:
-                                        print(row)
-                                else:
-                                    print("The query executed successfully but returned no results.")
+                                display_mysql_query_results(connection, selected_query['query'])
                             else:
                                 print("Invalid query number. Please try again.")
                         except ValueError:
@@ -1568,46 +4734,497 @@ def query_decision(connection=None, db=None, db_type="MySQL"):
                         collection_name = selected_query["collection"]
                         collection = db[collection_name]
 
-                        # Execute the query based on its type
-                        if selected_query["type"] == "aggregate":
-                            # Execute an aggregation query
-                            results = list(collection.aggregate(selected_query["query"]))
-                        elif selected_query["type"] == "find":
-                            # Extract the find command (filter and optional modifiers like sort, limit)
-                            filter_query = selected_query["query"].get("filter", {})
-                            sort_query = selected_query["query"].get("sort", None)
-                            limit_query = selected_query["query"].get("limit", None)
-
-                            # Build and execute the find query
-                            cursor = collection.find(filter_query)
-                            if sort_query:
-                                cursor = cursor.sort(list(sort_query.items()))
-                            if limit_query:
-                                cursor = cursor.limit(limit_query)
-                            results = list(cursor)
-                        else:
+                        # Execute the query based on its type and page through the results
+                        if selected_query["type"] not in ("aggregate", "find"):
                             print(f"Unknown query type: {selected_query['type']}")
                             return
-
-                        # Display results
-                        if results:
-                            print("\nQuery Results:")
-                            for result in results:
-                                print(result)
-                        else:
-                            print("The query executed successfully but returned no results.")
+                        display_mongodb_query_results(collection, selected_query["type"], selected_query["query"])
                     except ValueError:
                         print("Invalid input. Please enter a valid query number.")
                     except Exception as e:
                         print(f"Error executing MongoDB query: {e}")
                 else:
                     print("MongoDB connection is not available.")
+        elif decision == "4":
+            clear_query_library(connection=connection, db=db, db_type=db_type)
+            generated_queries = []
+            print("Saved queries discarded; new ones will be generated and validated next time.")
         elif decision == "0":
             print("Exiting to main menu.")
             break
 
         else:
             print("Invalid choice. Please try again.")
+# Backend tags accepted in batch files
+BATCH_BACKENDS = {"mysql": "MySQL", "mongodb": "MongoDB", "mongo": "MongoDB"}
+
+def iter_batch_queries(file_obj):
+    """
+    Yield (line_number, backend, query) from a batch file. Each line is either a JSON object
+    with "backend" and "query" keys, or text of the form "<backend>: <query>".
+    Blank lines and lines starting with # are skipped.
+    """
+    for line_number, line in enumerate(file_obj, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            entry = json.loads(line)
+            backend, query = entry.get("backend", ""), entry.get("query", "")
+        else:
+            backend, _, query = line.partition(":")
+        backend = BATCH_BACKENDS.get(backend.strip().lower())
+        if backend is None or not query.strip():
+            raise ValueError(f"Line {line_number}: expected '<mysql|mongodb>: <query>' or a JSON object with backend and query.")
+        yield line_number, backend, query.strip()
+
+# Rows fetched per round trip when a batch run only counts a query's rows
+ROW_COUNT_BATCH_SIZE = 1000
+
+def count_mysql_rows(connection, query):
+    """
+    Execute a MySQL query and count its rows without holding them in memory.
+    """
+    plan = explain_mysql_query(connection, query)
+    if plan is not None and plan["verdict"] == "refuse":
+        raise ValueError(f"Refused by the query guard: {'; '.join(plan['reasons'])}")
+    cursor = connection.cursor(buffered=False)
+    cursor.execute(with_execution_limit(query))
+    count = 0
+    if cursor.with_rows:
+        while True:
+            rows = cursor.fetchmany(ROW_COUNT_BATCH_SIZE)
+            if not rows:
+                break
+            count += len(rows)
+    cursor.close()
+    return count
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def run_batch(queries, output, connection=None, db=None, execute=False):
+    """
+    Translate (and optionally execute) each (line_number, backend, query) and write one JSON result per line to output.
+    Returns the summary: counts, wall time, throughput and latency percentiles in milliseconds.
+    """
+    counts = {"ok": 0, "unmatched": 0, "error": 0}
+    latencies = []
+    started = time.perf_counter()
+
+    for line_number, backend, query in queries:
+        record = {"line": line_number, "backend": backend, "query": query}
+        timings = {}
+        query_started = time.perf_counter()
+        try:
+            if backend == "MySQL":
+                if connection is None:
+                    raise ValueError("no MySQL connection configured")
+                result = process_natural_language_query_mysql(query, connection=connection, db_type="MySQL")
+            else:
+                if db is None:
+                    raise ValueError("no MongoDB connection configured")
+                result = process_natural_language_query_mongodb(query, db=db)
+            timings["translate_ms"] = (time.perf_counter() - query_started) * 1000
+
+            if result:
+                record["status"] = "ok"
+                record["generated"] = result
+                if execute:
+                    execute_started = time.perf_counter()
+                    if backend == "MySQL":
+                        record["rows"] = count_mysql_rows(connection, result["query"])
+                    else:
+                        collection = db[result["collection"]]
+                        plan = explain_mongodb_query(collection, "aggregate", result["pipeline"])
+                        if plan is not None and plan["verdict"] == "refuse":
+                            raise ValueError(f"Refused by the query guard: {'; '.join(plan['reasons'])}")
+                        record["rows"] = sum(1 for _ in collection.aggregate(result["pipeline"], batchSize=ROW_COUNT_BATCH_SIZE,
+                                                                             maxTimeMS=QUERY_GUARD["max_execution_ms"] or None))
+                    timings["execute_ms"] = (time.perf_counter() - execute_started) * 1000
+            else:
+                record["status"] = "unmatched"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+
+        timings["total_ms"] = (time.perf_counter() - query_started) * 1000
+        record["timings"] = {name: round(value, 3) for name, value in timings.items()}
+        counts[record["status"]] += 1
+        latencies.append(timings["total_ms"])
+        output.write(json_util.dumps(record) + "\n")
+
+    wall_seconds = time.perf_counter() - started
+    latencies.sort()
+    return {
+        **counts,
+        "queries": len(latencies),
+        "seconds": wall_seconds,
+        "per_second": len(latencies) / wall_seconds if wall_seconds else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p90_ms": percentile(latencies, 0.90),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+
+def connect_backends_from_args(args, backends):
+    """
+    Open the MySQL and/or MongoDB connections named in backends from the command-line flags,
+    without prompting. Returns (connection, db); a backend that is not requested is None.
+    """
+    connection = db = None
+    if "MySQL" in backends:
+        password = os.environ.get("CHATDB_MYSQL_PASSWORD", "")
+        connection = checkout_mysql_connection(get_mysql_pool(args.mysql_host, args.mysql_user, password, args.mysql_database))
+    if "MongoDB" in backends:
+        mongo_uri = args.mongo_uri or os.environ.get("CHATDB_MONGO_URI")
+        if not mongo_uri:
+            raise SystemExit("MongoDB queries need --mongo-uri or CHATDB_MONGO_URI.")
+        if not args.mongo_database:
+            raise SystemExit("MongoDB queries need --mongo-database.")
+        db = get_mongo_client(mongo_uri)[args.mongo_database]
+    return connection, db
+
+def batch_main(args):
+    """
+    Entry point for --batch: connect to the backends the file uses, run every query and print a summary to stderr.
+    Progress messages go to stderr so JSONL results can be written to stdout.
+    """
+    with open(args.batch, "r", encoding="utf-8") as batch_file:
+        queries = list(iter_batch_queries(batch_file))
+    backends = {backend for _, backend, _ in queries}
+
+    with contextlib.redirect_stdout(sys.stderr):
+        connection, db = connect_backends_from_args(args, backends)
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            summary = run_batch(queries, output, connection=connection, db=db, execute=args.execute)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if connection is not None:
+            connection.close()
+
+    print(f"{summary['queries']} queries in {summary['seconds']:.2f}s "
+          f"({summary['per_second']:.1f} per second): {summary['ok']} ok, "
+          f"{summary['unmatched']} unmatched, {summary['error']} errors", file=sys.stderr)
+    print(f"Latency p50 {summary['p50_ms']:.1f} ms, p90 {summary['p90_ms']:.1f} ms, "
+          f"p99 {summary['p99_ms']:.1f} ms", file=sys.stderr)
+
+# HTTP/JSON service (--serve). Blocking work runs on a bounded thread pool; every request
+# gets SERVICE_REQUEST_TIMEOUT seconds including the time spent waiting for a worker.
+# The main connection holds one pooled connection and cancellation (KILL QUERY) needs another, so each
+# worker can always borrow one without waiting
+SERVICE_WORKERS = max(1, CONNECTION_SETTINGS["mysql_pool_size"] - 2)
+SERVICE_REQUEST_TIMEOUT = 30
+SERVICE_IDLE_TIMEOUT = 60
+SERVICE_MAX_BODY = 1 << 20
+SERVICE_MAX_ROWS = 1000
+_SERVICE_READ_ONLY_SQL = re.compile(r"^\s*(?:SELECT|WITH|SHOW|EXPLAIN|DESCRIBE|DESC)\b", re.IGNORECASE)
+_SERVICE_FILE_OUTPUT_SQL = re.compile(r"\bINTO\s+(?:OUTFILE|DUMPFILE)\b", re.IGNORECASE)
+_SERVICE_WRITE_STAGES = ("$out", "$merge")
+_HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                 413: "Payload Too Large", 500: "Internal Server Error", 504: "Gateway Timeout"}
+
+def _service_param(params, name):
+    """
+    Return a required request parameter, raising ValueError if it is missing or empty.
+    """
+    value = params.get(name)
+    if value in (None, "", [], {}):
+        raise ValueError(f"Missing required parameter '{name}'.")
+    return value
+
+def check_service_sql(sql):
+    """
+    Raise ValueError unless the SQL is a single read-only statement. This only screens the text;
+    service_execute also runs the statement in a READ ONLY transaction, which the server enforces.
+    """
+    if not _SERVICE_READ_ONLY_SQL.match(sql):
+        raise ValueError("Only read-only statements (SELECT, WITH, SHOW, EXPLAIN, DESCRIBE) can be executed.")
+    # Look at the text outside quoted literals and identifiers only
+    code = " ".join(part for index, part in enumerate(_SQL_LITERAL_SPLIT.split(sql.strip().rstrip(";")))
+                    if not index % 2)
+    if ";" in code:
+        raise ValueError("Only a single statement can be executed.")
+    if _SERVICE_FILE_OUTPUT_SQL.search(code):
+        raise ValueError("Statements that write files (INTO OUTFILE, INTO DUMPFILE) cannot be executed.")
+
+def _service_backend(params):
+    """
+    Return "MySQL" or "MongoDB" for the request's backend parameter.
+    """
+    backend = BATCH_BACKENDS.get(str(_service_param(params, "backend")).lower())
+    if backend is None:
+        raise ValueError("The backend must be 'mysql' or 'mongodb'.")
+    return backend
+
+@contextlib.contextmanager
+def service_mysql_connection(context):
+    """
+    Borrow a pooled MySQL connection for one request, with statements capped at the request timeout.
+    Connections not opened through a pool (stand-ins in tests) are used as they are.
+    """
+    connection = context.get("connection")
+    if connection is None:
+        raise ValueError("MySQL is not configured for this service.")
+    if getattr(connection, "pool_name", None) is None:
+        yield connection
+        return
+
+    borrowed = borrow_mysql_connection(connection, context["database"])
+    try:
+        try:
+            borrowed.cursor().execute(f"SET SESSION max_execution_time = {SERVICE_REQUEST_TIMEOUT * 1000}")
+        except mysql.connector.Error:
+            pass  # servers before 5.7.8 have no statement timeout
+        yield borrowed
+    finally:
+        borrowed.close()
+
+def _service_db(context):
+    """
+    Return the MongoDB database of the service, raising ValueError if it is not configured.
+    """
+    if context.get("db") is None:
+        raise ValueError("MongoDB is not configured for this service.")
+    return context["db"]
+
+def service_translate(context, params):
+    """
+    POST /translate {"backend", "query"}: translate a natural language query into SQL or a pipeline.
+    """
+    backend, query = _service_backend(params), _service_param(params, "query")
+    if backend == "MySQL":
+        with service_mysql_connection(context) as connection:
+            result = process_natural_language_query_mysql(query, connection=connection, db_type="MySQL")
+    else:
+        result = process_natural_language_query_mongodb(query, db=_service_db(context))
+    if not result:
+        raise LookupError("No matching query pattern found for the given natural language query.")
+    return {"backend": backend, "generated": result}
+
+def service_execute(context, params):
+    """
+    POST /execute: run a natural language query ("query"), a read-only SQL statement ("sql"),
+    or a pipeline ("collection" and "pipeline"). Returns at most SERVICE_MAX_ROWS rows.
+    """
+    backend = _service_backend(params)
+    limit = min(int(params.get("limit") or SERVICE_MAX_ROWS), SERVICE_MAX_ROWS)
+    generated = service_translate(context, params)["generated"] if params.get("query") else None
+
+    if backend == "MySQL":
+        sql = generated["query"] if generated else _service_param(params, "sql")
+        check_service_sql(sql)
+        with service_mysql_connection(context) as connection:
+            plan = explain_mysql_query(connection, sql)
+            if plan is not None and plan["verdict"] == "refuse":
+                raise ValueError(f"Refused by the query guard: {'; '.join(plan['reasons'])}")
+            # The server rejects any write (e.g. WITH ... DELETE) inside a READ ONLY transaction
+            connection.cursor().execute("START TRANSACTION READ ONLY")
+            cursor = connection.cursor(buffered=False)
+            try:
+                cursor.execute(sql)
+                columns = list(cursor.column_names) if cursor.with_rows else []
+                rows = cursor.fetchmany(limit + 1) if cursor.with_rows else []
+            finally:
+                try:
+                    while cursor.fetchmany(limit):
+                        pass
+                    cursor.close()
+                except Exception:
+                    pass
+                try:
+                    connection.rollback()
+                except mysql.connector.Error:
+                    pass  # The pool resets the session when the connection is returned
+        rows = [dict(zip(columns, row)) for row in rows]
+    else:
+        db = _service_db(context)
+        collection = generated["collection"] if generated else _service_param(params, "collection")
+        pipeline = generated["pipeline"] if generated else _service_param(params, "pipeline")
+        if not isinstance(pipeline, list) or any(stage in _SERVICE_WRITE_STAGES for step in pipeline for stage in step):
+            raise ValueError("The pipeline must be a list of read-only stages ($out and $merge are not allowed).")
+        plan = explain_mongodb_query(db[collection], "aggregate", pipeline)
+        if plan is not None and plan["verdict"] == "refuse":
+            raise ValueError(f"Refused by the query guard: {'; '.join(plan['reasons'])}")
+        rows = list(db[collection].aggregate(pipeline + [{"$limit": limit + 1}],
+                                            maxTimeMS=SERVICE_REQUEST_TIMEOUT * 1000, batchSize=limit + 1))
+
+    payload = {"backend": backend, "rows": rows[:limit], "truncated": len(rows) > limit}
+    if generated:
+        payload["generated"] = generated
+    return payload
+
+def service_schema(context, params):
+    """
+    GET /schema?backend=...: list MySQL tables with columns and keys, or MongoDB collections with field names.
+    """
+    if _service_backend(params) == "MySQL":
+        with service_mysql_connection(context) as connection:
+            tables = get_mysql_catalog(connection)["tables"]
+        return {"backend": "MySQL", "tables": {
+            table_name: {"columns": [{"name": name, "type": column_type} for name, column_type in entry["columns"]],
+                         "primary_keys": entry["primary_keys"], "foreign_keys": entry["foreign_keys"]}
+            for table_name, entry in tables.items()}}
+    return {"backend": "MongoDB", "collections": mongo_get_collection_schema(_service_db(context))}
+
+def service_constructs(context, params):
+    """
+    POST /constructs {"backend", "construct", "max_queries"}: generate validated example queries for a construct.
+    """
+    backend, construct = _service_backend(params), str(_service_param(params, "construct"))
+    max_queries = min(int(params.get("max_queries") or 2), 10)
+    if backend == "MySQL":
+        with service_mysql_connection(context) as connection:
+            queries = generate_mysql_construct_queries(connection, construct.upper(), max_queries=max_queries)
+    else:
+        queries = generate_mongodb_construct_queries(_service_db(context), construct, max_queries=max_queries)
+    return {"backend": backend, "construct": construct, "queries": queries}
+
+SERVICE_ROUTES = {
+    ("POST", "/translate"): service_translate,
+    ("POST", "/execute"): service_execute,
+    ("GET", "/schema"): service_schema,
+    ("POST", "/constructs"): service_constructs,
+}
+
+def create_service_context(connection=None, db=None, workers=SERVICE_WORKERS):
+    """
+    Bundle the connections, worker pool and concurrency limit shared by all service requests.
+    """
+    return {
+        "connection": connection,
+        "database": connection.database if connection is not None else None,
+        "db": db,
+        "executor": concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chatdb-service"),
+        "workers": workers,
+        "slots": None,  # created inside the event loop on first use
+    }
+
+async def dispatch_service_request(context, method, target, body):
+    """
+    Route one request to its handler on the worker pool and return (status, payload).
+    """
+    url = urllib.parse.urlsplit(target)
+    handler = SERVICE_ROUTES.get((method, url.path))
+    if handler is None:
+        if any(path == url.path for _, path in SERVICE_ROUTES):
+            return 405, {"error": f"Method {method} is not allowed for {url.path}."}
+        return 404, {"error": f"Unknown endpoint {url.path}."}
+
+    try:
+        params = dict(urllib.parse.parse_qsl(url.query))
+        if body:
+            request = json_util.loads(body)
+            if not isinstance(request, dict):
+                raise ValueError("The request body must be a JSON object.")
+            params.update(request)
+
+        if context["slots"] is None:
+            context["slots"] = asyncio.Semaphore(context["workers"])
+
+        async def run_in_worker():
+            # Waiting for a free worker counts against the request timeout as well
+            async with context["slots"]:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(context["executor"], handler, context, params)
+
+        return 200, await asyncio.wait_for(run_in_worker(), SERVICE_REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        return 504, {"error": f"The request did not finish within {SERVICE_REQUEST_TIMEOUT} seconds."}
+    except ValueError as e:
+        return 400, {"error": str(e)}
+    except LookupError as e:
+        return 404, {"error": str(e)}
+    except Exception as e:
+        return 500, {"error": f"{type(e).__name__}: {e}"}
+
+async def handle_service_connection(context, reader, writer):
+    """
+    Serve HTTP/1.1 requests on one client connection, keeping it open between requests unless asked to close.
+    """
+    try:
+        while True:
+            request_line = await asyncio.wait_for(reader.readline(), SERVICE_IDLE_TIMEOUT)
+            if not request_line.strip():
+                break
+            parts = request_line.decode("latin-1").split()
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), SERVICE_IDLE_TIMEOUT)
+                if not line.strip():
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            content_length = headers.get("content-length") or "0"
+            length = int(content_length) if content_length.isascii() and content_length.isdigit() else None
+            keep_alive = len(parts) == 3 and parts[2] == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            if len(parts) != 3:
+                status, payload, keep_alive = 400, {"error": "Malformed request line."}, False
+            elif length is None:
+                # Without a usable length the body cannot be skipped, so the connection closes after the reply
+                status, payload, keep_alive = 400, {"error": f"Invalid Content-Length header: {content_length!r}."}, False
+            elif length > SERVICE_MAX_BODY:
+                status, payload, keep_alive = 413, {"error": f"Request bodies are limited to {SERVICE_MAX_BODY} bytes."}, False
+            else:
+                body = await reader.readexactly(length) if length else b""
+                status, payload = await dispatch_service_request(context, parts[0].upper(), parts[1], body)
+
+            data = json_util.dumps(payload, default=str).encode("utf-8")
+            writer.write((f"HTTP/1.1 {status} {_HTTP_REASONS.get(status, '')}\r\n"
+                          f"Content-Type: application/json\r\n"
+                          f"Content-Length: {len(data)}\r\n"
+                          f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1") + data)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def run_service(context, host="127.0.0.1", port=8765):
+    """
+    Listen for HTTP requests until cancelled.
+    """
+    server = await asyncio.start_server(lambda reader, writer: handle_service_connection(context, reader, writer), host, port)
+    print(f"ChatDB service listening on http://{host}:{port} "
+          f"(endpoints: {', '.join(f'{method} {path}' for method, path in SERVICE_ROUTES)})")
+    async with server:
+        await server.serve_forever()
+
+def serve_main(args):
+    """
+    Entry point for --serve: connect to the backends given on the command line and run the HTTP service.
+    """
+    backends = set()
+    if args.mysql_database:
+        backends.add("MySQL")
+    if args.mongo_uri or os.environ.get("CHATDB_MONGO_URI"):
+        backends.add("MongoDB")
+    if not backends:
+        raise SystemExit("--serve needs --mysql-database and/or --mongo-uri (or CHATDB_MONGO_URI).")
+
+    connection, db = connect_backends_from_args(args, backends)
+    context = create_service_context(connection, db)
+    try:
+        asyncio.run(run_service(context, args.host, args.port))
+    except KeyboardInterrupt:
+        print("Service stopped.")
+    finally:
+        context["executor"].shutdown(wait=False)
+        if connection is not None:
+            connection.close()
+
 def chatdb_menu():
     while True:
         print("\n--- ChatDB Main Menu ---")
@@ -1620,23 +5237,38 @@ def chatdb_menu():
         if db_type == "1":
             connection = connect_mysql()
             if connection:
+                warmup = start_warmup(connection=connection, db_type="MySQL")
                 while True:
                     print("\n--- MySQL Options ---")
+                    report_warmup(warmup)
                     print("1. Show tables and columns")
                     print("2. Upload a dataset")
                     print("3. Delete a dataset")
                     print("4. Sample queries")
                     print("5. Enter a natural language query")
+                    print("6. Refresh schema catalog")
+                    print("7. Index advisor")
+                    print("8. Cancel the background warm-up")
                     print("0. Back to main menu")
 
                     choice = input("Choose an option: ").strip()
 
+                    if choice != "0" and not ensure_mysql_connection(connection):
+                        break
                     if choice == "1":
                         show_mysql_tables_and_columns(connection)
                     elif choice == "2":
+                        # The warm-up must not write caches of the old database or tables while they change
+                        resume = cancel_warmup(warmup, wait=True)
                         upload_dataset_to_database(connection=connection, db_type="MySQL")
+                        if resume:
+                            warmup = start_warmup(connection=connection, db_type="MySQL")
                     elif choice == "3":
-                        drop_tables_or_schema(connection=connection, db_type="MySQL")
+                        resume = cancel_warmup(warmup, wait=True)
+                        if drop_tables_or_schema(connection=connection, db_type="MySQL"):
+                            break
+                        if resume:
+                            warmup = start_warmup(connection=connection, db_type="MySQL")
                     elif choice == "4":
                         query_decision(connection=connection, db_type="MySQL")
                     elif choice == "5":
@@ -1654,43 +5286,61 @@ def chatdb_menu():
 
                                 # Execute the query
                                 try:
-                                    cursor = connection.cursor()
-                                    cursor.execute(result["query"])
-                                    results = cursor.fetchall()
-                                    if results:
-                                        print("\nQuery Results:")
-                                        for row in results:
-                                            print(row)
-                                    else:
-                                        print("The query executed successfully but returned no results.")
+                                    display_mysql_query_results(connection, result["query"])
                                 except Exception as e:
                                     print(f"Error executing query: {e}")
                             else:
                                 print("Could not process the natural language query.")
                         else:
                             print("MySQL connection is not available.")
+                    elif choice == "6":
+                        catalog = refresh_mysql_catalog(connection)
+                        print(f"Schema catalog refreshed: {len(catalog['tables'])} tables loaded.")
+                    elif choice == "7":
+                        index_advisor(connection=connection, db_type="MySQL")
+                    elif choice == "8":
+                        if cancel_warmup(warmup):
+                            print("The warm-up stops after its current step.")
+                        else:
+                            print("The warm-up is not running.")
                     elif choice == "0":
                         break
+                cancel_warmup(warmup)
+                # Return the connection to the pool
+                connection.close()
         elif db_type == "2":
             db = connect_mongodb()
             if db is not None:
+                warmup = start_warmup(db=db, db_type="MongoDB")
                 while True:
                     print("\n--- MongoDB Options ---")
+                    report_warmup(warmup)
                     print("1. Show collections and fields")
                     print("2. Upload a collection")
                     print("3. Delete a collection")
                     print("4. Sample queries")
                     print("5. Enter a natural language query")
+                    print("6. Index advisor")
+                    print("7. Cancel the background warm-up")
                     print("0. Back to main menu")
 
                     choice = input("Choose an option: ").strip()
 
+                    if choice != "0" and not ensure_mongodb_connection(db):
+                        break
                     if choice == "1":
                         show_mongodb_collections_and_fields(db)
                     elif choice == "2":
+                        resume = cancel_warmup(warmup, wait=True)
                         upload_dataset_to_database(db=db, db_type="MongoDB")
+                        if resume:
+                            warmup = start_warmup(db=db, db_type="MongoDB")
                     elif choice == "3":
-                        drop_tables_or_schema(db=db, db_type="MongoDB")
+                        resume = cancel_warmup(warmup, wait=True)
+                        if drop_tables_or_schema(db=db, db_type="MongoDB"):
+                            break
+                        if resume:
+                            warmup = start_warmup(db=db, db_type="MongoDB")
                     elif choice == "4":
                         query_decision(db=db, db_type="MongoDB")
                     elif choice == "5":
@@ -1711,20 +5361,22 @@ def chatdb_menu():
                                         # Execute the query
                                         try:
                                             collection = db[result["collection"]]
-                                            results = list(collection.aggregate(result["pipeline"]))  # Adjust to execute the pipeline
-                                            if results:
-                                                print("\nQuery Results:")
-                                                for doc in results:
-                                                    print(doc)
-                                            else:
-                                                print("The query executed successfully but returned no results.")
+                                            display_mongodb_query_results(collection, "aggregate", result["pipeline"])
                                         except Exception as e:
                                             print(f"Error executing query: {e}")
                             else:
                                         print("Could not process the query.")
 
+                    elif choice == "6":
+                        index_advisor(db=db, db_type="MongoDB")
+                    elif choice == "7":
+                        if cancel_warmup(warmup):
+                            print("The warm-up stops after its current step.")
+                        else:
+                            print("The warm-up is not running.")
                     elif choice == "0":
                         break
+                cancel_warmup(warmup)
         elif db_type == "0":
             print("Exiting the system... Have a good day :) ")
             exit()
@@ -1733,4 +5385,38 @@ def chatdb_menu():
             print("Invalid choice. Please enter '1' for MySQL, '2' for MongoDB, or '0' to exit.")
 
 if __name__ == "__main__":
-    chatdb_menu()
+    parser = argparse.ArgumentParser(description="ChatDB: query MySQL and MongoDB with natural language.")
+    parser.add_argument("--benchmark-fuzzy", action="store_true",
+                        help="Benchmark trigram-indexed field matching against difflib and exit.")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="Run natural language queries from a JSONL or '<backend>: <query>' text file without prompting.")
+    parser.add_argument("--output", default="-", metavar="FILE",
+                        help="Where to write batch results as JSONL (default: stdout).")
+    parser.add_argument("--execute", action="store_true",
+                        help="Execute the generated batch queries and record row counts.")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run the HTTP/JSON service (/translate, /execute, /schema, /constructs) instead of the menu.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address the service listens on.")
+    parser.add_argument("--port", type=int, default=8765, help="Port the service listens on.")
+    parser.add_argument("--mysql-host", default="localhost")
+    parser.add_argument("--mysql-user", default="root")
+    parser.add_argument("--mysql-database", help="MySQL database for batch/service queries (password from CHATDB_MYSQL_PASSWORD).")
+    parser.add_argument("--mongo-uri", help="MongoDB connection string for batch/service queries (or CHATDB_MONGO_URI).")
+    parser.add_argument("--mongo-database", help="MongoDB database for batch/service queries.")
+    parser.add_argument("--seed", help="Seed for generated sample queries, so the same schema always gives the same examples.")
+    parser.add_argument("--query-library", metavar="FILE", default=QUERY_LIBRARY_PATH,
+                        help="Where validated sample queries are saved (default: %(default)s).")
+    args = parser.parse_args()
+    if args.mongo_uri and not args.mongo_database:
+        parser.error("--mongo-uri requires --mongo-database")
+    QUERY_LIBRARY_SEED = args.seed
+    QUERY_LIBRARY_PATH = args.query_library
+
+    if args.benchmark_fuzzy:
+        benchmark_fuzzy_matching()
+    elif args.batch:
+        batch_main(args)
+    elif args.serve:
+        serve_main(args)
+    else:
+        chatdb_menu()
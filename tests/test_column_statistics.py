@@ -0,0 +1,78 @@
+import re
+
+import pytest
+
+import ChatDB_query
+
+
+class FakeCursor:
+    """Answers the statements profile_mysql_table issues against a table of rows (id, name)."""
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = []
+
+    def execute(self, sql, params=None):
+        self.connection.statements.append(sql)
+        rows = self.connection.rows
+        if "TABLE_ROWS" in sql:
+            self.result = [(self.connection.estimate,)]
+        elif "MIN(" in sql:
+            self.result = [(rows[0][0], rows[-1][0])]
+        elif ">= %s" in sql:
+            limit = int(re.search(r"LIMIT (\d+)", sql).group(1))
+            self.result = [row + (row[0],) for row in rows if row[0] >= params[0]][:limit]
+        else:
+            limit = int(re.search(r"LIMIT (\d+)", sql).group(1))
+            self.result = rows[::7][:limit] if "RAND(" in sql else rows[:limit]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, count, key_type="int"):
+        self.rows = [(index, f"name {index}") for index in range(1, count + 1)]
+        self.estimate = count
+        self.statements = []
+        self.key_type = key_type
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    def connect(count, key_type="int"):
+        connection = FakeConnection(count, key_type)
+        table = {"columns": [("id", key_type), ("name", "varchar(45)")],
+                 "column_types": {"id": key_type, "name": "varchar(45)"}, "primary_keys": ["id"]}
+        monkeypatch.setattr(ChatDB_query, "get_mysql_catalog", lambda connection: {"tables": {"t": table}})
+        return connection
+    return connect
+
+
+def test_large_table_is_sampled_across_its_key_range(connect):
+    connection = connect(100000)
+    statistics = ChatDB_query.profile_mysql_table(connection, "t")
+
+    ids = statistics["columns"]["id"]
+    assert ids["sampled"] <= ChatDB_query.COLUMN_STATS_SAMPLE_ROWS
+    assert ids["distinct"] == ids["sampled"]  # Blocks never overlap
+    assert ids["max"] > 50000
+    assert sum(">= %s" in sql for sql in connection.statements) == ChatDB_query.COLUMN_STATS_SAMPLE_BLOCKS
+
+
+def test_table_without_integer_key_is_sampled_with_rand(connect):
+    connection = connect(100000, key_type="char(36)")
+    ChatDB_query.profile_mysql_table(connection, "t")
+    assert any("WHERE RAND() <" in sql for sql in connection.statements)
+
+
+def test_small_table_is_read_whole(connect):
+    connection = connect(50)
+    statistics = ChatDB_query.profile_mysql_table(connection, "t")
+    assert statistics["columns"]["id"]["sampled"] == 50
+    assert not any("RAND(" in sql or "MIN(" in sql for sql in connection.statements)
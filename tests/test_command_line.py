@@ -0,0 +1,24 @@
+import argparse
+import os
+import subprocess
+import sys
+
+import pytest
+
+import ChatDB_query
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ChatDB_query.py")
+
+
+def test_mongo_uri_without_database_is_a_usage_error():
+    result = subprocess.run([sys.executable, SCRIPT, "--serve", "--mongo-uri", "mongodb://localhost"],
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 2
+    assert "--mongo-uri requires --mongo-database" in result.stderr
+
+
+def test_environment_uri_without_database_exits_with_a_message(monkeypatch):
+    monkeypatch.setenv("CHATDB_MONGO_URI", "mongodb://localhost")
+    args = argparse.Namespace(mongo_uri=None, mongo_database=None)
+    with pytest.raises(SystemExit, match="--mongo-database"):
+        ChatDB_query.connect_backends_from_args(args, {"MongoDB"})
@@ -0,0 +1,32 @@
+import weakref
+
+import ChatDB_query
+
+
+class FakeConnection:
+    def __init__(self):
+        self.disconnected = False
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+class FakePool:
+    pool_name = "fake"
+
+    def get_connection(self):
+        return FakeConnection()
+
+
+def test_close_all_connections_disconnects_connections_still_in_use(monkeypatch):
+    monkeypatch.setattr(ChatDB_query, "_checked_out_connections", weakref.WeakSet())
+    monkeypatch.setattr(ChatDB_query, "_mysql_pools", {("localhost", "root", "", "test"): FakePool()})
+    monkeypatch.setattr(ChatDB_query, "_mongo_clients", {})
+    pool = ChatDB_query._mysql_pools[("localhost", "root", "", "test")]
+    first = ChatDB_query.checkout_mysql_connection(pool)
+    second = ChatDB_query.checkout_mysql_connection(pool)
+
+    ChatDB_query.close_all_connections()
+
+    assert first.disconnected and second.disconnected
+    assert ChatDB_query._mysql_pools == {}
@@ -0,0 +1,48 @@
+import pytest
+
+import ChatDB_query
+
+
+def table(columns, references=()):
+    return {"columns": [(column, "int") for column in columns], "indexes": {}, "primary_keys": [columns[0]],
+            "foreign_keys": [], "references": [dict(zip(("constraint", "column", "referenced_table", "referenced_column"),
+                                                        reference)) for reference in references]}
+
+
+TABLES = {
+    "payment": table(["payment_id", "customer_id", "amount", "last_update"],
+                     [("fk_payment_customer", "customer_id", "customer", "customer_id")]),
+    "customer": table(["customer_id", "store_id", "last_update"]),
+}
+SCHEMA = {name: [column for column, _ in entry["columns"]] for name, entry in TABLES.items()}
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    graph = ChatDB_query.build_join_graph(TABLES)
+    monkeypatch.setattr(ChatDB_query, "get_table_schema", lambda connection: SCHEMA)
+    monkeypatch.setattr(ChatDB_query, "get_join_graph", lambda connection: graph)
+    monkeypatch.setattr(ChatDB_query, "mysql_table_ranking", lambda connection: {})
+    # Column names here need no lemmatizing, so the NLTK corpora are not required
+    monkeypatch.setattr(ChatDB_query, "normalize_field_text", lambda text: "".join(text.lower().split()))
+    return object()
+
+
+def test_qualify_join_columns_skips_literals_functions_and_qualified_names():
+    plan = {"tables": {"amount": "payment", "last_update": "payment"}}
+    assert (ChatDB_query.qualify_join_columns("amount > 5 AND last_update < 'last_update' AND SUM(amount) > c.amount", plan)
+            == "payment.amount > 5 AND payment.last_update < 'last_update' AND SUM(payment.amount) > c.amount")
+
+
+def test_where_columns_of_a_joined_query_are_qualified(connection):
+    result = ChatDB_query.process_natural_language_query_mysql(
+        "find amount by store_id where last_update > '2006-01-01'", connection=connection)
+    assert result["query"] == ("SELECT * FROM payment JOIN customer ON payment.customer_id = customer.customer_id "
+                               "WHERE payment.last_update > '2006-01-01' GROUP BY customer.store_id;")
+
+
+def test_having_columns_of_a_joined_query_are_qualified(connection):
+    result = ChatDB_query.process_natural_language_query_mysql(
+        "count payment_id by store_id having customer_id > 3", connection=connection)
+    assert result["query"].startswith("SELECT customer.store_id, COUNT(payment.payment_id) AS total FROM payment JOIN customer")
+    assert "HAVING payment.customer_id > 3" in result["query"]
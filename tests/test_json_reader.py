@@ -0,0 +1,34 @@
+import io
+
+import pytest
+
+import ChatDB_query
+
+
+def read_all(text, chunk_size=4):
+    return list(ChatDB_query.iter_json_documents(io.StringIO(text), chunk_size=chunk_size))
+
+
+def test_reads_arrays_single_documents_and_ndjson():
+    assert read_all('[{"a": 1}, {"b": [1, 2]}]') == [{"a": 1}, {"b": [1, 2]}]
+    assert read_all('{"a": {"b": 1}}') == [{"a": {"b": 1}}]
+    assert read_all('{"a": 1}\n{"a": 2}\n') == [{"a": 1}, {"a": 2}]
+
+
+def test_example_dataset():
+    with open(ChatDB_query.os.path.join(ChatDB_query.os.path.dirname(ChatDB_query.__file__),
+                                        "DataSetsUsed", "example.json"), encoding="utf-8") as file:
+        assert all(isinstance(document, dict) for document in ChatDB_query.iter_json_documents(file))
+
+
+@pytest.mark.parametrize("text", ['[{"a": 1}, null, {"a": 2}]', '[{"a": 1}, 5]', '{"a": 1}\n"text"\n', "null"])
+def test_elements_that_are_not_objects_raise(text):
+    with pytest.raises(ValueError):
+        read_all(text)
+
+
+def test_null_element_does_not_end_the_input():
+    documents = ChatDB_query.iter_json_documents(io.StringIO('[{"a": 1}, null, {"a": 2}]'), chunk_size=4)
+    assert next(documents) == {"a": 1}
+    with pytest.raises(ValueError, match="null"):
+        next(documents)
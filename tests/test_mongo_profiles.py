@@ -0,0 +1,44 @@
+import ChatDB_query
+
+
+class FakeCollection:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def aggregate(self, pipeline):
+        return iter(self.documents)
+
+
+def profile_of(documents):
+    return ChatDB_query.sample_collection_fields(FakeCollection(documents))
+
+
+def test_merged_profile_keeps_counts_and_values_under_one_cap():
+    size = ChatDB_query.MONGO_SCHEMA_SAMPLE_SIZE
+    profile = profile_of([{"a": index} for index in range(size)])
+    addition = profile_of([{"a": index} if index % 2 else {"b": index} for index in range(size)])
+
+    ChatDB_query._merge_collection_fields(profile, addition)
+    profile["version"] = (2 * size, None)
+    entry = profile["fields"]["a"]
+    assert profile["sampled"] == size
+    assert len(entry["values"]) == entry["count"] == size * 3 // 4
+    assert ChatDB_query.mongo_field_statistics(profile)["a"]["null_ratio"] == 0.25
+
+
+def test_merge_weights_samples_by_the_documents_they_stand_for():
+    size = ChatDB_query.MONGO_SCHEMA_SAMPLE_SIZE
+    profile = profile_of([{"old": 1} for _ in range(size)])
+    addition = profile_of([{"new": 1} for _ in range(size)])
+
+    ChatDB_query._merge_collection_fields(profile, addition, populations=(900, 100))
+    assert profile["sampled"] == size
+    assert profile["fields"]["old"]["count"] == size * 9 // 10
+    assert profile["fields"]["new"]["count"] == size // 10
+
+
+def test_small_merge_keeps_every_document():
+    profile = profile_of([{"a": 1}] * 3)
+    ChatDB_query._merge_collection_fields(profile, profile_of([{"a": 2}] * 2))
+    assert profile["sampled"] == 5
+    assert sorted(profile["fields"]["a"]["values"]) == [1, 1, 1, 2, 2]
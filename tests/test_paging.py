@@ -0,0 +1,141 @@
+import ChatDB_query
+
+
+class FakeMongoCursor:
+    def __init__(self, documents):
+        self.documents = iter(documents)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.documents)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCollection:
+    def __init__(self, count):
+        self.documents = [{"_id": index} for index in range(count)]
+        self.pipelines = []
+
+    def aggregate(self, pipeline, **options):
+        self.pipelines.append(pipeline)
+        skip = next((stage["$skip"] for stage in pipeline if "$skip" in stage), 0)
+        return FakeMongoCursor(self.documents[skip:])
+
+
+def test_mongodb_pages_forward_over_one_cursor():
+    collection = FakeCollection(95)
+    fetch_page, close = ChatDB_query.mongodb_page_source(collection, "aggregate", [], page_size=20)
+
+    pages = [fetch_page(page_number) for page_number in range(5)]
+    assert [len(rows) for rows, _ in pages] == [20, 20, 20, 20, 15]
+    assert [has_more for _, has_more in pages] == [True, True, True, True, False]
+    assert [row["_id"] for rows, _ in pages for row in rows] == list(range(95))
+    assert collection.pipelines == [[]]
+
+    rows, _ = fetch_page(1)
+    assert rows[0]["_id"] == 20
+    assert collection.pipelines[-1] == [{"$skip": 20}]
+    close()
+
+
+def test_mongodb_pages_continue_after_prefetched_documents():
+    collection = FakeCollection(100)
+    cursor = FakeMongoCursor(collection.documents)
+    prefetched = [next(cursor) for _ in range(50)]
+    fetch_page, close = ChatDB_query.mongodb_page_source(collection, "aggregate", [], page_size=20,
+                                                         cursor=cursor, prefetched=prefetched)
+
+    ids = [row["_id"] for page_number in range(5) for row in fetch_page(page_number)[0]]
+    assert ids == list(range(100))
+    assert collection.pipelines == []
+    close()
+    assert cursor.closed
+
+
+class FakeMySQLCursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.fetched = 0
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        self.fetched += len(rows)
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeMySQLConnection:
+    connection_id = 7
+
+
+def test_mysql_close_kills_an_unfinished_statement_instead_of_draining(monkeypatch):
+    cancelled = []
+    monkeypatch.setattr(ChatDB_query, "cancel_mysql_statement",
+                        lambda connection, connection_id, report=print: cancelled.append(connection_id))
+    cursor = FakeMySQLCursor((index,) for index in range(10000))
+    fetch_page, close = ChatDB_query.mysql_page_source(FakeMySQLConnection(), "SELECT 1", page_size=20, cursor=cursor)
+
+    assert fetch_page(0)[0][-1] == (19,)
+    close()
+    assert cancelled == [7]
+    assert cursor.fetched == 21
+
+
+def test_mysql_close_of_a_finished_result_does_not_kill(monkeypatch):
+    cancelled = []
+    monkeypatch.setattr(ChatDB_query, "cancel_mysql_statement",
+                        lambda connection, connection_id, report=print: cancelled.append(connection_id))
+    cursor = FakeMySQLCursor((index,) for index in range(30))
+    prefetched = cursor.fetchmany(25)
+    fetch_page, close = ChatDB_query.mysql_page_source(FakeMySQLConnection(), "SELECT 1", page_size=20,
+                                                       cursor=cursor, prefetched=prefetched)
+
+    assert [row[0] for page_number in range(2) for row in fetch_page(page_number)[0]] == list(range(30))
+    close()
+    assert cancelled == []
+
+
+class FakeQueryConnection(FakeMySQLConnection):
+    def __init__(self, count):
+        self.cursors = []
+        self.count = count
+
+    def cursor(self, buffered=True):
+        cursor = FakeMySQLCursor((index,) for index in range(self.count))
+        cursor.with_rows = True
+        cursor.execute = lambda sql: None
+        self.cursors.append(cursor)
+        return cursor
+
+
+def display(monkeypatch, count):
+    for name in ("record_mysql_workload", "explain_mysql_query", "cancel_mysql_statement"):
+        monkeypatch.setattr(ChatDB_query, name, lambda *args, **kwargs: None)
+    monkeypatch.setattr(ChatDB_query, "confirm_query_plan", lambda plan: True)
+    monkeypatch.setattr(ChatDB_query, "mysql_table_versions", lambda connection, query: (("t", "v"),))
+    monkeypatch.setattr(ChatDB_query, "mysql_connection_key", lambda connection: "test")
+    cached = []
+    monkeypatch.setattr(ChatDB_query, "result_cache_get", lambda key: None)
+    monkeypatch.setattr(ChatDB_query, "result_cache_put", lambda key, rows: cached.append(rows))
+    monkeypatch.setattr(ChatDB_query, "paginate_results", lambda fetch_page: fetch_page(0))
+    connection = FakeQueryConnection(count)
+    ChatDB_query.display_mysql_query_results(connection, "SELECT id FROM t")
+    return connection.cursors[0], cached
+
+
+def test_long_mysql_result_reads_only_the_first_page_ahead(monkeypatch):
+    cursor, cached = display(monkeypatch, 10000)
+    assert cursor.fetched == ChatDB_query.RESULT_PAGE_SIZE + 1
+    assert cached == []
+
+
+def test_mysql_result_that_fits_on_one_page_is_cached(monkeypatch):
+    _, cached = display(monkeypatch, 5)
+    assert cached == [[(index,) for index in range(5)]]
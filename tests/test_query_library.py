@@ -0,0 +1,139 @@
+import datetime
+import random
+import time
+
+from bson import json_util
+
+import ChatDB_query
+
+
+def test_ordered_validation_matches_a_serial_run():
+    candidates = [{"query": str(index)} for index in range(20)]
+
+    def validate(candidate):
+        # Early candidates are slow, so unordered validation would prefer later ones
+        index = int(candidate["query"])
+        time.sleep(0.05 if index < 5 else 0)
+        return index % 2 == 0
+
+    serial = ChatDB_query.validate_candidates_concurrently(candidates, validate, 3, workers=1)
+    ordered = ChatDB_query.validate_candidates_concurrently(candidates, validate, 3, workers=6, ordered=True)
+    assert ordered == serial == [{"query": "0"}, {"query": "2"}, {"query": "4"}]
+
+
+def test_seeded_candidates_repeat():
+    families = [ChatDB_query.candidate_family(lambda x, y: {"query": f"{x}/{y}"}, range(10), range(10))]
+    first = list(ChatDB_query.sample_candidates(families, 5, random.Random("42/key/sample")))
+    second = list(ChatDB_query.sample_candidates(families, 5, random.Random("42/key/sample")))
+    assert first == second
+
+
+class FakeCollection:
+    def __init__(self, indexes):
+        self.indexes = indexes
+
+    def index_information(self):
+        return self.indexes
+
+
+class FakeDB:
+    name = "test"
+
+    def __init__(self, collections):
+        self.collections = collections
+
+    def list_collection_names(self):
+        return list(self.collections)
+
+    def __getitem__(self, name):
+        return FakeCollection(self.collections[name])
+
+
+def test_mongodb_fingerprint_ignores_documents_and_collection_order():
+    indexes = {"_id_": {"key": [("_id", 1)]}}
+    first = FakeDB({"a": indexes, "b": indexes})
+    second = FakeDB({"b": indexes, "a": indexes})
+    assert (ChatDB_query.schema_fingerprint(db=first, db_type="MongoDB")
+            == ChatDB_query.schema_fingerprint(db=second, db_type="MongoDB"))
+    changed = FakeDB({"a": indexes, "b": dict(indexes, name_1={"key": [("name", 1)]})})
+    assert (ChatDB_query.schema_fingerprint(db=first, db_type="MongoDB")
+            != ChatDB_query.schema_fingerprint(db=changed, db_type="MongoDB"))
+
+
+def test_unknown_versions_are_trusted_until_revalidation_is_due(monkeypatch, tmp_path):
+    monkeypatch.setattr(ChatDB_query, "QUERY_LIBRARY_PATH", str(tmp_path / "library.json"))
+    monkeypatch.setattr(ChatDB_query, "_query_library", None)
+    monkeypatch.setattr(ChatDB_query, "query_library_key", lambda *args: "MySQL/test/0")
+    monkeypatch.setattr(ChatDB_query, "mysql_table_versions", lambda connection, query: None)
+    validated = []
+    monkeypatch.setattr(ChatDB_query, "validate_mysql_candidates",
+                        lambda connection, queries, max_valid, report=print: validated.extend(queries) or queries)
+    query = {"query": "SELECT * FROM city"}
+    library = ChatDB_query.load_query_library()
+    library["MySQL/test/0"] = {"constructs": {"sample": [
+        {"query": query, "versions": "null", "validated": time.time() - 60}]}}
+
+    assert ChatDB_query.library_queries("sample", connection=object()) == [query]
+    assert validated == []
+
+    library["MySQL/test/0"]["constructs"]["sample"][0]["validated"] = (
+        time.time() - ChatDB_query.QUERY_LIBRARY_REVALIDATE_SECONDS - 1)
+    assert ChatDB_query.library_queries("sample", connection=object()) == [query]
+    assert validated == [query]
+
+
+def library_with_entry(monkeypatch, tmp_path, entry):
+    monkeypatch.setattr(ChatDB_query, "QUERY_LIBRARY_PATH", str(tmp_path / "library.json"))
+    monkeypatch.setattr(ChatDB_query, "_query_library", None)
+    monkeypatch.setattr(ChatDB_query, "query_library_key", lambda *args: "MySQL/test/0")
+    validated = []
+    monkeypatch.setattr(ChatDB_query, "validate_mysql_candidates",
+                        lambda connection, queries, max_valid, report=print: validated.extend(queries) or queries)
+    ChatDB_query.load_query_library()["MySQL/test/0"] = {"constructs": {"sample": [entry]}}
+    return validated
+
+
+def test_known_versions_that_become_unknown_are_revalidated(monkeypatch, tmp_path):
+    query = {"query": "SELECT * FROM city"}
+    validated = library_with_entry(monkeypatch, tmp_path, {
+        "query": query, "versions": '[["city", "2024-01-01 12:00:00"]]', "validated": time.time() - 60})
+    monkeypatch.setattr(ChatDB_query, "mysql_table_versions", lambda connection, query: None)
+
+    assert ChatDB_query.library_queries("sample", connection=object()) == [query]
+    assert validated == [query]
+
+
+class StatisticsCursor:
+    """Serves a day-old UPDATE_TIME, as MySQL 8 does, unless the session turned the cache off."""
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql, params=None):
+        if "information_schema_stats_expiry" in sql:
+            self.connection.live = True
+
+    def fetchall(self):
+        return [("city", self.connection.written if self.connection.live else self.connection.stale, 0)]
+
+    def close(self):
+        pass
+
+
+class StatisticsConnection:
+    def __init__(self, stale, written):
+        self.stale, self.written, self.live = stale, written, False
+
+    def cursor(self):
+        return StatisticsCursor(self)
+
+
+def test_write_hidden_by_cached_statistics_is_revalidated(monkeypatch, tmp_path):
+    stale = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    query = {"query": "SELECT * FROM city"}
+    validated = library_with_entry(monkeypatch, tmp_path, {
+        "query": query, "versions": json_util.dumps((("city", str(stale)),)), "validated": time.time() - 60})
+    monkeypatch.setattr(ChatDB_query, "get_mysql_catalog", lambda connection: {"tables": {"city": {}}})
+    connection = StatisticsConnection(stale, datetime.datetime(2024, 1, 2, 12, 0, 0))
+
+    assert ChatDB_query.library_queries("sample", connection=connection) == [query]
+    assert validated == [query]
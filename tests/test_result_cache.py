@@ -0,0 +1,113 @@
+import datetime
+
+import mysql.connector
+import pytest
+
+import ChatDB_query
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql, params=None):
+        self.connection.statements.append(sql)
+        if "information_schema_stats_expiry" in sql:
+            if self.connection.stats_expiry_error:
+                raise mysql.connector.Error("Unknown system variable 'information_schema_stats_expiry'")
+            self.connection.live_statistics = True
+
+    def fetchall(self):
+        # Like MySQL 8, serve cached statistics unless the session turned the cache off
+        if self.connection.live_statistics or self.connection.cached_rows is None:
+            return self.connection.table_rows
+        return self.connection.cached_rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, table_rows, cached_rows=None, stats_expiry_error=False):
+        self.table_rows = table_rows
+        self.cached_rows = cached_rows
+        self.stats_expiry_error = stats_expiry_error
+        self.live_statistics = False
+        self.statements = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+@pytest.fixture(autouse=True)
+def catalog(monkeypatch):
+    monkeypatch.setattr(ChatDB_query, "get_mysql_catalog", lambda connection: {"tables": {"city": {}, "country": {}}})
+
+
+def test_update_times_are_the_version():
+    written = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    connection = FakeConnection([("city", written, 0), ("country", written, 0)])
+    versions = ChatDB_query.mysql_table_versions(connection, "SELECT * FROM city JOIN country")
+    assert versions == (("city", str(written)), ("country", str(written)))
+
+
+def test_unknown_update_time_is_not_cached_and_not_checksummed():
+    connection = FakeConnection([("city", None, None)])
+    assert ChatDB_query.mysql_table_versions(connection, "SELECT * FROM city") is None
+    assert not any("CHECKSUM" in sql for sql in connection.statements)
+
+
+def test_recently_written_table_is_not_cached():
+    connection = FakeConnection([("city", datetime.datetime.now(), 1)])
+    assert ChatDB_query.mysql_table_versions(connection, "SELECT * FROM city") is None
+
+
+def test_nondeterministic_query_is_not_cached():
+    connection = FakeConnection([])
+    assert ChatDB_query.mysql_table_versions(connection, "SELECT NOW() FROM city") is None
+    assert connection.statements == []
+
+
+def test_update_time_is_read_live_not_from_the_statistics_cache():
+    stale = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    written = datetime.datetime(2024, 1, 2, 12, 0, 0)
+    connection = FakeConnection([("city", written, 0)], cached_rows=[("city", stale, 0)])
+    assert ChatDB_query.mysql_table_versions(connection, "SELECT * FROM city") == (("city", str(written)),)
+
+
+def test_servers_without_statistics_expiry_still_get_versions():
+    written = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    connection = FakeConnection([("city", written, 0)], stats_expiry_error=True)
+    assert ChatDB_query.mysql_table_versions(connection, "SELECT * FROM city") == (("city", str(written)),)
+
+
+class FakeAdmin:
+    def __init__(self, status):
+        self.status = status
+
+    def command(self, name, **options):
+        if isinstance(self.status, Exception):
+            raise self.status
+        return self.status
+
+
+class FakeDatabase:
+    def __init__(self, status):
+        self.client = type("FakeClient", (), {"admin": FakeAdmin(status)})()
+
+
+def server_status(updates, process="mongod"):
+    return {"host": "db:27017", "pid": 42, "process": process,
+            "opcounters": {"insert": 10, "update": updates, "delete": 0},
+            "opcountersRepl": {"insert": 0, "update": 0, "delete": 0}}
+
+
+def test_same_size_update_changes_the_mongodb_write_counter():
+    before = ChatDB_query.mongodb_write_counter(FakeDatabase(server_status(5)))
+    after = ChatDB_query.mongodb_write_counter(FakeDatabase(server_status(6)))
+    assert before is not None and before != after
+
+
+def test_mongodb_write_counter_is_unknown_through_mongos_or_without_access():
+    assert ChatDB_query.mongodb_write_counter(FakeDatabase(server_status(5, process="mongos"))) is None
+    assert ChatDB_query.mongodb_write_counter(FakeDatabase(Exception("not authorized"))) is None
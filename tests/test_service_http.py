@@ -0,0 +1,71 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import ChatDB_query
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = b""
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def serve(request):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(request)
+        reader.feed_eof()
+        writer = FakeWriter()
+        context = ChatDB_query.create_service_context(workers=1)
+        try:
+            await ChatDB_query.handle_service_connection(context, reader, writer)
+        finally:
+            context["executor"].shutdown()
+        return writer
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("length", ["abc", "-5", "1e3"])
+def test_invalid_content_length_gets_a_json_error(length):
+    writer = serve(f"POST /translate HTTP/1.1\r\nContent-Length: {length}\r\n\r\n{{}}".encode("latin-1"))
+    head, _, body = writer.data.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 400 ")
+    assert b"Connection: close" in head
+    assert "Content-Length" in json.loads(body)["error"]
+    assert writer.closed
+
+
+def test_wordnet_is_loaded_before_the_tools_are_shared(monkeypatch):
+    events = []
+
+    class FakeLemmatizer:
+        def lemmatize(self, word):
+            events.append(("lemmatize", word))
+            return word
+
+    class FakeStopwords:
+        @staticmethod
+        def words(language):
+            events.append(("stopwords", language))
+            return ["the"]
+
+    monkeypatch.setattr(ChatDB_query, "WordNetLemmatizer", FakeLemmatizer)
+    monkeypatch.setattr(ChatDB_query, "stopwords", FakeStopwords)
+    monkeypatch.setattr(ChatDB_query, "_nltk_tools", {})
+    monkeypatch.setattr(ChatDB_query, "_nltk_tools_lock", threading.Lock())
+
+    lemmatizer, stop_words = ChatDB_query.get_nltk_tools()
+    assert events == [("lemmatize", "warmup"), ("stopwords", "english")]
+    assert isinstance(lemmatizer, FakeLemmatizer) and stop_words == {"the"}
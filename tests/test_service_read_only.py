@@ -0,0 +1,88 @@
+import mysql.connector
+import pytest
+
+import ChatDB_query
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.with_rows = False
+        self.column_names = ()
+
+    def execute(self, sql):
+        self.connection.statements.append(sql)
+        if sql.startswith("EXPLAIN"):
+            raise mysql.connector.Error("EXPLAIN is not supported by the fake server")
+        if sql == "START TRANSACTION READ ONLY":
+            self.connection.read_only = True
+            return
+        if self.connection.read_only and ("DELETE" in sql or "UPDATE" in sql):
+            raise mysql.connector.errors.DatabaseError(
+                msg="Cannot execute statement in a READ ONLY transaction.", errno=1792)
+        self.with_rows = True
+        self.column_names = ("x",)
+        self.rows = [(1,)]
+
+    def fetchmany(self, size):
+        rows, self.rows = getattr(self, "rows", [])[:size], []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    database = "test"
+
+    def __init__(self):
+        self.statements = []
+        self.read_only = False
+
+    def cursor(self, buffered=None):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.statements.append("ROLLBACK")
+        self.read_only = False
+
+
+@pytest.fixture
+def context():
+    context = ChatDB_query.create_service_context(FakeConnection())
+    yield context
+    context["executor"].shutdown(wait=False)
+
+
+def execute(context, sql):
+    return ChatDB_query.service_execute(context, {"backend": "mysql", "sql": sql})
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT 1; DROP TABLE x",
+    "SELECT 1;DROP TABLE x;",
+    "SELECT * FROM city INTO OUTFILE '/tmp/city.csv'",
+    "select * from city into  dumpfile '/tmp/city.bin'",
+    "DELETE FROM city",
+])
+def test_rejects_statements_that_are_not_read_only(context, sql):
+    with pytest.raises(ValueError):
+        execute(context, sql)
+    assert context["connection"].statements == []
+
+
+def test_semicolons_and_keywords_inside_literals_are_allowed(context):
+    payload = execute(context, "SELECT 'a; DROP TABLE x' AS x, 'INTO OUTFILE' AS y;")
+    assert payload["rows"] == [{"x": 1}]
+
+
+def test_writes_inside_with_are_refused_by_the_read_only_transaction(context):
+    with pytest.raises(mysql.connector.Error):
+        execute(context, "WITH old AS (SELECT 1) DELETE FROM city")
+    statements = context["connection"].statements
+    assert statements.index("START TRANSACTION READ ONLY") < statements.index("WITH old AS (SELECT 1) DELETE FROM city")
+    assert statements[-1] == "ROLLBACK"
+
+
+def test_service_workers_leave_pool_connections_free():
+    assert ChatDB_query.SERVICE_WORKERS < ChatDB_query.CONNECTION_SETTINGS["mysql_pool_size"] - 1
@@ -0,0 +1,149 @@
+import os
+import re
+import threading
+
+import pytest
+
+import ChatDB_query
+
+SAKILA_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "DataSetsUsed", "sakila-db", "sakila-data.sql")
+
+
+class LockWaitError(Exception):
+    pass
+
+
+class FakeServer:
+    """
+    Records what every connection executes. A statement that touches a table another connection
+    holds a LOCK TABLES lock on raises LockWaitError, where a real server would block forever.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.table_locks = {}
+        self.first_ids = {}  # Table -> first value of every inserted row, in insert order
+        self.connections = []
+
+    def connect(self, name):
+        connection = FakeConnection(self, name)
+        self.connections.append(connection)
+        return connection
+
+
+class FakeConnection:
+    def __init__(self, server, name):
+        self.server = server
+        self.name = name
+        self.pool_name = "fake"
+        self.database = "sakila"
+        self.statements = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    with_rows = False
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql):
+        server = self.connection.server
+        self.connection.statements.append(sql)
+        with server.lock:
+            lock_match = re.match(r"LOCK TABLES `?(\w+)`?", sql, re.IGNORECASE)
+            if lock_match:
+                server.table_locks[lock_match.group(1)] = self.connection
+                return
+            if re.match(r"UNLOCK TABLES", sql, re.IGNORECASE):
+                for table, holder in list(server.table_locks.items()):
+                    if holder is self.connection:
+                        del server.table_locks[table]
+                return
+            insert = ChatDB_query._INSERT_PREFIX.match(sql)
+            if insert:
+                table = insert.group("table").strip("`")
+                holder = server.table_locks.get(table)
+                if holder is not None and holder is not self.connection:
+                    raise LockWaitError(f"{self.connection.name} waits for the lock on {table}")
+                values = sql[insert.end():]
+                server.first_ids.setdefault(table, []).extend(
+                    int(row) for row in re.findall(r"(?:^|\),\s*)\((\d+),", values))
+
+
+def expected_first_ids():
+    expected = {}
+    with open(SAKILA_DATA, encoding="utf-8") as file:
+        for statement in ChatDB_query.iter_sql_statements(file):
+            insert = ChatDB_query._INSERT_PREFIX.match(statement)
+            if insert:
+                expected.setdefault(insert.group("table").strip("`"), []).extend(
+                    int(row) for row in re.findall(r"(?:^|\),\s*)\((\d+),", statement[insert.end():]))
+    return expected
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+    counter = iter(range(1, 100))
+    monkeypatch.setattr(ChatDB_query, "borrow_mysql_connection",
+                        lambda connection, database=None: server.connect(f"inserter-{next(counter)}"))
+    return server
+
+
+def test_sakila_dump_loads_through_pipeline(server):
+    main = server.connect("main")
+    stats = ChatDB_query.run_upload_pipeline(SAKILA_DATA, connection=main, workers=2, connections=4, batch_size=50)
+
+    expected = expected_first_ids()
+    assert stats["rows"] == sum(len(ids) for ids in expected.values())
+    # Each table's rows arrive in file order, even when spread over several batches
+    assert server.first_ids == expected
+    assert not server.table_locks
+
+
+def test_lock_tables_region_runs_on_main_connection(server):
+    main = server.connect("main")
+    ChatDB_query.run_upload_pipeline(SAKILA_DATA, connection=main, workers=2, connections=4, batch_size=50)
+
+    region = main.statements[main.statements.index("LOCK TABLES `staff` WRITE"):]
+    assert region[1].startswith("INSERT INTO `staff`")
+    assert region[2] == "UNLOCK TABLES"
+
+
+def test_region_filling_whole_batches_still_ends(server, tmp_path):
+    # The region's first batch_size statements are queued before its UNLOCK TABLES is read
+    dump = tmp_path / "dump.sql"
+    dump.write_text("LOCK TABLES `staff` WRITE;\n"
+                    "INSERT INTO `staff` VALUES (1,'Mike');\n"
+                    "INSERT INTO `staff` VALUES (2,'Jon');\n"
+                    "UNLOCK TABLES;\n"
+                    + "".join(f"INSERT INTO `actor` VALUES ({row},'A');\n" for row in range(1, 10)),
+                    encoding="utf-8")
+    main = server.connect("main")
+    ChatDB_query.run_upload_pipeline(str(dump), connection=main, workers=2, connections=4, batch_size=3)
+
+    region = main.statements[main.statements.index("LOCK TABLES `staff` WRITE"):]
+    assert region[-1] == "UNLOCK TABLES"
+    assert server.first_ids["staff"] == [1, 2]
+    assert not any(statement.startswith("INSERT INTO `actor`") for statement in main.statements)
+    assert server.first_ids["actor"] == list(range(1, 10))
+    assert not server.table_locks
+
+
+def test_session_statements_reach_every_inserter(server):
+    main = server.connect("main")
+    ChatDB_query.run_upload_pipeline(SAKILA_DATA, connection=main, workers=2, connections=4, batch_size=50)
+
+    for connection in server.connections:
+        assert "SET AUTOCOMMIT=0" in connection.statements
+        assert "COMMIT" in connection.statements
+        assert any("FOREIGN_KEY_CHECKS=0" in statement for statement in connection.statements)
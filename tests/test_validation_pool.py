@@ -0,0 +1,66 @@
+import mysql.connector
+import pytest
+
+import ChatDB_query
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql):
+        self.connection.executed.append(sql)
+
+    def fetchall(self):
+        return []
+
+
+class FakeConnection:
+    database = "test"
+    pool_name = "fake"
+
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def exhausted_pool(monkeypatch):
+    def borrow(connection, database=None):
+        raise mysql.connector.errors.PoolError("Failed getting connection; pool exhausted")
+    monkeypatch.setattr(ChatDB_query, "borrow_mysql_connection", borrow)
+    monkeypatch.setattr(ChatDB_query, "validate_mysql_query", lambda cursor, query: cursor.execute(query) or True)
+
+
+def test_borrowed_connection_validates_on_itself(exhausted_pool):
+    connection = FakeConnection()
+    ChatDB_query._borrowed_connections.add(connection)
+    candidates = [{"query": f"SELECT {index}"} for index in range(4)]
+
+    assert ChatDB_query.validate_mysql_candidates(connection, candidates, 2) == candidates[:2]
+    assert connection.executed == ["SELECT 0", "SELECT 1"]
+
+
+def test_main_connection_borrows_probe_connections(exhausted_pool, capsys):
+    connection = FakeConnection()
+    candidates = [{"query": f"SELECT {index}"} for index in range(4)]
+
+    assert ChatDB_query.validate_mysql_candidates(connection, candidates, 2) == []
+    assert "pool exhausted" in capsys.readouterr().out
+    assert connection.executed == []
+
+
+def test_validation_failures_from_worker_threads_go_to_report():
+    messages = []
+
+    def validate(candidate):
+        raise RuntimeError("no such table")
+
+    candidates = [{"query": f"SELECT {index}"} for index in range(4)]
+    assert ChatDB_query.validate_candidates_concurrently(candidates, validate, 2, workers=4, report=messages.append) == []
+    assert len(messages) == 4 and all("no such table" in message for message in messages)
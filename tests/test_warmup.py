@@ -0,0 +1,50 @@
+import ChatDB_query
+
+
+class FakeConnection:
+    database = "test"
+    pool_name = "fake"
+
+    def close(self):
+        pass
+
+
+def test_mysql_warmup_uses_one_connection_and_keeps_messages_in_its_log(monkeypatch, capsys):
+    borrowed = []
+
+    def borrow(connection, database=None):
+        borrowed.append(database)
+        return FakeConnection()
+
+    def library_queries(construct, connection=None, db_type="MySQL", report=print):
+        report(f"validated {construct}")
+        return []
+
+    monkeypatch.setattr(ChatDB_query, "borrow_mysql_connection", borrow)
+    monkeypatch.setattr(ChatDB_query, "get_mysql_catalog", lambda connection: {"tables": {"city": {}}})
+    monkeypatch.setattr(ChatDB_query, "get_join_graph", lambda connection: {})
+    monkeypatch.setattr(ChatDB_query, "get_table_statistics", lambda connection, table: {})
+    monkeypatch.setattr(ChatDB_query, "library_queries", library_queries)
+
+    state = ChatDB_query.start_warmup(connection=FakeConnection(), db_type="MySQL")
+    state["thread"].join()
+
+    assert state["stage"] == "finished"
+    assert borrowed == ["test"]
+    assert list(state["log"]) == [f"validated {construct}" for construct in ChatDB_query.WARMUP_MYSQL_CONSTRUCTS]
+    assert capsys.readouterr().out == ""
+
+
+def test_cancel_and_wait_stops_the_warmup():
+    def slow_step():
+        state["cancel"].wait(5)
+
+    prepare = lambda: ([("slow", slow_step), ("never", lambda: None)], None)
+    state = {"stage": "starting", "done": 0, "total": 0, "error": None, "seconds": None,
+             "cancel": ChatDB_query.threading.Event(), "log": [], "reported": False}
+    state["thread"] = ChatDB_query.threading.Thread(target=ChatDB_query._run_warmup, args=(state, prepare))
+    state["thread"].start()
+
+    assert ChatDB_query.cancel_warmup(state, wait=True)
+    assert state["stage"] == "cancelled" and state["done"] == 1
+    assert not ChatDB_query.cancel_warmup(state)